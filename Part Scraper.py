@@ -1,13 +1,25 @@
 import datetime
-import subprocess
 import os
 import re
 import json
 import csv
 
+import parts_store
+import sdf_discovery
+import sqlcecmd
+import workorder_db
+
 
 sheet_name = 'MicrovellumData'
 directory = "M:\Homestead_Library\Work Orders"
+# Directory mtimes from the last search for work orders
+discovery_snapshot_path = 'sdf_snapshot_parts.json'
+
+# 'json' writes workorder_<folder>.json next to each SDF, for the tools that
+# read those; 'store' instead keeps every work order in one local database at
+# store_path (see parts_store.py)
+output = 'json'
+store_path = 'part_scraper.db'
 
 
 part_keys = [
@@ -54,22 +66,36 @@ def filter_keys(data, keys):
     return {k: v for k, v in data.items() if k in keys}
 
 
-def find_sdf_files(directory, limit=None):
-    sdf_files = []
-    count = 0
+def is_work_order_sdf(root, file):
     pattern = r"(?i)\(\d+-\d+\)*.*(?!purchasing)"
-    for root, dirs, files in os.walk(directory):
-        if limit and count >= limit:
-            break
-        for file in files:
-            if file.endswith(".sdf") and file == "MicrovellumWorkOrder.sdf":
-                work_order = os.path.split(root)[-1]
-                if re.match(pattern, work_order) and "purchasing" not in root.lower():
-                    sdf_files.append(os.path.join(root, file))
-                    count += 1
+    if file == "MicrovellumWorkOrder.sdf":
+        work_order = os.path.split(root)[-1]
+        return bool(re.match(pattern, work_order)) and "purchasing" not in root.lower()
+    return False
+
+
+def find_sdf_files(directory, limit=None):
+    # Nothing under a purchasing folder is wanted, so those aren't listed at all
+    sdf_files = sdf_discovery.find_files(directory, is_work_order_sdf,
+                                         prune=lambda name, path: "purchasing" in name.lower(),
+                                         snapshot_path=discovery_snapshot_path)
+    if limit:
+        sdf_files = sdf_files[:limit]
     return sdf_files
 
 
+def json_path(file):
+    """workorder_<folder>.json next to the SDF at file"""
+    sdf_dir = os.path.dirname(file)
+    return os.path.join(sdf_dir, f'workorder_{os.path.basename(sdf_dir)}.json')
+
+
+def write_json(file, data):
+    """Write work order data to JSON file in the same directory as the .sdf"""
+    with open(json_path(file), 'w') as f:
+        json.dump(data, f, indent=4)
+
+
 def extract_code_from_path(path):
     """
     Extracts the code within parentheses from the path.
@@ -82,10 +108,9 @@ def extract_code_from_path(path):
     return None
 
 
-class WorkOrder:
-    data = {}
-
-    def __init__(self, file, separator='~'):
+class WorkOrder(workorder_db.WorkOrderReader):
+    def __init__(self, file, separator=sqlcecmd.SEPARATOR):
+        self.data = {}
         p = os.path.split(file)
 
         # self.client = client
@@ -98,9 +123,6 @@ class WorkOrder:
         self.date_id = self.date_id.replace('(', '').replace(')', '') if self.date_id else None
         self.date_id = self.date_id + '-' + self.year_created if self.date_id else None
 
-        self.full_path = file
-        self.separator = separator
-
         regex = r"(\d{5})\s*(.*)"
         print(p)
         match = re.search(regex, p[0])
@@ -117,85 +139,68 @@ class WorkOrder:
         self.data['BidName'] = self.bid_name
         self.data['DateCreated'] = self.date_created
 
-        batches = self.exec("SELECT * FROM WorkOrderBatches")
-        self.batches = self.parse_results(batches, keys=['Name', 'LinkID', 'WorkOrderID'])
+        # Read from the SQLite copy SDFtoSQL made of this work order when it
+        # is up to date, otherwise query the SDF itself with SqlCeCmd40. All
+        # of the work order's queries go out together - a single SqlCeCmd40
+        # launch when reading the SDF. Sheets are fetched for every batch and
+        # narrowed to the first batch once the batches are known.
+        self.open(file, separator)
+        try:
+            results = self.query_many({
+                'batches': "SELECT * FROM WorkOrderBatches",
+                'parts': f"SELECT {(',').join(part_keys)} FROM Parts",
+                'subassemblies': "SELECT * FROM Subassemblies WHERE Name LIKE '%Drawer%'",
+                'sheets': f"SELECT {(',').join(sheet_keys)} FROM PlacedSheets",
+                # 'prompts': f"SELECT {(',').join(prompt_keys)} FROM Prompts",
+                'hardware': f"SELECT {(',').join(hardware_keys)} FROM Hardware",
+                'edgebanding': f"SELECT {(',').join(edgebanding_keys)} FROM Edgebanding",
+            })
+        finally:
+            self.close()
+
+        self.batches = [filter_keys(row, ['Name', 'LinkID', 'WorkOrderID']) for row in results['batches']]
         if self.batches:
             self.first_batch_id = self.batches[0]['LinkID']
+        results['sheets'] = [row for row in results['sheets'] if row.get('LinkIDWorkOrderBatch') == self.first_batch_id]
 
-        self.runQuery("parts", f"SELECT {(',').join(part_keys)} FROM Parts")
-        self.runQuery("subassemblies", f"SELECT * FROM Subassemblies WHERE Name LIKE '%Drawer%'")
-        self.runQuery("sheets", f"SELECT {(',').join(sheet_keys)} FROM PlacedSheets WHERE LinkIDWorkOrderBatch = '{self.first_batch_id}'")
-        # self.runQuery("prompts", f"SELECT {(',').join(prompt_keys)} FROM Prompts", filter_names=prompt_names)
-        self.runQuery("hardware", f"SELECT {(',').join(hardware_keys)} FROM Hardware")
-        self.runQuery("edgebanding", f"SELECT {(',').join(edgebanding_keys)} FROM Edgebanding")
+        for table_name in ('parts', 'subassemblies', 'sheets', 'hardware', 'edgebanding'):
+            self.tag_rows(table_name, results[table_name])
 
-    def parse_results(self, query_string, keys=None, filter_names=None):
-        rows = []
-        try:
-            query_string = query_string.decode('utf-8')
-        except Exception:
-            query_string = query_string.decode('latin-1')
-
-        data = query_string.replace('/', '_').replace('\n\n', '').splitlines()
-        headers = data[0].split(self.separator)
-        del data[:2]
-        del data[len(data) - 2:]
-
-        # Converts output to dictionary with headers as keys
-        for index, row in enumerate(data):
-            d = dict(zip(headers, data[index].split(self.separator)))
-            if keys:
-                d = filter_keys(d, keys)
-
-            if filter_names:
-                try:
-                    if d['Name'] in filter_names:
-                        rows.append(d)
-                except Exception:
-                    pass
-            else:
-                rows.append(d)
-        return rows
-
-    def exec(self, query):
-        out = subprocess.run(f'SqlCeCmd40.exe -d "Data Source={self.full_path}" -q "{query}" -W -s "{self.separator}"', capture_output=True)
-        if out.returncode:
-            raise Exception(str(out.stderr))
-        return out.stdout
-
-    def runQuery(self, table_name, query, keys=None, filter_names=None):
-        out = self.exec(query)
-        rows = self.parse_results(out, keys=keys, filter_names=filter_names)
-
-        for row in rows:
-            row['BidID'] = self.bid_id
-            row['BidName'] = self.bid_name
-            row['Date Modified'] = self.date_created
-            row['Date Processed'] = self.date_id
-
-        if table_name:
-            self.data[table_name] = rows
-
-        return rows
+    def row_tags(self):
+        return {
+            'BidID': self.bid_id,
+            'BidName': self.bid_name,
+            'Date Modified': self.date_created,
+            'Date Processed': self.date_id,
+        }
 
 
 if __name__ == "__main__":
-    all_parts = []
     sdf_files = find_sdf_files(directory)
 
     print(f"Found {len(sdf_files)} work orders...")
 
+    if output == 'store':
+        store = parts_store.PartsStore(store_path)
+        # Work orders already stored, from the store's index rather than the share
+        processed = {parts_store.store_key(path) for path in store.paths()}
+
     for file in sdf_files:
-        # Get the directory of the .sdf file
-        sdf_dir = os.path.dirname(file)
         # Check if this work order has already been processed
-        json_file = os.path.join(sdf_dir, f'workorder_{os.path.basename(sdf_dir)}.json')
-        if os.path.exists(json_file):
+        if output == 'store':
+            done = parts_store.store_key(file) in processed
+        else:
+            done = os.path.exists(json_path(file))
+        if done:
             print(f"Skipping {file} - already processed")
             continue
 
         print(f"Processing {file}...")
         wo = WorkOrder(file)
-        # Write work order data to JSON file in the same directory as the .sdf
-        with open(json_file, 'w') as f:
-            json.dump(wo.data, f, indent=4)
+        if output == 'store':
+            store.add(file, wo.data)
+        else:
+            write_json(file, wo.data)
+
+    if output == 'store':
+        store.close()
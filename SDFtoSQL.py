@@ -1,16 +1,109 @@
 import os
 import re
+import codecs
+import argparse
+import concurrent.futures
+import sys
+import time
+import tempfile
+import functools
+import hashlib
+import json
+import datetime
 import subprocess
 import logging
 import shutil
 import glob
 import sqlite3
+import collections
+
+import sdf_discovery
+from conversion_layout import OUTPUT_DIR, MANIFEST_NAME, CONVERTER_VERSION, work_order_key, sqlite_path_for, manifest_key
+
+# Optional columnar export back ends: Parquet via pyarrow, else NumPy .npz
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # === CONFIGURATION ===
 EXPORT_TOOL_PATH = r"C:\Users\JuicyJerry\Dev\Microvellum\ExportSqlCe40.exe"
 SEARCH_DIR = r"M:\Homestead_Library\Work Orders"
-OUTPUT_DIR = r"D:\My Documents\TEST\SQLFiles"
+# OUTPUT_DIR, the manifest's name and CONVERTER_VERSION are in conversion_layout,
+# which the scrapers read them from too
 TEMP_DIR = r"D:\My Documents\TEST\SQLFiles\_temp_work"
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, MANIFEST_NAME)
+DISCOVERY_SNAPSHOT_PATH = os.path.join(OUTPUT_DIR, "_sdf_snapshot.json")  # Directory mtimes from the last search
+WAREHOUSE_PATH = os.path.join(OUTPUT_DIR, "warehouse.db")
+SCHEMA_CACHE_DIR = os.path.join(OUTPUT_DIR, "_schema_cache")
+METRICS_PATH = os.path.join(OUTPUT_DIR, "_conversion_metrics.jsonl")
+COLUMNAR_DIR_NAME = "columnar"  # Per-work-order folder for the columnar table copies
+COLUMNAR_FETCH_SIZE = 10000
+
+# Columns indexed in every warehouse table that has them, on top of the
+# WorkOrderKey index each table gets
+WAREHOUSE_INDEX_COLUMNS = ('LinkID', 'LinkIDProduct', 'LinkIDMaterial', 'MaterialName', 'Name')
+
+SQL_CHUNK_SIZE = 1024 * 1024  # Characters decoded per read while streaming SQL dumps
+
+# Characters that change the statement splitter's state: quotes, bracketed
+# identifiers, statement terminators, comments and GO batch separators
+_SQL_SPECIAL = re.compile(r"['\[\";]|--|^[ \t]*GO[ \t]*(?=\r?$)", re.MULTILINE | re.IGNORECASE)
+
+INSERT_BATCH_SIZE = 5000  # Rows buffered per table before an executemany call
+
+# Settings for bulk-load mode. The database is a throwaway artifact that can
+# always be rebuilt from its SDF, so durability is traded for load speed.
+BULK_PAGE_SIZE = 16384
+BULK_LOAD_PRAGMAS = (
+    f"PRAGMA page_size = {BULK_PAGE_SIZE}",  # Must come before the first table is created
+    # Kept in memory rather than off, so a failed batch can still be rolled
+    # back to its savepoint; pages added to a new file aren't journaled anyway
+    "PRAGMA journal_mode = MEMORY",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA cache_size = -262144",    # 256 MB
+    "PRAGMA temp_store = MEMORY",
+)
+
+# SQL Server CE column types and the SQLite type they are stored as
+SQLITE_TYPES = {
+    'nvarchar': 'TEXT', 'varchar': 'TEXT', 'nchar': 'TEXT', 'char': 'TEXT', 'ntext': 'TEXT',
+    'text': 'TEXT', 'uniqueidentifier': 'TEXT', 'datetime': 'TEXT', 'xml': 'TEXT',
+    'int': 'INTEGER', 'bigint': 'INTEGER', 'smallint': 'INTEGER', 'tinyint': 'INTEGER',
+    'bit': 'INTEGER',
+    'decimal': 'REAL', 'numeric': 'REAL', 'money': 'REAL', 'float': 'REAL', 'real': 'REAL',
+    'image': 'BLOB', 'varbinary': 'BLOB', 'binary': 'BLOB', 'rowversion': 'BLOB',
+    'timestamp': 'BLOB',
+}
+
+# A quoted column name followed by its type, e.g. "Width" decimal(18,4)
+_COLUMN_TYPE = re.compile(r'("[^"]+"\s+)(\w+)(\s*\(\s*\w+\s*(?:,\s*\d+\s*)?\))?')
+
+_INSERT_HEAD = re.compile(
+    r'INSERT\s+INTO\s+(?:\[\w+\]\.)?[\["]?([^\]"(\s]+)[\]"]?\s*(?:\(([^)]*)\)\s*)?VALUES\s*\(',
+    re.IGNORECASE
+)
+
+# One value of a VALUES tuple plus the ',' or ')' that follows it
+_SQL_VALUE = re.compile(
+    r"\s*(?:N?'([^']*(?:''[^']*)*)'"    # String literal
+    r"|\{ts\s*'([^']*)'\}"              # ODBC timestamp literal
+    r"|0x([0-9A-Fa-f]*)"                # Binary (IMAGE) literal
+    r"|(NULL)"
+    r"|([^\s,()']+))"                   # Numbers and other bare literals
+    r"\s*([,)])",
+    re.IGNORECASE
+)
+
+_CREATE_TABLE_NAME = re.compile(r'CREATE\s+TABLE\s+"?([^"\s(]+)', re.IGNORECASE)
+
+_BOOLEANS = {'TRUE': 1, 'FALSE': 0}
 
 # Set up logging
 logging.basicConfig(
@@ -29,381 +122,586 @@ def ensure_dir(directory):
     os.makedirs(directory, exist_ok=True)
 
 
-def clean_temp_dir():
-    """Clean up temporary directory"""
-    if os.path.exists(TEMP_DIR):
-        for file in glob.glob(os.path.join(TEMP_DIR, "*")):
-            try:
-                if os.path.isfile(file):
-                    os.remove(file)
-            except Exception as e:
-                logging.warning(f"Failed to remove temp file {file}: {e}")
+def make_temp_workspace():
+    """Create a private working directory under TEMP_DIR for one conversion"""
+    ensure_dir(TEMP_DIR)
+    return tempfile.mkdtemp(prefix='sdf_', dir=TEMP_DIR)
 
 
-def fix_sql_value(value):
-    """Fix SQL Server CE values to be compatible with SQLite"""
-    # Handle NULL values
-    if value.upper() == 'NULL':
-        return 'NULL'
+def clean_temp_workspace(work_dir):
+    """Remove a working directory created by make_temp_workspace"""
+    try:
+        shutil.rmtree(work_dir)
+    except OSError as e:
+        logging.warning(f"Failed to remove temp workspace {work_dir}: {e}")
+
+
+def detect_sql_encoding(sql_file):
+    """Guess the text encoding of an exported SQL file from its first bytes"""
+    with open(sql_file, 'rb') as f:
+        head = f.read(4096)
+
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+
+    # ExportSqlCe writes UTF-16 without a BOM in some versions - mostly-ASCII
+    # text then shows up as a NUL byte in every other position
+    if head and head[1::2].count(0) > len(head) // 4:
+        return 'utf-16-le'
+    if head and head[0::2].count(0) > len(head) // 4:
+        return 'utf-16-be'
+    return 'utf-8'
+
+
+def _strip_sql_comments(statement):
+    """Trim whitespace and leading '--' comment lines from a statement"""
+    statement = statement.strip()
+    while statement.startswith('--'):
+        statement = statement.partition('\n')[2].lstrip()
+    return statement
+
+
+def iter_sql_statements(sql_file, chunk_size=SQL_CHUNK_SIZE):
+    """Yield the statements of a SQL script one at a time.
+
+    The file is decoded incrementally and scanned chunk by chunk, so only the
+    statement currently being read is held in memory. Statements end at a ';'
+    or a 'GO' line that is outside of string literals, quoted identifiers and
+    comments.
+    """
+    encoding = detect_sql_encoding(sql_file)
+
+    with open(sql_file, 'r', encoding=encoding, errors='replace', newline='') as f:
+        text = ''
+        start = 0      # Start of the current statement in text
+        pos = 0        # Where scanning resumes
+        closing = None  # Closing character while inside a quoted token
+        eof = False
+
+        while not eof:
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            text = text[start:] + chunk
+            pos -= start
+            start = 0
+
+            while True:
+                if closing:
+                    # A doubled '' escape just reads as two adjacent literals,
+                    # which splits the same way, so no lookahead is needed
+                    end = text.find(closing, pos)
+                    if end == -1:
+                        pos = len(text)
+                        break
+                    pos = end + 1
+                    closing = None
+                    continue
 
-    # Handle numeric values (don't quote them)
-    if re.match(r'^-?\d+(\.\d+)?$', value):
+                match = _SQL_SPECIAL.search(text, pos)
+                if match is None:
+                    # Leave the last line unscanned in case a '--' or 'GO'
+                    # is split across chunks
+                    newline = text.rfind('\n', pos)
+                    pos = newline if newline != -1 else max(pos, len(text) - 1)
+                    break
+
+                token = match.group()
+                if token == "'" or token == '"':
+                    closing = token
+                    pos = match.end()
+                elif token == '[':
+                    closing = ']'
+                    pos = match.end()
+                elif token == '--':
+                    newline = text.find('\n', match.end())
+                    if newline == -1 and not eof:
+                        pos = match.start()
+                        break
+                    pos = len(text) if newline == -1 else newline
+                else:
+                    # ';' or a GO batch separator ends the statement
+                    if token != ';' and text.find('\n', match.end()) == -1 and not eof:
+                        pos = match.start()
+                        break
+                    statement = _strip_sql_comments(text[start:match.start()])
+                    if statement:
+                        yield statement
+                    start = pos = match.end()
+
+        statement = _strip_sql_comments(text[start:])
+        if statement:
+            yield statement
+
+
+@functools.lru_cache(maxsize=256)
+def translate_create_table(statement):
+    """Rewrite a SQL Server CE CREATE TABLE statement for SQLite"""
+    # Convert [dbo].[TableName] to "TableName"
+    statement = re.sub(r'\[\w+\]\.\[(\w+)\]', r'"\1"', statement)
+
+    # Replace other bracketed identifiers
+    statement = re.sub(r'\[([^\]]+)\]', r'"\1"', statement)
+
+    # Remove IDENTITY specifications
+    statement = re.sub(r'IDENTITY\(\d+,\s*\d+\)', '', statement)
+
+    # Change data types
+    return _COLUMN_TYPE.sub(_sqlite_column_type, statement)
+
+
+def _sqlite_column_type(match):
+    sqlite_type = SQLITE_TYPES.get(match.group(2).lower())
+    if sqlite_type is None:
+        return match.group(0)
+    return match.group(1) + sqlite_type
+
+
+def column_affinity(declared_type):
+    """Return the SQLite type affinity of a declared column type"""
+    declared_type = (declared_type or '').upper()
+    if 'INT' in declared_type:
+        return 'INTEGER'
+    if 'CHAR' in declared_type or 'CLOB' in declared_type or 'TEXT' in declared_type:
+        return 'TEXT'
+    if 'BLOB' in declared_type or not declared_type:
+        return 'BLOB'
+    if 'REAL' in declared_type or 'FLOA' in declared_type or 'DOUB' in declared_type:
+        return 'REAL'
+    return 'NUMERIC'
+
+
+def _to_integer(value):
+    if not isinstance(value, str):
         return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        number = float(value)
+    except ValueError:
+        return _BOOLEANS.get(value.upper(), value)
+    return int(number) if number.is_integer() else number
 
-    # Handle bit/boolean values
-    if value in ('0', '1'):
-        return value
 
-    # Handle datetime values - keep them as strings but ensure proper quoting
-    if re.match(r"N?'[\d\-\s:/]+'", value):
-        # Remove N prefix for national character string literals
-        value = re.sub(r"^N'(.+)'$", r"'\1'", value)
+def _to_real(value):
+    if not isinstance(value, str):
         return value
-
-    # Handle string values - ensure proper quoting
-    if value.startswith("'") and value.endswith("'"):
-        # Already quoted, but escape any internal single quotes
-        inner_value = value[1:-1].replace("'", "''")
-        return f"'{inner_value}'"
-
-    # For unquoted values, add quotes and escape
-    escaped_value = value.replace("'", "''")
-    return f"'{escaped_value}'"
-
-
-def process_insert_statement(statement, cursor):
-    """Process a single INSERT statement with better handling of values"""
     try:
-        # First, let's log a sample of the original statement for debugging
-        logging.debug(f"Processing INSERT: {statement[:200]}...")
-
-        # Clean up the statement - remove line breaks and extra spaces
-        statement = re.sub(r'\s+', ' ', statement).strip()
+        return float(value)
+    except ValueError:
+        return _BOOLEANS.get(value.upper(), value)
+
+
+# TEXT and BLOB values are bound as scanned, so they need no converter
+COLUMN_CONVERTERS = {
+    'INTEGER': _to_integer,
+    'REAL': _to_real,
+    'NUMERIC': _to_integer,
+}
+
+
+def parse_sql_values(text, pos=0):
+    """Scan a VALUES tuple starting at pos (just past its opening parenthesis).
+
+    Returns a list with None for NULL, bytes for 0x literals and str for
+    everything else (string literals unescaped, bare literals as written).
+    """
+    values = []
+    match_value = _SQL_VALUE.match
+    while True:
+        match = match_value(text, pos)
+        if match is None:
+            raise ValueError(f"Could not parse value at: {text[pos:pos + 50]}...")
+
+        string, timestamp, binary, null, literal, separator = match.groups()
+        if string is not None:
+            values.append(string.replace("''", "'") if "''" in string else string)
+        elif literal is not None:
+            values.append(literal)
+        elif binary is not None:
+            values.append(bytes.fromhex(binary if len(binary) % 2 == 0 else '0' + binary))
+        elif timestamp is not None:
+            values.append(timestamp)
+        else:
+            values.append(None)
+
+        pos = match.end()
+        if separator == ')':
+            return values
+
+
+class InsertEngine:
+    """Load INSERT statements through batched, parameterized executemany calls.
+
+    Each table's columns are read once after its CREATE TABLE runs, and every
+    distinct column list gets a prepared INSERT plus the converters for its
+    non-text columns. Rows are buffered per plan and flushed in batches.
+    """
+
+    def __init__(self, cursor, batch_size=INSERT_BATCH_SIZE):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.tables = {}    # Table name -> {column name: affinity}
+        self.columns = {}   # Table name -> column names in table order
+        self.plans = {}     # (table, column list) -> (sql, column count, converters) or None
+        self.batches = {}   # (table, column list) -> pending rows
+        self.rows_inserted = 0
+        self.failed = 0
+        self.table_rows = {}
+        self.table_chars = {}    # Characters (not bytes) of decoded SQL read per table
+        self.table_seconds = {}  # Time spent parsing and inserting per table
+
+    def add_table(self, table_name):
+        """Record the columns and type affinities of a newly created table"""
+        columns = self.cursor.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+        self.set_table(table_name, [(column[1], column[2]) for column in columns])
+
+    def set_table(self, table_name, columns):
+        """Record a table's (name, declared type) columns without querying the database"""
+        self.tables[table_name] = {name: column_affinity(decl_type) for name, decl_type in columns}
+        self.columns[table_name] = [name for name, _ in columns]
+        logging.debug(f"Table '{table_name}' has {len(columns)} columns: {', '.join(self.columns[table_name])}")
+
+    def _plan(self, table_name, column_list):
+        affinities = self.tables.get(table_name)
+        if affinities is None:
+            logging.debug(f"Table '{table_name}' not found in schema, skipping")
+            return None
+
+        if column_list:
+            columns = [column.strip().strip('[]"') for column in column_list.split(',')]
+        else:
+            columns = self.columns[table_name]
+
+        unknown = [column for column in columns if column not in affinities]
+        if unknown:
+            logging.debug(f"Table '{table_name}' has no column(s) {', '.join(unknown)}, skipping")
+            return None
+
+        quoted = ', '.join(f'"{column}"' for column in columns)
+        placeholders = ', '.join('?' * len(columns))
+        sql = f'INSERT INTO "{table_name}" ({quoted}) VALUES ({placeholders})'
+        converters = [
+            (index, COLUMN_CONVERTERS[affinities[column]])
+            for index, column in enumerate(columns)
+            if affinities[column] in COLUMN_CONVERTERS
+        ]
+        return sql, len(columns), converters
+
+    def add(self, statement):
+        """Queue the row of an INSERT statement. Returns False if it was rejected."""
+        started = time.perf_counter()
+        head = _INSERT_HEAD.match(statement)
+        if not head:
+            logging.debug(f"Couldn't parse INSERT: {statement[:100]}...")
+            self.failed += 1
+            return False
 
-        # Extract table name
-        table_match = re.search(r'INSERT\s+INTO\s+(?:\[\w+\]\.)?\[([^\]]+)\]', statement, re.IGNORECASE)
-        if not table_match:
-            return False, f"Could not identify table name: {statement[:100]}..."
+        key = (head.group(1), head.group(2))
+        if key in self.plans:
+            plan = self.plans[key]
+        else:
+            plan = self.plans[key] = self._plan(*key)
+        if plan is None:
+            self.failed += 1
+            return False
 
-        table_name = table_match.group(1).strip()
+        try:
+            row = parse_sql_values(statement, head.end())
+        except ValueError as e:
+            logging.debug(f"{e}\nStatement: {statement[:100]}...")
+            self.failed += 1
+            return False
 
-        # Extract columns part
-        columns_match = re.search(r'INSERT\s+INTO\s+(?:\[\w+\]\.)?\[[^\]]+\]\s*\(([^)]+)\)', statement, re.IGNORECASE)
-        if not columns_match:
-            # Try to handle INSERT without column specifications
-            if 'VALUES' in statement.upper():
-                columns = '*'  # All columns
-            else:
-                return False, f"Could not parse columns and no VALUES keyword found: {statement[:100]}..."
-        else:
-            columns = columns_match.group(1).strip()
-
-        # Extract VALUES part - more flexible approach
-        values_match = re.search(r'VALUES\s*\((.*)\)', statement, re.IGNORECASE | re.DOTALL)
-        if not values_match:
-            return False, f"Could not find VALUES part: {statement[:100]}..."
-
-        values_text = values_match.group(1).strip()
-
-        # For debugging
-        logging.debug(f"Extracted - Table: {table_name}, Columns: {columns}, Values: {values_text[:50]}...")
-
-        # Clean up column names - replace [Name] with "Name"
-        if columns != '*':
-            columns = re.sub(r'\[([^\]]+)\]', r'"\1"', columns)
-
-        # We need to parse the values respecting quoted strings and nested levels
-        values = []
-        current_value = ""
-        in_string = False
-        quote_char = None  # Track what kind of quote we're in
-        bracket_level = 0
-
-        i = 0
-        while i < len(values_text):
-            char = values_text[i]
-
-            # Handle quotes
-            if char in ("'", '"') and (i == 0 or values_text[i-1] != '\\'):
-                if not in_string:
-                    # Starting a string
-                    in_string = True
-                    quote_char = char
-                    current_value += char
-                elif char == quote_char:
-                    # Check for escaped quotes (double quotes)
-                    if i + 1 < len(values_text) and values_text[i + 1] == char:
-                        # This is an escaped quote, not the end of the string
-                        current_value += char * 2
-                        i += 1  # Skip the next quote
-                    else:
-                        # End of string
-                        current_value += char
-                        in_string = False
-                else:
-                    # Different quote character inside a string
-                    current_value += char
-
-            # Handle N prefix for strings (N'string')
-            elif char == 'N' and i + 1 < len(values_text) and values_text[i + 1] in ("'", '"') and not in_string:
-                current_value += 'N'  # Include the N prefix
-
-            # Handle brackets and parentheses
-            elif char == '(' and not in_string:
-                bracket_level += 1
-                current_value += char
-            elif char == ')' and not in_string:
-                bracket_level -= 1
-                current_value += char
-
-            # Handle value separators
-            elif char == ',' and not in_string and bracket_level == 0:
-                values.append(current_value.strip())
-                current_value = ""
-
-            # Handle normal characters
-            else:
-                current_value += char
+        _, column_count, converters = plan
+        if len(row) != column_count:
+            logging.debug(f"Expected {column_count} values, got {len(row)}: {statement[:100]}...")
+            self.failed += 1
+            return False
 
-            i += 1
+        for index, converter in converters:
+            row[index] = converter(row[index])
 
-        # Add the last value if there's anything left
-        if current_value:
-            values.append(current_value.strip())
+        batch = self.batches.setdefault(key, [])
+        batch.append(row)
 
-        # Fix each value for SQLite compatibility
-        fixed_values = [fix_sql_value(val) for val in values]
+        table_name = key[0]
+        self.table_chars[table_name] = self.table_chars.get(table_name, 0) + len(statement)
+        self.table_seconds[table_name] = self.table_seconds.get(table_name, 0.0) + time.perf_counter() - started
 
-        # For debugging - show how many values we extracted
-        logging.debug(f"Extracted {len(values)} values")
+        if len(batch) >= self.batch_size:
+            self._flush(key)
+        return True
 
-        # Construct the final INSERT statement
-        if columns == '*':
-            insert_stmt = f'INSERT INTO "{table_name}" VALUES ({",".join(fixed_values)})'
-        else:
-            insert_stmt = f'INSERT INTO "{table_name}" ({columns}) VALUES ({",".join(fixed_values)})'
+    def _flush(self, key):
+        rows = self.batches.pop(key, None)
+        if not rows:
+            return
 
-        # Execute the statement
+        started = time.perf_counter()
+        sql = self.plans[key][0]
+        self.cursor.execute("SAVEPOINT batch")
         try:
-            cursor.execute(insert_stmt)
-            return True, None
+            self.cursor.executemany(sql, rows)
+            inserted = len(rows)
         except sqlite3.Error as e:
-            # Try to diagnose the issue better
-            error_msg = str(e)
-            logging.debug(f"SQL Error: {error_msg}")
-            logging.debug(f"Problem statement: {insert_stmt[:200]}...")
+            # Undo the rows inserted ahead of the bad one, then retry row by
+            # row so one bad row doesn't cost the whole batch
+            logging.debug(f"Batch insert into '{key[0]}' failed ({e}), retrying rows individually")
+            self.cursor.execute("ROLLBACK TO batch")
+            inserted = 0
+            for row in rows:
+                try:
+                    self.cursor.execute(sql, row)
+                    inserted += 1
+                except sqlite3.Error as e:
+                    logging.debug(f"SQLite error inserting into '{key[0]}': {e}")
+                    self.failed += 1
+        self.cursor.execute("RELEASE batch")
 
-            # If error indicates wrong number of values, log the details
-            if "1 values for" in error_msg or "values for" in error_msg:
-                logging.debug(f"Column count: {columns.count(',') + 1}, Value count: {len(fixed_values)}")
+        self.rows_inserted += inserted
+        self.table_rows[key[0]] = self.table_rows.get(key[0], 0) + inserted
+        self.table_seconds[key[0]] = self.table_seconds.get(key[0], 0.0) + time.perf_counter() - started
 
-            return False, f"SQLite error: {e}\nStatement: {insert_stmt[:100]}..."
+    def flush(self):
+        """Write out every pending batch"""
+        for key in list(self.batches):
+            self._flush(key)
 
-    except Exception as e:
-        import traceback
-        logging.debug(f"Error parsing INSERT: {e}\n{traceback.format_exc()}")
-        return False, f"Error: {e}\nStatement: {statement[:100]}..."
 
+def read_schema(sql_files):
+    """Collect the CREATE TABLE statements that precede the first INSERT"""
+    statements = []
+    for sql_file in sorted(sql_files):
+        for statement in iter_sql_statements(sql_file):
+            keyword = statement[:12].upper()
+            if keyword.startswith('CREATE TABLE'):
+                statements.append(statement)
+            elif keyword.startswith('INSERT INTO'):
+                return statements
+    return statements
+
+
+def schema_fingerprint(statements, page_size=None):
+    """Hash a schema together with the settings its template is built with"""
+    digest = hashlib.sha1(f"{CONVERTER_VERSION}:{page_size}".encode())
+    for statement in statements:
+        digest.update(statement.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def build_schema_template(statements, template_path, columns_path, page_size=None):
+    """Create an empty database holding the translated schema.
+
+    The template and its column metadata are written under temporary names
+    and renamed into place, so concurrent conversions never see a partial
+    template. Returns {table: [(column, declared type), ...]}.
+    """
+    cache_dir = os.path.dirname(template_path)
+    ensure_dir(cache_dir)
+    fd, temp_path = tempfile.mkstemp(suffix='.db', dir=cache_dir)
+    os.close(fd)
+
+    tables = {}
+    conn = sqlite3.connect(temp_path)
+    try:
+        if page_size:
+            conn.execute(f"PRAGMA page_size = {page_size}")
+        for statement in statements:
+            statement = translate_create_table(statement)
+            try:
+                conn.execute(statement)
+            except sqlite3.Error as e:
+                logging.warning(f"Error creating table: {e}\nStatement: {statement[:150]}...")
+                continue
+            table_name = _CREATE_TABLE_NAME.match(statement)
+            if table_name:
+                table_name = table_name.group(1)
+                tables[table_name] = [
+                    (column[1], column[2]) for column in conn.execute(f'PRAGMA table_info("{table_name}")')
+                ]
+        conn.commit()
+    finally:
+        conn.close()
 
-def sql_to_sqlite(sql_files, sqlite_path):
-    """Convert SQL files to a single SQLite database"""
-    logging.info(f"Creating SQLite database: {sqlite_path}")
+    temp_columns = temp_path + '.json'
+    with open(temp_columns, 'w', encoding='utf-8') as f:
+        json.dump(tables, f)
+    _publish_cache_file(temp_columns, columns_path)
+    _publish_cache_file(temp_path, template_path)
+    logging.info(f"Cached schema template {template_path} ({len(tables)} tables)")
+    return tables
 
-    # Remove existing database if it exists
-    if os.path.exists(sqlite_path):
-        os.remove(sqlite_path)
 
-    # Connect to SQLite database
-    conn = sqlite3.connect(sqlite_path)
-    cursor = conn.cursor()
+def _publish_cache_file(temp_path, path):
+    """Rename a finished cache file into place, unless another worker got there first"""
+    try:
+        os.replace(temp_path, path)
+    except PermissionError:
+        # Windows won't replace a file another worker has open (copying a
+        # template, say); the same fingerprint means it holds the same thing
+        if not os.path.exists(path):
+            raise
+        os.remove(temp_path)
 
-    # Track overall statistics
-    tables_created = 0
-    rows_inserted = 0
 
-    # First pass: Create all tables (schema)
-    logging.info("First pass: Creating database schema...")
-    for sql_file in sorted(sql_files):
-        try:
-            # Read file content with binary mode first to handle null bytes properly
-            with open(sql_file, 'rb') as f:
-                binary_content = f.read()
+_schema_templates = {}  # Fingerprint -> (template path, tables), per process
 
-            # Remove null bytes and decode
-            sql_content = binary_content.replace(b'\x00', b'').decode('utf-8', errors='ignore')
 
-            # Extract and execute CREATE TABLE statements
-            create_statements = re.findall(r'CREATE TABLE\s+[^;]+;', sql_content, re.IGNORECASE | re.DOTALL)
+def schema_template(statements, cache_dir, page_size=None):
+    """Return (template path, tables) for a schema, building the template on first use"""
+    fingerprint = schema_fingerprint(statements, page_size)
+    cached = _schema_templates.get(fingerprint)
+    if cached and os.path.exists(cached[0]):
+        return cached
 
-            for statement in create_statements:
-                try:
-                    # Fix SQL Server CE specific syntax
-                    # Convert [dbo].[TableName] to "TableName"
-                    statement = re.sub(r'\[\w+\]\.\[(\w+)\]', r'"\1"', statement)
+    template_path = os.path.join(cache_dir, f"{fingerprint}.db")
+    columns_path = os.path.join(cache_dir, f"{fingerprint}.json")
+    tables = None
+    if os.path.exists(template_path):
+        try:
+            with open(columns_path, 'r', encoding='utf-8') as f:
+                tables = {table: [tuple(column) for column in columns] for table, columns in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Rebuilding schema template {template_path}: {e}")
 
-                    # Replace other bracketed identifiers
-                    statement = re.sub(r'\[([^\]]+)\]', r'"\1"', statement)
+    if tables is None:
+        tables = build_schema_template(statements, template_path, columns_path, page_size)
 
-                    # Remove IDENTITY specifications
-                    statement = re.sub(r'IDENTITY\(\d+,\s*\d+\)', '', statement)
+    _schema_templates[fingerprint] = (template_path, tables)
+    return template_path, tables
 
-                    # Change data types
-                    statement = re.sub(r'NVARCHAR\(\d+\)', 'TEXT', statement)
-                    statement = re.sub(r'VARCHAR\(\d+\)', 'TEXT', statement)
-                    statement = re.sub(r'DATETIME', 'TEXT', statement)
-                    statement = re.sub(r'DECIMAL\(\d+,\s*\d+\)', 'REAL', statement)
-                    statement = re.sub(r'MONEY', 'REAL', statement)
-                    statement = re.sub(r'BIT', 'INTEGER', statement)
-                    statement = re.sub(r'IMAGE', 'BLOB', statement)
 
-                    cursor.execute(statement)
-                    tables_created += 1
+def sql_to_sqlite(sql_files, sqlite_path, bulk=False, vacuum=False, schema_cache_dir=None, metrics=None):
+    """Convert SQL files to a single SQLite database
 
-                except sqlite3.Error as e:
-                    logging.warning(f"Error creating table: {e}\nStatement: {statement[:150]}...")
+    The database is built next to sqlite_path and only moved into place once
+    every SQL file has loaded, so a crash mid-load leaves just the partial
+    build file behind, never a half-written sqlite_path. If a file fails to
+    load, sqlite_path is left as it was and False is returned.
 
-        except Exception as e:
-            logging.error(f"Error processing schema in {os.path.basename(sql_file)}: {e}")
+    With bulk=True it is built with an in-memory journal and fsync off, a
+    large page cache and an exclusive lock, all in one transaction, then
+    ANALYZEd before the move (or written out with VACUUM INTO when
+    vacuum=True).
 
-    # Diagnostic: Analyze the SQL file structure directly
-    logging.info(f"Schema created successfully. Created {tables_created} tables.")
-    logging.info("Analyzing INSERT statements format in SQL files...")
+    With schema_cache_dir, the schema is fingerprinted and the database
+    starts as a copy of a cached, empty template for that schema, so the
+    DDL translation and table introspection only happen once per schema.
 
-    # Before second pass, let's analyze some representative statements
-    for sql_file in sorted(sql_files):
-        with open(sql_file, 'rb') as f:
-            binary_content = f.read()
-            sql_content = binary_content.replace(b'\x00', b'').decode('utf-8', errors='ignore')
-
-        # Find a few sample INSERT statements for debugging
-        inserts = []
-        for match in re.finditer(r'INSERT\s+INTO.*?;', sql_content, re.IGNORECASE | re.DOTALL):
-            inserts.append(match.group(0))
-            if len(inserts) >= 3:  # Just get a few examples
-                break
-
-        # Log samples of the first few INSERT statements
-        logging.debug(f"File: {os.path.basename(sql_file)}")
-        for i, insert in enumerate(inserts):
-            # Clean up for logging
-            cleaned = re.sub(r'\s+', ' ', insert)
-            logging.debug(f"Sample INSERT #{i+1}: {cleaned[:200]}...")
-
-            # Try to determine structure
-            parts = re.search(r'INSERT\s+INTO\s+(?:\[\w+\]\.)?\[([^\]]+)\](?:\s*\(([^)]+)\))?\s*VALUES\s*\((.*?)(?:\)(?:\s*GO)?;|$)',
-                             cleaned, re.IGNORECASE)
-
-            if parts:
-                table = parts.group(1)
-                columns = parts.group(2) if parts.group(2) else "Default columns"
-                values = parts.group(3)
-                logging.debug(f"  Table: {table}")
-                logging.debug(f"  Columns: {columns}")
-                logging.debug(f"  Values (start): {values[:50]}...")
-                logging.debug(f"  Values count: {values.count(',') + 1}")
-
-                # Check for unbalanced quotes or parentheses
-                quotes = values.count("'")
-                parens = values.count('(') - values.count(')')
-                if quotes % 2 != 0 or parens != 0:
-                    logging.debug(f"  Warning: Unbalanced quotes ({quotes}) or parentheses ({parens})")
+    If a metrics dict is passed, phase timings, per-table rows, SQL size and
+    time, and the failed statement count are recorded in it.
+    """
+    logging.info(f"Creating SQLite database: {sqlite_path}")
 
-            else:
-                logging.debug("  Could not parse statement structure")
+    # Each conversion gets its own build file, so two building the same
+    # sqlite_path never load into each other's; sqlite_path stays in use
+    # until the new database replaces it
+    fd, build_path = tempfile.mkstemp(prefix=os.path.basename(sqlite_path) + '.', suffix='.building',
+                                      dir=os.path.dirname(os.path.abspath(sqlite_path)))
+    os.close(fd)
 
-        # Break after checking the first file with INSERT statements
-        if inserts:
-            break
+    started = time.perf_counter()
+    schema_seconds = 0.0
+
+    template = None
+    if schema_cache_dir:
+        statements = read_schema(sql_files)
+        if statements:
+            template = schema_template(statements, schema_cache_dir, BULK_PAGE_SIZE if bulk else None)
+            shutil.copyfile(template[0], build_path)
 
-    # Second pass: Using a more direct approach for INSERT statements
-    logging.info("Second pass: Inserting data using direct SQL approach...")
+    # Connect to SQLite database
+    conn = sqlite3.connect(build_path)
+    cursor = conn.cursor()
+    engine = InsertEngine(cursor)
 
-    # First, let's prepare tables by finding all column names
-    table_columns = {}
-    for table_info in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
-        table_name = table_info[0]
-        columns = []
-        for column_info in cursor.execute(f'PRAGMA table_info("{table_name}")').fetchall():
-            columns.append(column_info[1])  # Column name
-        table_columns[table_name] = columns
-        logging.debug(f"Table '{table_name}' has {len(columns)} columns: {', '.join(columns)}")
+    if bulk:
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
+        # One transaction for the whole load rather than one per file
+        conn.execute("BEGIN TRANSACTION")
 
-    # Process INSERT statements - simplified direct approach
+    # Track overall statistics
+    tables_created = 0
+    samples_logged = 0
+    failed_files = []
+
+    if template:
+        for table_name, columns in template[1].items():
+            engine.set_table(table_name, columns)
+        tables_created = len(template[1])
+    schema_seconds += time.perf_counter() - started
+
+    # Single pass: the export writes each table's CREATE TABLE ahead of its
+    # data, so schema and rows can be applied in the order they are read
+    logging.info("Loading schema and data...")
     for sql_file in sorted(sql_files):
         try:
-            with open(sql_file, 'rb') as f:
-                binary_content = f.read()
-                sql_content = binary_content.replace(b'\x00', b'').decode('utf-8', errors='ignore')
-
             # Begin transaction
-            conn.execute("BEGIN TRANSACTION")
-
-            # Split into statements
-            statements = re.split(r';[\s\n]*', sql_content)
-
-            inserts_count = 0
-            for statement in statements:
-                statement = statement.strip()
+            if not bulk:
+                conn.execute("BEGIN TRANSACTION")
+
+            rows_before = engine.rows_inserted
+            for statement in iter_sql_statements(sql_file):
+                keyword = statement[:12].upper()
+
+                if keyword.startswith('CREATE TABLE'):
+                    schema_started = time.perf_counter()
+                    statement = translate_create_table(statement)
+                    table_name = _CREATE_TABLE_NAME.match(statement)
+                    # Tables already created by the schema template are skipped
+                    if not (table_name and table_name.group(1) in engine.tables):
+                        try:
+                            cursor.execute(statement)
+                            tables_created += 1
+                            if table_name:
+                                engine.add_table(table_name.group(1))
+                        except sqlite3.Error as e:
+                            logging.warning(f"Error creating table: {e}\nStatement: {statement[:150]}...")
+                    schema_seconds += time.perf_counter() - schema_started
+                    continue
 
                 # Only process INSERT statements
-                if not statement.upper().startswith('INSERT INTO'):
+                if not keyword.startswith('INSERT INTO'):
                     continue
 
-                # Try a simplified approach: extract key parts first
-                try:
-                    # Convert brackets to quotes for SQLite compatibility
-                    statement = re.sub(r'\[\w+\]\.\[(\w+)\]', r'"\1"', statement)
-                    statement = re.sub(r'\[([^\]]+)\]', r'"\1"', statement)
-
-                    # Find table name
-                    table_match = re.search(r'INSERT\s+INTO\s+"([^"]+)"', statement, re.IGNORECASE)
-                    if not table_match:
-                        continue
-
-                    table_name = table_match.group(1)
-
-                    # Check if this table exists in our schema
-                    if table_name not in table_columns:
-                        logging.debug(f"Table '{table_name}' not found in schema, skipping")
-                        continue
-
-                    # Find VALUES clause
-                    values_match = re.search(r'VALUES\s*\((.*?)\)(?:\s*GO)?$', statement, re.IGNORECASE | re.DOTALL)
-                    if not values_match:
-                        logging.debug(f"Couldn't extract values from: {statement[:100]}...")
-                        continue
+                if samples_logged < 3:
+                    samples_logged += 1
+                    cleaned = re.sub(r'\s+', ' ', statement)
+                    logging.debug(f"Sample INSERT #{samples_logged} ({os.path.basename(sql_file)}): {cleaned[:200]}...")
 
-                    # Execute the cleaned up INSERT statement
-                    cleaned_stmt = statement.replace('\n', ' ').replace('\r', '')
+                engine.add(statement)
 
-                    # Add semicolon at the end if needed
-                    if not cleaned_stmt.rstrip().endswith(';'):
-                        cleaned_stmt += ';'
-
-                    cursor.execute(cleaned_stmt)
-                    inserts_count += 1
-                    rows_inserted += 1
-
-                except sqlite3.Error as e:
-                    logging.debug(f"SQLite error inserting: {e}\nStatement: {statement[:100]}...")
-                except Exception as e:
-                    logging.debug(f"General error inserting: {e}\nStatement: {statement[:100]}...")
+            engine.flush()
 
             # Commit transaction
-            conn.commit()
-            logging.info(f"Inserted {inserts_count} rows from {os.path.basename(sql_file)}")
+            if not bulk:
+                conn.commit()
+            logging.info(f"Inserted {engine.rows_inserted - rows_before} rows from {os.path.basename(sql_file)}")
 
         except Exception as e:
-            # Rollback on error
-            try:
-                conn.execute("ROLLBACK")
-            except sqlite3.Error:
-                pass
+            # Rollback on error. A bulk load is one transaction for every
+            # file, so whatever the file managed to load is kept.
+            if not bulk:
+                try:
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+            engine.batches.clear()
 
             logging.error(f"Error processing file {os.path.basename(sql_file)}: {e}")
+            failed_files.append(os.path.basename(sql_file))
             import traceback
             logging.error(traceback.format_exc())
 
+    if engine.failed:
+        logging.warning(f"{engine.failed} INSERT statements could not be loaded")
+
     # Check database stats
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
     tables = cursor.fetchall()
@@ -418,49 +716,246 @@ def sql_to_sqlite(sql_files, sqlite_path):
 
     # Commit any remaining changes and close connection
     conn.commit()
-    conn.close()
-
-    logging.info(f"SQLite conversion complete: {tables_created} tables, {rows_inserted} rows inserted")
+    loaded = time.perf_counter()
+    try:
+        if failed_files:
+            # Keep whatever database was there before rather than an incomplete one
+            conn.close()
+            os.remove(build_path)
+        elif bulk:
+            finish_bulk_load(conn, build_path, sqlite_path, vacuum)
+        else:
+            conn.close()
+            os.replace(build_path, sqlite_path)
+    except Exception:
+        conn.close()
+        if os.path.exists(build_path):
+            os.remove(build_path)
+        raise
+
+    if metrics is not None:
+        seconds = metrics.setdefault('seconds', {})
+        seconds['schema'] = round(schema_seconds, 3)
+        seconds['insert'] = round(loaded - started - schema_seconds, 3)
+        seconds['finalize'] = round(time.perf_counter() - loaded, 3)
+        metrics['sql_bytes'] = sum(os.path.getsize(sql_file) for sql_file in sql_files)
+        metrics['tables_created'] = tables_created
+        metrics['rows_inserted'] = engine.rows_inserted
+        metrics['failed_statements'] = engine.failed
+        metrics['tables'] = {
+            table_name: {
+                'rows': engine.table_rows.get(table_name, 0),
+                'sql_chars': engine.table_chars.get(table_name, 0),
+                'seconds': round(engine.table_seconds.get(table_name, 0.0), 3),
+            }
+            for table_name in engine.tables
+        }
+
+    if failed_files:
+        logging.error(f"SQLite conversion failed: {', '.join(failed_files)} could not be loaded")
+        return False
+    logging.info(f"SQLite conversion complete: {tables_created} tables, {engine.rows_inserted} rows inserted")
     return True
 
 
-def convert_sdf_to_sql(sdf_path, output_dir):
-    """Convert SDF file to SQL using ExportSQLCE40.exe and then to SQLite"""
+def finish_bulk_load(conn, build_path, sqlite_path, vacuum=False):
+    """ANALYZE a bulk-loaded database and move it to its final path"""
+    logging.info("Analyzing database...")
+    conn.execute("ANALYZE")
+    conn.commit()
+
+    if vacuum:
+        logging.info(f"Vacuuming into {sqlite_path}...")
+        # VACUUM INTO needs a new or empty target, so it writes to a temp
+        # file that replaces sqlite_path only once the vacuum has finished
+        fd, vacuum_path = tempfile.mkstemp(suffix='.vacuum', dir=os.path.dirname(os.path.abspath(sqlite_path)))
+        os.close(fd)
+        try:
+            conn.execute("VACUUM INTO ?", (vacuum_path,))
+        except Exception:
+            os.remove(vacuum_path)
+            raise
+        finally:
+            conn.close()
+        os.replace(vacuum_path, sqlite_path)
+        os.remove(build_path)
+    else:
+        conn.close()
+        os.replace(build_path, sqlite_path)
+
+
+def _read_columns(conn, table_name):
+    """Read a table into per-column lists, returning [(name, affinity, values)]"""
+    info = conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+    columns = [[] for _ in info]
+    cursor = conn.execute(f'SELECT * FROM "{table_name}"')
+    while True:
+        rows = cursor.fetchmany(COLUMNAR_FETCH_SIZE)
+        if not rows:
+            break
+        for values, column in zip(columns, zip(*rows)):
+            values.extend(column)
+    return [(column[1], column_affinity(column[2]), values) for column, values in zip(info, columns)]
+
+
+def _all_integers(values):
+    # INTEGER columns keep non-integral values such as 2.5 as floats (see _to_integer)
+    return all(v is None or isinstance(v, int) for v in values)
+
+
+def _arrow_column(affinity, values):
+    if affinity == 'INTEGER' and not _all_integers(values):
+        affinity = 'REAL'
+    arrow_type = {
+        'INTEGER': pyarrow.int64(),
+        'REAL': pyarrow.float64(),
+        'NUMERIC': pyarrow.float64(),
+        'TEXT': pyarrow.string(),
+        'BLOB': pyarrow.binary(),
+    }[affinity]
+    try:
+        return pyarrow.array(values, type=arrow_type)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, TypeError, OverflowError):
+        # Values that didn't fit the declared type were stored as text
+        return pyarrow.array([None if v is None else str(v) for v in values], type=pyarrow.string())
+
+
+def _numpy_column(affinity, values):
+    """Return {suffix: array} for one column; nulls go in a separate mask"""
+    nulls = numpy.array([v is None for v in values], dtype=bool)
+    arrays = {}
+    try:
+        if affinity == 'INTEGER' and _all_integers(values):
+            arrays[''] = numpy.array([0 if v is None else v for v in values], dtype=numpy.int64)
+        elif affinity in ('INTEGER', 'REAL', 'NUMERIC'):
+            arrays[''] = numpy.array([numpy.nan if v is None else v for v in values], dtype=numpy.float64)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    if '' not in arrays:
+        arrays[''] = numpy.array([
+            '' if v is None else v.hex() if isinstance(v, bytes) else str(v) for v in values
+        ], dtype=str)
+    if nulls.any():
+        arrays['__null'] = nulls
+    return arrays
+
+
+def export_columnar(sqlite_path, out_dir):
+    """Write a columnar copy of every table in a converted database.
+
+    Each table becomes <table>.parquet when pyarrow is installed, otherwise
+    <table>.npz holding one typed NumPy array per column (plus a
+    <column>__null mask for columns with NULLs). Column types come from the
+    table's declared types. Returns the files written.
+    """
+    if pyarrow is None and numpy is None:
+        logging.warning("Columnar export needs pyarrow or numpy; neither is installed")
+        return []
+
+    ensure_dir(out_dir)
+    written = []
+    conn = sqlite3.connect(sqlite_path)
+    try:
+        tables = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        for (table_name,) in tables:
+            columns = _read_columns(conn, table_name)
+            if pyarrow is not None:
+                path = os.path.join(out_dir, f"{table_name}.parquet")
+                table = pyarrow.table({name: _arrow_column(affinity, values) for name, affinity, values in columns})
+                pyarrow.parquet.write_table(table, path)
+            else:
+                path = os.path.join(out_dir, f"{table_name}.npz")
+                arrays = {}
+                for name, affinity, values in columns:
+                    for suffix, array in _numpy_column(affinity, values).items():
+                        arrays[name + suffix] = array
+                numpy.savez_compressed(path, **arrays)
+            written.append(path)
+    finally:
+        conn.close()
+
+    logging.info(f"Wrote columnar copies of {len(written)} tables to {out_dir}")
+    return written
+
+
+def load_columnar(out_dir, table_name, columns=None):
+    """Load some or all columns of a table written by export_columnar.
+
+    Returns {column: array}; NumPy columns with NULLs come back as masked
+    arrays. Only the requested columns are read from disk.
+    """
+    parquet_path = os.path.join(out_dir, f"{table_name}.parquet")
+    if os.path.exists(parquet_path):
+        if pyarrow is None:
+            raise ImportError(f"Reading {parquet_path} needs pyarrow, which isn't installed")
+        table = pyarrow.parquet.read_table(parquet_path, columns=columns)
+        return {name: table.column(name) for name in table.column_names}
+
+    if numpy is None:
+        raise ImportError(f"Reading {table_name}.npz in {out_dir} needs numpy, which isn't installed")
+    with numpy.load(os.path.join(out_dir, f"{table_name}.npz")) as npz:
+        names = columns or [name for name in npz.files if not name.endswith('__null')]
+        result = {}
+        for name in names:
+            array = npz[name]
+            if f"{name}__null" in npz.files:
+                array = numpy.ma.masked_array(array, mask=npz[f"{name}__null"])
+            result[name] = array
+        return result
+
+
+def convert_sdf_to_sql(sdf_path, output_dir, metrics=None, columnar=False, **kwargs):
+    """Convert SDF file to SQL using ExportSQLCE40.exe and then to SQLite
+
+    Extra keyword arguments (bulk, vacuum, schema_cache_dir) are passed on
+    to sql_to_sqlite. A metrics dict, if given, collects the timing of each
+    step (see convert_with_metrics). With columnar=True a columnar copy of
+    every table is written next to the database (see export_columnar).
+    """
+    if metrics is None:
+        metrics = {}
+    seconds = metrics.setdefault('seconds', {})
     file_name = os.path.basename(sdf_path)
-    parent_dir = os.path.basename(os.path.dirname(sdf_path))
 
     # Create output directory using parent folder name of the SDF file
-    target_dir = os.path.join(output_dir, parent_dir)
+    sqlite_path = sqlite_path_for(sdf_path, output_dir)
+    target_dir = os.path.dirname(sqlite_path)
     ensure_dir(target_dir)
 
-    # Clean and prepare temp directory
-    ensure_dir(TEMP_DIR)
-    clean_temp_dir()
-
-    # Prepare temp files
-    temp_sdf = os.path.join(TEMP_DIR, "input.sdf")
+    # Each conversion gets its own workspace so several can run at once
+    work_dir = make_temp_workspace()
+    temp_sdf = os.path.join(work_dir, "input.sdf")
 
     try:
         # Copy SDF to temp directory
         logging.info(f"Processing: {sdf_path}")
+        started = time.perf_counter()
         shutil.copyfile(sdf_path, temp_sdf)
+        metrics['sdf_bytes'] = os.path.getsize(temp_sdf)
+        seconds['copy'] = round(time.perf_counter() - started, 3)
 
         # Run conversion tool
         logging.info("Running SQL export tool...")
+        started = time.perf_counter()
         result = subprocess.run([
             EXPORT_TOOL_PATH,
             'Data Source=input.sdf',
             'output.sql'
-        ], cwd=TEMP_DIR, capture_output=True, text=True)
+        ], cwd=work_dir, capture_output=True, text=True)
+        seconds['export'] = round(time.perf_counter() - started, 3)
 
         if result.returncode != 0:
             logging.error(f"Export failed: {result.stderr}")
+            metrics['error'] = f"Export failed: {result.stderr.strip()[:500]}"
             return False
 
         # Find output files
-        sql_files = glob.glob(os.path.join(TEMP_DIR, "output*.sql"))
+        sql_files = glob.glob(os.path.join(work_dir, "output*.sql"))
         if not sql_files:
             logging.error("No SQL files were generated")
+            metrics['error'] = "No SQL files were generated"
             return False
 
         # Save SQL files to target directory for reference
@@ -469,26 +964,394 @@ def convert_sdf_to_sql(sdf_path, output_dir):
             target_path = os.path.join(target_dir, sql_name)
             shutil.copyfile(sql_file, target_path)
 
-        # Create SQLite database
-        db_name = f"{parent_dir}.db"
-        sqlite_path = os.path.join(target_dir, db_name)
-
         # Convert SQL files to SQLite
-        if sql_to_sqlite(sql_files, sqlite_path):
-            logging.info(f"✓ Created SQLite database: {sqlite_path}")
+        if not sql_to_sqlite(sql_files, sqlite_path, metrics=metrics, **kwargs):
+            metrics['error'] = "Loading the SQL files into SQLite failed"
+            return False
+        logging.info(f"✓ Created SQLite database: {sqlite_path}")
+
+        if columnar:
+            started = time.perf_counter()
+            export_columnar(sqlite_path, os.path.join(target_dir, COLUMNAR_DIR_NAME))
+            seconds['columnar'] = round(time.perf_counter() - started, 3)
 
         logging.info(f"✓ Converted {file_name} -> {target_dir}")
         return True
 
     except Exception as e:
         logging.error(f"Error processing {sdf_path}: {e}")
+        metrics['error'] = str(e)
         return False
     finally:
         # Clean up temp files
-        clean_temp_dir()
+        clean_temp_workspace(work_dir)
 
 
-def main():
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where unavailable"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    return round(getattr(memory, 'peak_wset', memory.rss) / (1024 * 1024), 1)
+
+
+def convert_with_metrics(sdf_path, output_dir, **kwargs):
+    """Run convert_sdf_to_sql and return (success, metrics record).
+
+    The record holds the copy/export/schema/insert/finalize timings, SDF
+    and SQL sizes, per-table rows, SQL size and time, the failed statement
+    count and the process's peak memory (a high-water mark, so in a worker
+    process it covers every conversion that worker ran).
+    """
+    metrics = {
+        'type': 'conversion',
+        'work_order': work_order_key(sdf_path),
+        'sdf_path': sdf_path,
+        'started': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    started = time.perf_counter()
+    ok = convert_sdf_to_sql(sdf_path, output_dir, metrics=metrics, **kwargs)
+    metrics['ok'] = ok
+    metrics.setdefault('seconds', {})['total'] = round(time.perf_counter() - started, 3)
+    metrics['peak_rss_mb'] = peak_rss_mb()
+    return ok, metrics
+
+
+def append_metrics(record, path=None):
+    """Append one record to the run metrics JSON Lines file"""
+    path = path or METRICS_PATH
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+
+def summarize_metrics(records, top=5):
+    """Build a summary record of a run: totals plus the slowest work orders and tables"""
+    totals = {}
+    tables = {}
+    for record in records:
+        for phase, value in record.get('seconds', {}).items():
+            totals[phase] = totals.get(phase, 0.0) + value
+        for table_name, stats in record.get('tables', {}).items():
+            table = tables.setdefault(table_name, {'rows': 0, 'sql_chars': 0, 'seconds': 0.0})
+            for field in table:
+                table[field] += stats.get(field, 0)
+
+    slowest = sorted(records, key=lambda r: r.get('seconds', {}).get('total', 0), reverse=True)[:top]
+    return {
+        'type': 'summary',
+        'finished': datetime.datetime.now().isoformat(timespec='seconds'),
+        'work_orders': len(records),
+        'failed': sum(1 for record in records if not record.get('ok')),
+        'rows_inserted': sum(record.get('rows_inserted', 0) for record in records),
+        'failed_statements': sum(record.get('failed_statements', 0) for record in records),
+        'seconds': {phase: round(value, 3) for phase, value in totals.items()},
+        'slowest_work_orders': [
+            {'work_order': record['work_order'], 'seconds': record.get('seconds', {})}
+            for record in slowest
+        ],
+        'slowest_tables': [
+            {'table': table_name, 'rows': stats['rows'], 'sql_chars': stats['sql_chars'],
+             'seconds': round(stats['seconds'], 3)}
+            for table_name, stats in sorted(tables.items(), key=lambda item: item[1]['seconds'], reverse=True)[:top]
+        ],
+        'peak_rss_mb': max((record.get('peak_rss_mb') or 0 for record in records), default=None),
+    }
+
+
+def _open_warehouse(warehouse_path):
+    conn = sqlite3.connect(warehouse_path, timeout=60)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS WorkOrderLoads (
+            WorkOrderKey TEXT PRIMARY KEY,
+            SourcePath TEXT,
+            LoadedAt TEXT,
+            RowCount INTEGER
+        )
+    """)
+    return conn
+
+
+def warehouse_work_orders(warehouse_path=None):
+    """Return the keys of the work orders already loaded into the warehouse"""
+    warehouse_path = warehouse_path or WAREHOUSE_PATH
+    if not os.path.exists(warehouse_path):
+        return set()
+    conn = _open_warehouse(warehouse_path)
+    try:
+        return {row[0] for row in conn.execute("SELECT WorkOrderKey FROM WorkOrderLoads")}
+    finally:
+        conn.close()
+
+
+def load_into_warehouse(sqlite_path, key, warehouse_path=None, source_path=None):
+    """Copy one work order's database into the shared warehouse database.
+
+    Every warehouse table carries a WorkOrderKey column. Any rows already
+    loaded for key are replaced, so reloading a work order is idempotent.
+    Tables and columns the warehouse hasn't seen yet are added as they show
+    up. Returns the number of rows loaded.
+    """
+    warehouse_path = warehouse_path or WAREHOUSE_PATH
+    conn = _open_warehouse(warehouse_path)
+    rows_loaded = 0
+    try:
+        conn.execute("ATTACH DATABASE ? AS wo", (sqlite_path,))
+        conn.execute("BEGIN IMMEDIATE")
+
+        # Clear out the previous load of this work order from every table
+        for (table,) in conn.execute("SELECT name FROM main.sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall():
+            columns = [column[1] for column in conn.execute(f'PRAGMA main.table_info("{table}")')]
+            if 'WorkOrderKey' in columns and table != 'WorkOrderLoads':
+                conn.execute(f'DELETE FROM main."{table}" WHERE WorkOrderKey = ?', (key,))
+
+        for (table,) in conn.execute("SELECT name FROM wo.sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall():
+            source_columns = [(column[1], column[2]) for column in conn.execute(f'PRAGMA wo.table_info("{table}")')]
+            existing = {column[1] for column in conn.execute(f'PRAGMA main.table_info("{table}")')}
+
+            if not existing:
+                definitions = ', '.join(f'"{name}" {decl_type}' for name, decl_type in source_columns)
+                conn.execute(f'CREATE TABLE main."{table}" ("WorkOrderKey" TEXT NOT NULL, {definitions})')
+            else:
+                for name, decl_type in source_columns:
+                    if name not in existing:
+                        conn.execute(f'ALTER TABLE main."{table}" ADD COLUMN "{name}" {decl_type}')
+
+            conn.execute(f'CREATE INDEX IF NOT EXISTS main."ix_{table}_WorkOrderKey" ON "{table}" ("WorkOrderKey")')
+            for name, _ in source_columns:
+                if name in WAREHOUSE_INDEX_COLUMNS:
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS main."ix_{table}_{name}" ON "{table}" ("{name}")')
+
+            column_list = ', '.join(f'"{name}"' for name, _ in source_columns)
+            cursor = conn.execute(
+                f'INSERT INTO main."{table}" ("WorkOrderKey", {column_list}) SELECT ?, {column_list} FROM wo."{table}"',
+                (key,)
+            )
+            rows_loaded += cursor.rowcount
+
+        conn.execute(
+            "INSERT OR REPLACE INTO WorkOrderLoads (WorkOrderKey, SourcePath, LoadedAt, RowCount) VALUES (?, ?, ?, ?)",
+            (key, source_path, datetime.datetime.now().isoformat(timespec='seconds'), rows_loaded)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    logging.info(f"Loaded {rows_loaded} rows of {key} into warehouse {warehouse_path}")
+    return rows_loaded
+
+
+def load_manifest(path=None):
+    """Load the conversion manifest, or start an empty one"""
+    path = path or MANIFEST_PATH
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'files': {}}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return {'files': {}}
+    manifest.setdefault('files', {})
+    return manifest
+
+
+def save_manifest(manifest, path=None):
+    """Write the manifest atomically so an interrupted run can't corrupt it"""
+    path = path or MANIFEST_PATH
+    # A temp file of its own, as the daemon and a full run may save at once
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                     dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def update_manifest(entries, path=None):
+    """Save {key: entry} into the manifest as it is on disk now.
+
+    Entries other processes saved since this one loaded the manifest are
+    kept, rather than overwritten by a stale copy.
+    """
+    manifest = load_manifest(path)
+    manifest['files'].update(entries)
+    save_manifest(manifest, path)
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-1 of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_up_to_date(entry, sdf_path, output_dir, use_hash=False, outputs=()):
+    """Check a manifest entry against the SDF on disk and its database.
+
+    Size and mtime decide on their own; with use_hash a file whose mtime
+    changed but whose contents did not is still treated as current (and
+    its entry is refreshed with the new mtime). outputs names the optional
+    outputs ('columnar') the run wants; a conversion that didn't write one
+    of them is out of date.
+    """
+    if not entry or entry.get('version') != CONVERTER_VERSION:
+        return False
+    sqlite_path = sqlite_path_for(sdf_path, output_dir)
+    if not os.path.exists(sqlite_path):
+        return False
+    if any(output not in entry.get('outputs', ()) for output in outputs):
+        return False
+    if 'columnar' in outputs and not os.path.isdir(os.path.join(os.path.dirname(sqlite_path), COLUMNAR_DIR_NAME)):
+        return False
+
+    stat = os.stat(sdf_path)
+    if stat.st_size != entry.get('size'):
+        return False
+    if stat.st_mtime == entry.get('mtime'):
+        return True
+    if use_hash and entry.get('sha1') and file_hash(sdf_path) == entry['sha1']:
+        entry['mtime'] = stat.st_mtime
+        return True
+    return False
+
+
+def manifest_entry(sdf_path, use_hash=False, outputs=()):
+    """Describe the current state of an SDF file, and the optional outputs converted from it, for the manifest"""
+    stat = os.stat(sdf_path)
+    entry = {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'version': CONVERTER_VERSION,
+        'outputs': sorted(outputs),
+        'converted': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    if use_hash:
+        entry['sha1'] = file_hash(sdf_path)
+    return entry
+
+
+def find_sdf_files(search_dir, snapshot_path=None):
+    """Return the paths of all SDF files under search_dir.
+
+    Directories unchanged since the snapshot at snapshot_path (default
+    DISCOVERY_SNAPSHOT_PATH) aren't listed again.
+    """
+    stats = {}
+    sdf_files = sdf_discovery.find_files(search_dir, lambda directory, name: name.lower().endswith('.sdf'),
+                                         snapshot_path=snapshot_path or DISCOVERY_SNAPSHOT_PATH, stats=stats)
+    logging.info(f"Found {stats['found']} SDF files: {stats['listed']} directories listed, "
+                 f"{stats['reused']} unchanged since the last search")
+    return sdf_files
+
+
+def convert_all(sdf_files, output_dir, jobs=1, on_converted=None, on_metrics=None, **kwargs):
+    """Convert SDF files, up to `jobs` at a time. Returns the paths that failed.
+
+    on_converted, if given, is called with the path of each successful
+    conversion as it finishes, and on_metrics with every conversion's
+    metrics record. Extra keyword arguments are passed on to
+    convert_sdf_to_sql. SDFs that convert to the same database are never
+    converted at the same time.
+    """
+    failed = []
+
+    if jobs <= 1:
+        for sdf_path in sdf_files:
+            ok, metrics = convert_with_metrics(sdf_path, output_dir, **kwargs)
+            if on_metrics:
+                on_metrics(metrics)
+            if not ok:
+                failed.append(sdf_path)
+            elif on_converted:
+                on_converted(sdf_path)
+        return failed
+
+    # SDFs in folders with the same name are converted to the same database,
+    # so they go one after another rather than racing to replace it
+    queues = collections.OrderedDict()
+    for sdf_path in sdf_files:
+        key = os.path.normcase(os.path.abspath(sqlite_path_for(sdf_path, output_dir)))
+        queues.setdefault(key, collections.deque()).append(sdf_path)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+
+        def submit(queue):
+            sdf_path = queue.popleft()
+            futures[executor.submit(convert_with_metrics, sdf_path, output_dir, **kwargs)] = (sdf_path, queue)
+
+        for queue in queues.values():
+            submit(queue)
+
+        done = 0
+        while futures:
+            finished, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                sdf_path, queue = futures.pop(future)
+                if queue:
+                    submit(queue)
+                done += 1
+                try:
+                    ok, metrics = future.result()
+                except Exception as e:
+                    logging.error(f"Worker failed on {sdf_path}: {e}")
+                    ok = False
+                    metrics = {'type': 'conversion', 'work_order': work_order_key(sdf_path),
+                               'sdf_path': sdf_path, 'ok': False, 'error': str(e)}
+                if on_metrics:
+                    on_metrics(metrics)
+                if not ok:
+                    failed.append(sdf_path)
+                elif on_converted:
+                    on_converted(sdf_path)
+                logging.info(f"[{done}/{len(sdf_files)}] {'Converted' if ok else 'Failed'}: {sdf_path}")
+
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Microvellum SDF work orders to SQL/SQLite")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="Number of conversions to run in parallel (default: 1)")
+    parser.add_argument('--force', action='store_true',
+                        help="Convert every SDF file, even ones the manifest says are current")
+    parser.add_argument('--hash', action='store_true',
+                        help="Record content hashes and use them when an SDF's mtime changes")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Load each database with an in-memory journal and fsync off, then ANALYZE it")
+    parser.add_argument('--vacuum', action='store_true',
+                        help="With --bulk, write the final database out with VACUUM INTO")
+    parser.add_argument('--columnar', action='store_true',
+                        help="Also write each table as Parquet (pyarrow) or .npz (numpy) for analytics")
+    parser.add_argument('--no-schema-cache', action='store_true',
+                        help="Build every database's schema from scratch instead of from a cached template")
+    parser.add_argument('--metrics', nargs='?', const=METRICS_PATH, metavar='PATH',
+                        help="Append a performance record per conversion and a run summary to a "
+                             f"JSON Lines file (default: {METRICS_PATH})")
+    parser.add_argument('--warehouse', nargs='?', const=WAREHOUSE_PATH, metavar='PATH',
+                        help="Also load every converted work order into one shared database "
+                             f"(default: {WAREHOUSE_PATH})")
+    args = parser.parse_args(argv)
+
     logging.info("Starting SDF to SQL/SQLite conversion")
     logging.info(f"Searching for SDF files in: {SEARCH_DIR}")
 
@@ -500,20 +1363,94 @@ def main():
     # Ensure output directory exists
     ensure_dir(OUTPUT_DIR)
 
-    count = 0
-    successful = 0
-
-    # Find and process all SDF files
-    for root, _, files in os.walk(SEARCH_DIR):
-        for file in files:
-            if file.lower().endswith('.sdf'):
-                count += 1
-                sdf_path = os.path.join(root, file)
-
-                if convert_sdf_to_sql(sdf_path, OUTPUT_DIR):
-                    successful += 1
+    # Find all SDF files and skip the ones that haven't changed
+    sdf_files = find_sdf_files(SEARCH_DIR)
+    manifest = load_manifest()
+    files = manifest['files']
+
+    # Work orders converted on an earlier run but missing from the warehouse
+    # still need loading even though they are skipped here
+    in_warehouse = warehouse_work_orders(args.warehouse) if args.warehouse else set()
+    unloaded = []
+
+    # Work orders converted without an output this run asks for are converted again
+    outputs = ('columnar',) if args.columnar else ()
+    pending = []
+    entries = {}
+    refreshed = {}  # Entries --hash found current under a new mtime
+    for sdf_path in sdf_files:
+        key = manifest_key(sdf_path)
+        try:
+            if not args.force and is_up_to_date(files.get(key), sdf_path, OUTPUT_DIR, args.hash, outputs):
+                if args.hash:
+                    refreshed[key] = files[key]
+                if args.warehouse and work_order_key(sdf_path) not in in_warehouse:
+                    unloaded.append(sdf_path)
+                continue
+            # Capture the file's state before converting, so a save that
+            # lands mid-conversion is picked up next run
+            entries[sdf_path] = (key, manifest_entry(sdf_path, args.hash, outputs))
+        except OSError as e:
+            logging.warning(f"Could not stat {sdf_path}: {e}")
+        pending.append(sdf_path)
+
+    jobs = max(1, min(args.jobs, len(pending)))
+    logging.info(f"Found {len(sdf_files)} SDF files, {len(pending)} to convert with {jobs} job(s)")
+
+    def warehouse(sdf_path):
+        try:
+            load_into_warehouse(sqlite_path_for(sdf_path, OUTPUT_DIR), work_order_key(sdf_path),
+                                args.warehouse, source_path=sdf_path)
+        except sqlite3.Error as e:
+            logging.error(f"Error loading {sdf_path} into the warehouse: {e}")
+
+    def record(sdf_path):
+        # Warehouse loads run here in the parent process, one at a time, so
+        # parallel conversions never contend for the warehouse's write lock
+        if args.warehouse:
+            warehouse(sdf_path)
+        if sdf_path in entries:
+            key, entry = entries[sdf_path]
+            # Save as we go so an interrupted run keeps its progress, merged
+            # with what the daemon may have saved meanwhile
+            update_manifest({key: entry})
+
+    for sdf_path in unloaded:
+        warehouse(sdf_path)
+
+    run_id = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    run_metrics = []
+
+    def measure(metrics):
+        metrics['run'] = run_id
+        run_metrics.append(metrics)
+        if args.metrics:
+            append_metrics(metrics, args.metrics)
 
-    logging.info(f"Conversion complete: {successful} of {count} files processed successfully")
+    try:
+        failed = convert_all(pending, OUTPUT_DIR, jobs, on_converted=record, on_metrics=measure,
+                             bulk=args.bulk, vacuum=args.vacuum, columnar=args.columnar,
+                             schema_cache_dir=None if args.no_schema_cache else SCHEMA_CACHE_DIR)
+    finally:
+        if refreshed:
+            update_manifest(refreshed)
+
+    successful = len(pending) - len(failed)
+    logging.info(f"Conversion complete: {successful} of {len(pending)} files processed successfully "
+                 f"({len(sdf_files) - len(pending)} unchanged)")
+    for sdf_path in failed:
+        logging.warning(f"Failed: {sdf_path}")
+
+    if run_metrics:
+        summary = summarize_metrics(run_metrics)
+        summary['run'] = run_id
+        if args.metrics:
+            append_metrics(summary, args.metrics)
+        logging.info(f"Time by step: {summary['seconds']}")
+        for entry in summary['slowest_work_orders']:
+            logging.info(f"Slow work order: {entry['work_order']} {entry['seconds']}")
+        for entry in summary['slowest_tables']:
+            logging.info(f"Slow table: {entry['table']} - {entry['rows']} rows in {entry['seconds']}s")
 
 
 if __name__ == "__main__":
@@ -1,13 +1,23 @@
 import gspread
-import gspread_formatting
 import datetime
-import subprocess
 import os
 import re
 import pyodbc
 import json
 import csv
-from pathlib import Path
+import collections
+import functools
+import hashlib
+import decimal
+import threading
+import contextlib
+import time
+import concurrent.futures
+
+import sdf_discovery
+import sheets_publisher
+import sqlcecmd
+import workorder_db
 
 
 GOOGLE_SHEETS_CREDENTIALS = {
@@ -25,6 +35,43 @@ directory = "M:\Homestead_Library\Work Orders"
 # station_LinkID = '0816ab46-ad71-4fe2-804b-c804120d3a7f'       # Weeke - Standard
 station_LinkID = '5760d3cd-7ef0-40f8-8d7f-ea56e6a19770'         # Purchasing station
 
+# Connections kept open to MicrovellumData, and how long one may sit idle
+# before it is checked with a trivial query on its way out of the pool
+pool_size = 4
+pool_check_after = 30
+
+# Local copy of every purchase order, and the watermark and row hashes that
+# let each run fetch only what changed since the last
+purchase_orders_path = 'purchase_orders_data.json'
+purchase_orders_state_path = 'purchase_orders_sync.json'
+# Purchase orders created within this many days, or with material still to be
+# received, are re-read on every sync since those are the ones that change
+po_refresh_days = 30
+
+# Directory mtimes from the last search for purchasing work orders
+discovery_snapshot_path = 'sdf_snapshot_purchasing.json'
+
+# Work orders scraped at once; each mostly waits on SqlCeCmd40 and SQL Server
+workers = 8
+
+# Tabs the work orders' lists go to
+key_tab_map = {
+    'products': 'WO_Products',
+    'hardware': 'WO_Hardware',
+    'edgebanding': 'WO_Edgebanding',
+    'sheets': 'WO_Sheets',
+    'subassemblies': 'WO_Subassemblies',
+}
+# Columns identifying a row in each tab; hardware and subassemblies have
+# no LinkID, so their rows are matched by position within the work order
+tab_keys = {
+    'WO_Products': ['BidID', 'LinkID'],
+    'WO_Hardware': ['BidID'],
+    'WO_Edgebanding': ['BidID', 'LinkID'],
+    'WO_Sheets': ['BidID', 'LinkID'],
+    'WO_Subassemblies': ['BidID'],
+}
+
 
 part_keys = [
     'Length', 'Width', 'Thickness', 'MaterialName', 'Name', 'Comments', 'MaterialThickness',
@@ -73,187 +120,151 @@ def filter_keys(data, keys):
     return {k: v for k, v in data.items() if k in keys}
 
 
-def get_or_create_sheet(client, tab, index=None, **kwargs):
-    clear = kwargs.get('clear', False)
-    # Check if the sheet already exists
-    try:
-        sheet = client.open(sheet_name).worksheet(tab)
-    except Exception:
-        # If the sheet doesn't exist, create a new one
-        sheet = client.open(sheet_name).add_worksheet(title=tab, rows=100, cols=20, index=index)
+_publishers = {}
+
 
-    if clear:
-        sheet.clear()
-    return sheet
+def publisher(client):
+    """The SheetsPublisher for client, opening the spreadsheet on first use"""
+    if client not in _publishers:
+        _publishers[client] = sheets_publisher.SheetsPublisher(client, sheet_name)
+    return _publishers[client]
 
 
 def write_data(client, data, tab, **kwargs):
-    append = kwargs.get('append', False)
-    index = kwargs.get('index', None)
-    include_nested = kwargs.get('include_nested', False)
-    exclude_keys = kwargs.get('exclude_keys', [])
-    key_tab_map = kwargs.get('key_tab_map', {})
-    tab_data = {}
-
-    # Create and clear out tabs
-    if key_tab_map:
-        for v in key_tab_map.values():
-            get_or_create_sheet(client, v, clear=not append)
-
-    sheet = get_or_create_sheet(client, tab, index, clear=not append)
-
-    currency_format = gspread_formatting.cellFormat(
-        numberFormat={
-            'type': 'CURRENCY',
-            'pattern': '"$"#,##0.00'
-        }
-    )
-
-    number_format = gspread_formatting.cellFormat(
-        numberFormat={
-            'type': 'NUMBER',
-            'pattern': '###0.00'
-        }
-    )
-    date_format = gspread_formatting.cellFormat(
-        numberFormat={
-            'type': 'DATE',
-            'pattern': 'yyyy-mm-dd'
-        }
-    )
-    percentage_format = gspread_formatting.cellFormat(
-        numberFormat={
-            'type': 'PERCENT',
-            'pattern': '0%'
-        }
-    )
-
-    rows = []
-
-    # If dictionary is passed in, convert to list
-    if isinstance(data, dict):
-        data = [data]
-
-    # Write Header Row
-    headers = []
-    first = data[0]
-    for key in first.keys():
-        if key not in exclude_keys:
-            if include_nested:
-                if type(first[key]) is dict or type(first[key]) is list:
-                    for k in first[key].keys():
-                        headers.append(f'{key}_{k}')
-            else:
-                headers.append(key)
+    """Write data to tab, with list values under key_tab_map keys going to their own tabs.
 
-    do_header = not append
+    The header row is written whenever the tab's first row is empty; without
+    append the tabs are cleared first and the *_cols formats are applied.
+    """
+    sheets = publisher(client)
+    sheets.write(data, tab, **kwargs)
+    sheets.flush()
 
-    if any(sheet.row_values(1)):
-        do_header = False
-    else:
-        do_header = True
-
-    if do_header:
-        rows.append(headers)
-
-    for d in data:
-        _d = {}
-        for k, v in d.items():
-            if k not in exclude_keys:
-                if k in key_tab_map.keys():
-                    if type(v) is list:
-                        if not tab_data.get(key_tab_map[k]):
-                            tab_data[key_tab_map[k]] = []
-                        for item in v:
-                            tab_data[key_tab_map[k]].append(item)
-                else:
-                    if include_nested:
-                        if type(v) is dict or type(v) is list:
-                            for k2, v2 in v.items():
-                                _d[f'{k}_{k2}'] = v2
-                    elif type(v) is datetime.datetime:
-                        _d[k] = v.strftime('%Y-%m-%d %H:%M:%S')
-                    else:
-                        if type(v) is not dict and type(v) is not list:
-                            _d[k] = v
-
-        rows.append(list(_d.values()))
-
-    sheet.append_rows(rows)
-
-    if tab_data:
-        for k, v in tab_data.items():
-            write_data(client, v, k, append=append)
-
-    if not append:
-        # Apply currency formatting to columns specified in kwargs
-        cols = kwargs.get('currency_cols', [])
-        for col in cols:
-            gspread_formatting.format_cell_range(sheet, f'{col}:{col}', currency_format)
-
-        # Apply date formatting to columns specified in kwargs
-        cols = kwargs.get('date_cols', [])
-        for col in cols:
-            gspread_formatting.format_cell_range(sheet, f'{col}:{col}', date_format)
-
-        # Apply percentage formatting to columns specified in kwargs
-        cols = kwargs.get('percentage_cols', [])
-        for col in cols:
-            gspread_formatting.format_cell_range(sheet, f'{col}:{col}', percentage_format)
-
-        cols = kwargs.get('number_cols', [])
-        for col in cols:
-            gspread_formatting.format_cell_range(sheet, f'{col}:{col}', number_format)
-
-    return sheet
 
+def is_purchasing_sdf(directory, name):
+    """SDFs directly inside a *_purchasing work order folder"""
+    return name.lower().endswith('.sdf') and os.path.basename(directory).lower().endswith('_purchasing')
 
-def find_sdf_files(directory, limit=None):
-    sdf_files = []
-    count = 0
 
+def find_sdf_files(directory, limit=None):
     print(f"Searching {directory} for SDF files...")
-    for file in Path(directory).rglob("*_purchasing/*.sdf"):
-        if limit and count >= limit:
-            break
-        sdf_files.append(file)
-        count += 1
-        print(file)
-
-    # pattern = r"(?i)\(\d+-\d+\)*.*purchasing"
-    # for root, dirs, files in os.walk(directory):
-    #     for file in files:
-    #         if file.endswith(".sdf") and file == "MicrovellumWorkOrder.sdf":
-    #             work_order = os.path.split(root)[-1]
-    #             print(work_order)
-    #             if re.match(pattern, work_order):
-    #                 sdf_files.append(os.path.join(root, file))
-    #                 count += 1
+    stats = {}
+    sdf_files = sdf_discovery.find_files(directory, is_purchasing_sdf, snapshot_path=discovery_snapshot_path, stats=stats)
+    print(f"Found {stats['found']} SDF files ({stats['listed']} directories listed, {stats['reused']} unchanged)")
+    if limit:
+        sdf_files = sdf_files[:limit]
     return sdf_files
 
 
-class WorkOrder:
-    data = {}
+def connect_microvellum():
+    return pyodbc.connect(f'DRIVER=ODBC Driver 17 for SQL Server;SERVER={server};DATABASE={database};UID={username};PWD={password}')
+
+
+class ConnectionPool:
+    """Up to max_size reusable connections, shared between threads.
+
+    A connection that sat idle for more than check_after seconds runs
+    health_query before it is handed out and is replaced if that fails; one
+    that raised while checked out is closed instead of being reused.
+    """
+
+    def __init__(self, connect, max_size=4, check_after=30, health_query='Select 1'):
+        self.connect = connect
+        self.check_after = check_after
+        self.health_query = health_query
+        self.idle = []  # (connection, time returned)
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_size)
+
+    @contextlib.contextmanager
+    def connection(self):
+        with self.slots:
+            conn = self._checkout()
+            try:
+                yield conn
+            except Exception:
+                self._close(conn)
+                raise
+            with self.lock:
+                self.idle.append((conn, time.monotonic()))
+
+    def _checkout(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, returned = self.idle.pop()
+            if time.monotonic() - returned < self.check_after or self._healthy(conn):
+                return conn
+            self._close(conn)
+        return self.connect()
+
+    def _healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_query)
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+
+pool = ConnectionPool(connect_microvellum, pool_size, pool_check_after)
 
-    def __init__(self, file, client, separator='~'):
-        self.conn = pyodbc.connect(f'DRIVER=ODBC Driver 17 for SQL Server;SERVER={server};DATABASE={database};UID={username};PWD={password}')
-        self.cursor = self.conn.cursor()
+
+@contextlib.contextmanager
+def connection(conn=None):
+    """conn if one is given, otherwise a MicrovellumData connection from the pool"""
+    if conn is not None:
+        yield conn
+    else:
+        with pool.connection() as pooled:
+            yield pooled
+
+
+def work_order_rows(names, conn=None):
+    """Name and LinkID of the WorkOrders with the given names, keyed by lower-cased name"""
+    names = list(dict.fromkeys(names))
+    rows = {}
+    with connection(conn) as conn:
+        cursor = conn.cursor()
+        # SQL Server takes at most 2100 parameters per statement
+        for start in range(0, len(names), 1000):
+            chunk = names[start:start + 1000]
+            placeholders = ','.join('?' * len(chunk))
+            for row in fetch_dicts(cursor, f"Select Name, LinkID From WorkOrders WHERE Name In ({placeholders})", chunk):
+                rows.setdefault(row['Name'].lower(), row)
+    return rows
+
+
+class WorkOrder(workorder_db.WorkOrderReader):
+    def __init__(self, file, client, separator=sqlcecmd.SEPARATOR, lookup=True):
+        """Scrape the SDF at file.
+
+        With lookup=False the WorkOrders row isn't looked up here; pass it to
+        add_work_order_row later, e.g. from one work_order_rows call for many.
+        """
+        self.data = {}
 
         p = os.path.split(file)
         self.name = os.path.split(p[0])[-1]
-
-        self.cursor.execute(f"""
-            Select Name, LinkID From WorkOrders WHERE Name = '{self.name}'
-        """)
-        column_names = [column[0] for column in self.cursor.description]
-        rows = self.cursor.fetchall()
-        if len(rows) > 0:
-            self.data = dict(zip(column_names, rows[0]))
+        if lookup:
+            self.add_work_order_row(work_order_rows([self.name]).get(self.name.lower()))
 
         self.client = client
         self.date_created = datetime.datetime.fromtimestamp(os.path.getctime(p[0])).strftime('%Y-%m-%d %H:%M:%S')
-        self.full_path = file
-        self.separator = separator
 
         regex = r"(\d{5})\s*(.*)"
         match = re.search(regex, p[0])
@@ -266,123 +277,150 @@ class WorkOrder:
         self.data['BidName'] = self.bid_name
         self.data['DateCreated'] = self.date_created
 
-        batches = self.exec("SELECT * FROM WorkOrderBatches")
-        self.batches = self.parse_results(batches, keys=['Name', 'LinkID', 'WorkOrderID'])
+        # Read from the SQLite copy SDFtoSQL made of this work order when it
+        # is up to date, otherwise query the SDF itself with SqlCeCmd40. All
+        # of the work order's queries go out together - a single SqlCeCmd40
+        # launch when reading the SDF. Sheets are fetched for every batch and
+        # narrowed to the first batch once the batches are known.
+        self.open(file, separator)
+        try:
+            results = self.query_many({
+                'batches': "SELECT * FROM WorkOrderBatches",
+                'sheets': f"SELECT {(',').join(sheet_keys)} FROM PlacedSheets",
+                'subassemblies': f"SELECT {(',').join(subassembly_keys)} FROM Subassemblies",
+                'products': f"SELECT {(',').join(product_keys)} FROM Products",
+                # 'prompts': f"SELECT {(',').join(prompt_keys)} FROM Prompts",
+                'hardware': f"SELECT {(',').join(hardware_keys)} FROM Hardware",
+                'edgebanding': f"SELECT {(',').join(edgebanding_keys)} FROM Edgebanding",
+            })
+        finally:
+            self.close()
+
+        self.batches = [filter_keys(row, ['Name', 'LinkID', 'WorkOrderID']) for row in results['batches']]
         if self.batches:
             self.first_batch_id = self.batches[0]['LinkID']
-            self.runQuery("sheets", f"SELECT {(',').join(sheet_keys)} FROM PlacedSheets WHERE LinkIDWorkOrderBatch = '{self.first_batch_id}'")
+            self.tag_rows("sheets", [row for row in results['sheets'] if row.get('LinkIDWorkOrderBatch') == self.first_batch_id])
 
-        self.runQuery("subassemblies", f"SELECT {(',').join(subassembly_keys)} FROM Subassemblies")
-        self.runQuery("products", f"SELECT {(',').join(product_keys)} FROM Products")
-        # self.runQuery("prompts", f"SELECT {(',').join(prompt_keys)} FROM Prompts", filter_names=prompt_names)
-        self.runQuery("hardware", f"SELECT {(',').join(hardware_keys)} FROM Hardware")
-        self.runQuery("edgebanding", f"SELECT {(',').join(edgebanding_keys)} FROM Edgebanding")
+        for table_name in ('subassemblies', 'products', 'hardware', 'edgebanding'):
+            self.tag_rows(table_name, results[table_name])
 
-    def parse_results(self, query_string, keys=None, filter_names=None):
-        rows = []
-        try:
-            query_string = query_string.decode('utf-8')
-        except Exception:
-            query_string = query_string.decode('latin-1')
-
-        data = query_string.replace('/', '_').replace('\n\n', '').splitlines()
-        headers = data[0].split(self.separator)
-        del data[:2]
-        del data[len(data) - 2:]
-
-        # Converts output to dictionary with headers as keys
-        for index, row in enumerate(data):
-            d = dict(zip(headers, data[index].split(self.separator)))
-            if keys:
-                d = filter_keys(d, keys)
-
-            if filter_names:
-                try:
-                    if d['Name'] in filter_names:
-                        rows.append(d)
-                except Exception:
-                    pass
-            else:
-                rows.append(d)
-        return rows
+    def add_work_order_row(self, row):
+        """Put the WorkOrders row's Name and LinkID ahead of the scraped data"""
+        if row:
+            self.data = {**row, **self.data}
 
-    def exec(self, query):
-        out = subprocess.run(f'SqlCeCmd40.exe -d "Data Source={self.full_path}" -q "{query}" -W -s "{self.separator}"', capture_output=True)
-        if out.returncode:
-            raise Exception(str(out.stderr))
-        return out.stdout
+    def row_tags(self):
+        return {'BidID': self.bid_id, 'BidName': self.name, 'DateCreated': self.date_created}
 
-    def runQuery(self, table_name, query, keys=None, filter_names=None):
-        out = self.exec(query)
+    def dump_to_sheet(self, table_name, query, **kwargs):
+        data = self.runQuery(table_name, query, **kwargs)
+        return write_data(self.client, data, table_name, **kwargs)
 
-        # Write out variable to file
-        # with open(f"{table_name}.txt", 'a') as file:
-        #     file.write(str(out))
 
-        rows = self.parse_results(out, keys=keys, filter_names=filter_names)
+def scrape_work_orders(files, client, jobs=None):
+    """Build WorkOrders on a pool of threads, yielding (file, work_order, error) in the order of files.
 
-        for row in rows:
-            row['BidID'] = self.bid_id
-            row['BidName'] = self.name
-            row['DateCreated'] = self.date_created
+    Only a few work orders are queued ahead of the one being yielded, and a
+    failure is returned as the error for its file instead of stopping the rest.
+    The WorkOrders rows aren't looked up; see work_order_rows.
+    """
+    jobs = max(1, jobs or workers)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = collections.deque()
+        for file in files:
+            pending.append((file, executor.submit(WorkOrder, file, client, lookup=False)))
+            if len(pending) >= jobs * 2:
+                yield _scraped(*pending.popleft())
+        while pending:
+            yield _scraped(*pending.popleft())
 
-        if table_name:
-            self.data[table_name] = rows
 
-        return rows
+def _scraped(file, future):
+    try:
+        return file, future.result(), None
+    except Exception as e:
+        return file, None, e
 
-    def dump_to_sheet(self, table_name, query, **kwargs):
-        data = self.runQuery(table_name, query, **kwargs)
-        return write_data(self.client, data, table_name, **kwargs)
 
+@functools.lru_cache(maxsize=None)
+def project_bid_id(project_name):
+    """The bid number a project name starts with"""
+    try:
+        return int(re.search(r"^(\d+)", project_name).group(1))
+    except Exception:
+        return 'No ID Found'
 
-class PurchaseOrders:
-    data = {}
 
-    def __init__(self):
-        self.conn = pyodbc.connect(f'DRIVER=ODBC Driver 17 for SQL Server;SERVER={server};DATABASE={database};UID={username};PWD={password}')
-        self.cursor = self.conn.cursor()
-        self.query()
+def link_key(link_id):
+    """LinkIDs compare like SQL Server uniqueidentifiers, ignoring case"""
+    return str(link_id).lower() if link_id else None
+
 
-    def query(self):
-        self.cursor.execute("""
+def fetch_dicts(cursor, query, params=()):
+    cursor.execute(query, params)
+    column_names = [column[0] for column in cursor.description]
+    return [dict(zip(column_names, row)) for row in cursor]
+
+
+class PurchaseOrders:
+    """Every purchase order with its materials and project.
+
+    Loaded with one query each for purchase orders, purchased materials and
+    projects. Pass conn to read from another DB-API connection with the same
+    tables, such as a sqlite3 copy, and where (with its params) to load only
+    the purchase orders matching that condition.
+    """
+
+    def __init__(self, conn=None, where=None, params=()):
+        self.data = {}
+        with connection(conn) as conn:
+            self.query(conn.cursor(), where, params)
+
+    def query(self, cursor, where=None, params=()):
+        if where:
+            po_filter = f"Where {where}"
+            material_filter = f"Where LinkIDPurchaseOrder In (Select LinkID From PurchaseOrders Where {where})"
+        else:
+            params = ()
+            po_filter = ""
+            material_filter = "Where LinkIDPurchaseOrder Is Not Null"
+
+        po_rows = fetch_dicts(cursor, f"""
             Select Comments, Name, Type, LinkID, DateCreated, LinkIDProject, LinkIDUpdatingEmployee,
                 LinkIDVendor, ExpectedArrivalDate, PurchaseOrderNumber From PurchaseOrders
-        """)
-        column_names = [column[0] for column in self.cursor.description]
-        po_rows = self.cursor.fetchall()
-        for row in po_rows:
-            _d = dict(zip(column_names, row))
+            {po_filter}
+        """, params)
+
+        # Collect Purchased Items, grouped by purchase order
+        materials = collections.defaultdict(list)
+        for row in fetch_dicts(cursor, f"""
+            Select Cost, DateCreated, LinkID, LinkIDMaterial, LinkIDPart, LinkIDProduct,
+                LinkIDProject, LinkIDPurchaseOrder, LinkIDSheet, LinkIDWorkOrder, Name,
+                QuantityOrdered, QuantityReceived, Type, UnitType from PurchasedMaterial
+            {material_filter}
+        """, params):
+            materials[link_key(row['LinkIDPurchaseOrder'])].append(row)
+
+        # Projects that materials point at; a LinkID matching more than one
+        # project doesn't identify one
+        projects = {}
+        for row in fetch_dicts(cursor, f"""
+            Select LinkID, Name, DateCreated from Projects
+            Where LinkID In (Select LinkIDProject From PurchasedMaterial {material_filter})
+        """, params):
+            key = link_key(row['LinkID'])
+            projects[key] = None if key in projects else row
+
+        for _d in po_rows:
             _d['ProjectID'] = None
             _d['ProjectName'] = None
             _d['Materials'] = []
-            # Collect Purchased Items
-            self.cursor.execute(f"""
-                Select Cost, DateCreated, LinkID, LinkIDMaterial, LinkIDPart, LinkIDProduct,
-                    LinkIDProject, LinkIDPurchaseOrder, LinkIDSheet, LinkIDWorkOrder, Name,
-                    QuantityOrdered, QuantityReceived, Type, UnitType from PurchasedMaterial
-                Where LinkIDPurchaseOrder = '{_d['LinkID']}'
-            """)
-            material_column_names = [column[0] for column in self.cursor.description]
-            material_rows = self.cursor.fetchall()
-            for r2 in material_rows:
-                _d2 = dict(zip(material_column_names, r2))
+            for _d2 in materials.get(link_key(_d['LinkID']), []):
                 if _d2['LinkIDProject'] and not _d['ProjectID']:
-                    self.cursor.execute(f"""
-                        Select LinkID, Name, DateCreated from Projects
-                        Where LinkID = '{_d2['LinkIDProject']}'
-                    """)
-                    project_column_names = [column[0] for column in self.cursor.description]
-                    project_rows = self.cursor.fetchall()
-                    if len(project_rows) == 1:
-                        _d3 = dict(zip(project_column_names, project_rows[0]))
-                        regex = r"^(\d+)"
-                        try:
-                            match = int(re.search(regex, _d3['Name']).group(1))
-                        except Exception:
-                            match = 'No ID Found'
-                        _d['ProjectID'] = match
-                        _d['ProjectName'] = _d3['Name']
+                    project = projects.get(link_key(_d2['LinkIDProject']))
+                    if project:
+                        _d['ProjectID'] = project_bid_id(project['Name'])
+                        _d['ProjectName'] = project['Name']
 
                 _d2['BidID'] = _d['ProjectID']
                 _d2['BidName'] = _d['ProjectName']
@@ -391,44 +429,158 @@ class PurchaseOrders:
             self.data[_d['LinkID']] = _d
 
 
+def json_value(value):
+    """JSON form of the values pyodbc returns"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return str(value)
+
+
+def row_hash(row):
+    return hashlib.sha1(json.dumps(row, sort_keys=True, default=json_value).encode('utf-8')).hexdigest()
+
+
+def load_json(path):
+    try:
+        with open(path, 'r') as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_json(data, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as json_file:
+        json.dump(data, json_file, default=json_value)
+    os.replace(tmp_path, path)
+
+
+def queue_work_orders(sheets, work_orders):
+    """Add the WorkOrders rows of scraped work orders and queue them on a PublishQueue.
+
+    Rows a work order no longer has are deleted from every tab when it is synced.
+    """
+    # One query for the WorkOrders rows of the whole batch
+    rows = work_order_rows([wo.name for wo in work_orders])
+    for wo in work_orders:
+        wo.add_work_order_row(rows.get(wo.name.lower()))
+    sheets.sync([wo.data for wo in work_orders], 'WorkOrders', ['BidID'], key_tab_map=key_tab_map, tab_keys=tab_keys, replace='BidID')
+
+
+class PurchaseOrderSync:
+    """Bring the local purchase order snapshot up to date with SQL Server.
+
+    The first run, or full=True, loads everything. Later runs only read
+    purchase orders created since the watermark or still open (see
+    po_refresh_days) and compare them to the stored row hashes. added,
+    changed and removed list the LinkIDs that differ from the last sync.
+    """
+
+    def __init__(self, conn=None, full=False):
+        state = load_json(purchase_orders_state_path) or {}
+        self.data = load_json(purchase_orders_path) if state.get('watermark') and not full else None
+        self.full = self.data is None
+        hashes = {} if self.full else state.get('hashes', {})
+
+        with connection(conn) as conn:
+            if self.full:
+                po = PurchaseOrders(conn)
+                self.data = {}
+                self.removed = []
+            else:
+                cutoff = datetime.datetime.now() - datetime.timedelta(days=po_refresh_days)
+                since = min(datetime.datetime.fromisoformat(state['watermark']), cutoff)
+                po = PurchaseOrders(conn, where="""
+                    DateCreated >= ? Or LinkID In (
+                        Select LinkIDPurchaseOrder From PurchasedMaterial Where QuantityReceived < QuantityOrdered
+                    )
+                """, params=(since,))
+                # A key-only scan is enough to notice deleted purchase orders
+                cursor = conn.cursor()
+                cursor.execute("Select LinkID From PurchaseOrders")
+                current = {str(row[0]) for row in cursor}
+                self.removed = [link_id for link_id in self.data if link_id not in current]
+
+        self.added = []
+        self.changed = []
+        for link_id, row in po.data.items():
+            # Store rows as they read back from JSON so hashes and values match next run
+            row = json.loads(json.dumps(row, default=json_value))
+            link_id = str(link_id)
+            digest = row_hash(row)
+            if link_id not in hashes:
+                self.added.append(link_id)
+            elif hashes[link_id] != digest:
+                self.changed.append(link_id)
+            else:
+                continue
+            hashes[link_id] = digest
+            self.data[link_id] = row
+
+        for link_id in self.removed:
+            del self.data[link_id]
+            hashes.pop(link_id, None)
+
+        dates = [row['DateCreated'] for row in self.data.values() if row.get('DateCreated') not in (None, 'None')]
+        watermark = max(dates) if dates else state.get('watermark')
+        save_json(self.data, purchase_orders_path)
+        save_json({'watermark': watermark, 'hashes': hashes}, purchase_orders_state_path)
+
+    def publish(self, client):
+        """Bring the PurchaseOrders tabs in line with the snapshot, sending only the rows that differ"""
+        sheets = publisher(client)
+        sheets.sync(list(self.data.values()), 'PurchaseOrders', ['LinkID'],
+                    key_tab_map={'Materials': 'PurchaseOrderMaterials'},
+                    tab_keys={'PurchaseOrderMaterials': ['LinkID']})
+        sheets.delete_unseen(['PurchaseOrders', 'PurchaseOrderMaterials'])
+
+
 if __name__ == "__main__":
     work_orders = {}
     interval = 15
     count = 0
+    failed = []
     client = gspread.service_account_from_dict(GOOGLE_SHEETS_CREDENTIALS, client_factory=gspread.BackoffClient)
+    # Sheets updates go out on a background thread while scraping carries on
+    sheets = sheets_publisher.PublishQueue(publisher(client), max_rows=interval)
+
+    def flush():
+        if not work_orders:
+            return
+        wo_count = len(work_orders.keys())
+        print(f"Queueing {wo_count} work orders for Google Sheets...")
+        queue_work_orders(sheets, list(work_orders.values()))
+        work_orders.clear()
 
     sdf_files = find_sdf_files(directory)
-    for file in sdf_files:
+    print(f"Scraping {len(sdf_files)} work orders with {workers} workers...")
+    for file, wo, error in scrape_work_orders(sdf_files, client):
         count += 1
         progress = round(count / len(sdf_files) * 100, 1)
-        print(f"{progress}%: Processing {file}...")
-        wo = WorkOrder(file, client)
-        work_orders[wo.bid_id] = wo.data
+        if error:
+            print(f"{progress}%: Failed {file}: {error}")
+            failed.append(file)
+        else:
+            print(f"{progress}%: Processed {file}")
+            work_orders[wo.bid_id] = wo
 
         if count % interval == 0:
-            wo_count = len(work_orders.keys())
-            print(f"Writing {wo_count} work orders to Google Sheets...")
-            write_data(
-                client,
-                list(work_orders.values()),
-                'WorkOrders',
-                append=count > interval,
-                key_tab_map={
-                    'products': 'WO_Products',
-                    'hardware': 'WO_Hardware',
-                    'edgebanding': 'WO_Edgebanding',
-                    'sheets': 'WO_Sheets',
-                    'subassemblies': 'WO_Subassemblies',
-                }
-            )
-            work_orders = {}
-
-    po = PurchaseOrders()
-
-    with open('purchase_orders_data.json', 'w') as json_file:
-        json.dump(po.data, json_file, default=str)
-
-    # for d in po.data.values():
-    write_data(client, list(po.data.values()), 'PurchaseOrders',
-               key_tab_map={'Materials': 'PurchaseOrderMaterials'},
-               )
+            flush()
+    flush()
+
+    if failed:
+        # Their rows from the last run stay put rather than being deleted
+        print(f"{len(failed)} work orders failed, leaving rows of missing work orders in place:")
+        for file in failed:
+            print(f"  {file}")
+    else:
+        sheets.delete_unseen(['WorkOrders', *key_tab_map.values()])
+
+    # Read purchase orders while the queue drains
+    po = PurchaseOrderSync()
+    print(f"Purchase orders: {len(po.added)} new, {len(po.changed)} changed, {len(po.removed)} removed"
+          + (" (full load)" if po.full else ""))
+    pool.close()
+    print("Waiting for Google Sheets updates to finish...")
+    sheets.close()
+    po.publish(client)
@@ -0,0 +1,319 @@
+"""Benchmark SDFtoSQL's SQL-to-SQLite pipeline on synthetic SQL CE dumps.
+
+ExportSqlCe40.exe only runs on Windows, so this generates ExportSqlCe-style
+dumps from the table layouts in csv/ (column names from the header, column
+types guessed from the sample rows) and times each stage of the loader on
+them. Every phase runs in a fresh process so its peak RSS can be measured.
+
+    python bench_sdftosql.py --rows 20000 --tables Parts,Vectors --nastiness 2
+    python bench_sdftosql.py --compare bench_results/20240101-120000.json
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import datetime
+import tempfile
+import concurrent.futures
+import multiprocessing
+
+import SDFtoSQL
+
+
+CSV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "csv")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+
+# Strings mixed into text values at each nastiness level: 1 adds quotes and
+# semicolons, 2 adds everything else the statement splitter has to survive
+NASTY_STRINGS = {
+    0: [],
+    1: ["O'Brien", "a;b", "it''s", "';"],
+    2: ["O'Brien", "a;b", "it''s", "';", "line\nbreak", "-- not a comment", "\nGO\n",
+        "[bracket]", "\"dq\"", "Crème brûlée ✓", "tab\there", "0x00FF", "NULL"],
+}
+
+
+def fixture_tables():
+    """Names of the csv/ fixtures that have sample rows"""
+    tables = []
+    for file in sorted(os.listdir(CSV_DIR)):
+        name, ext = os.path.splitext(file)
+        if ext.lower() != '.csv' or name.lower() == 'tables':
+            continue
+        with open(os.path.join(CSV_DIR, file), newline='', encoding='utf-8', errors='replace') as f:
+            if sum(1 for _ in zip(range(2), f)) > 1:
+                tables.append(name)
+    return tables
+
+
+def infer_type(values):
+    """Guess a SQL Server CE column type from sample values"""
+    values = [v for v in values if v not in ('', 'NULL')]
+    if not values:
+        return 'nvarchar(100)'
+    if all(v in ('True', 'False') for v in values):
+        return 'bit'
+    if all(re.fullmatch(r'-?\d+', v) for v in values):
+        return 'int'
+    if all(re.fullmatch(r'-?\d+(\.\d+)?([eE][-+]?\d+)?', v) for v in values):
+        return 'float'
+    return 'nvarchar(255)'
+
+
+def load_fixture(table):
+    """Return ([(column, type)], sample rows) for a csv/ fixture"""
+    with open(os.path.join(CSV_DIR, f"{table}.csv"), newline='', encoding='utf-8', errors='replace') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = [row for row in reader if row]
+
+    columns = []
+    for index, name in enumerate(header):
+        if not name:
+            continue
+        sample = [row[index] for row in rows if index < len(row)]
+        columns.append((name, infer_type(sample), index))
+    samples = [[row[index] if index < len(row) else 'NULL' for _, _, index in columns] for row in rows]
+    return [(name, sql_type) for name, sql_type, _ in columns], samples
+
+
+def sql_literal(value, sql_type, nasty, rng):
+    if value == 'NULL' or (value == '' and sql_type != 'nvarchar(255)'):
+        return 'NULL'
+    if sql_type == 'bit':
+        return '1' if value == 'True' else '0'
+    if sql_type in ('int', 'float'):
+        return value
+    if nasty and rng.random() < 0.3:
+        value = value + rng.choice(nasty)
+    return "N'" + value.replace("'", "''") + "'"
+
+
+def write_dump(path, tables, rows, encoding='utf-16', nastiness=0, seed=0):
+    """Write an ExportSqlCe-style dump with `rows` rows per table.
+
+    Returns {table: rows written}.
+    """
+    rng = random.Random(seed)
+    nasty = NASTY_STRINGS[nastiness]
+    written = {}
+
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        f.write(f"-- Script Date: {datetime.datetime.now():%m/%d/%Y %H:%M}  - Generated by bench_sdftosql.py\n")
+        f.write("-- Synthetic dump; it's not real data\n")
+
+        fixtures = {table: load_fixture(table) for table in tables}
+        for table, (columns, _) in fixtures.items():
+            definitions = '\n, '.join(f"[{name}] {sql_type} NULL" for name, sql_type in columns)
+            f.write(f"CREATE TABLE [{table}] (\n  {definitions}\n);\nGO\n")
+
+        for table, (columns, samples) in fixtures.items():
+            column_list = ','.join(f"[{name}]" for name, _ in columns)
+            types = [sql_type for _, sql_type in columns]
+            for i in range(rows):
+                sample = samples[i % len(samples)]
+                values = ','.join(sql_literal(v, t, nasty, rng) for v, t in zip(sample, types))
+                f.write(f"INSERT INTO [{table}] ({column_list}) VALUES ({values});\nGO\n")
+            written[table] = rows
+
+    return written
+
+
+def phase_read(sql_file):
+    """Split the dump into statements"""
+    start = time.perf_counter()
+    statements = sum(1 for _ in SDFtoSQL.iter_sql_statements(sql_file))
+    return {'seconds': time.perf_counter() - start, 'statements': statements, 'peak_rss_mb': SDFtoSQL.peak_rss_mb()}
+
+
+def phase_parse(sql_file):
+    """Split the dump and tokenize every VALUES tuple, timed per table"""
+    tables = {}
+    start = time.perf_counter()
+    for statement in SDFtoSQL.iter_sql_statements(sql_file):
+        head = SDFtoSQL._INSERT_HEAD.match(statement)
+        if not head:
+            continue
+        t = time.perf_counter()
+        SDFtoSQL.parse_sql_values(statement, head.end())
+        stats = tables.setdefault(head.group(1), {'rows': 0, 'seconds': 0.0, 'chars': 0})
+        stats['seconds'] += time.perf_counter() - t
+        stats['rows'] += 1
+        stats['chars'] += len(statement)
+    for stats in tables.values():
+        stats['rows_per_sec'] = round(stats['rows'] / stats['seconds']) if stats['seconds'] else None
+        stats['mchars_per_sec'] = round(stats['chars'] / 1e6 / stats['seconds'], 2) if stats['seconds'] else None
+    return {'seconds': time.perf_counter() - start, 'tables': tables, 'peak_rss_mb': SDFtoSQL.peak_rss_mb()}
+
+
+def phase_load(sql_file, sqlite_path, **kwargs):
+    """Run the full sql_to_sqlite conversion, with each table's rates from the loader's own metrics.
+
+    Per-table rates count the table's decoded SQL text in characters, since
+    the dump's encoding decides how many bytes that was. The rows each table
+    ends up holding are counted too, for check_load.
+    """
+    metrics = {}
+    start = time.perf_counter()
+    ok = SDFtoSQL.sql_to_sqlite([sql_file], sqlite_path, metrics=metrics, **kwargs)
+    seconds = time.perf_counter() - start
+
+    stored = {}
+    if os.path.exists(sqlite_path):
+        conn = sqlite3.connect(sqlite_path)
+        for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"):
+            stored[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        conn.close()
+        os.remove(sqlite_path)
+
+    tables = {}
+    for table, stats in metrics.get('tables', {}).items():
+        table_seconds = stats['seconds']
+        tables[table] = {
+            'rows': stats['rows'],
+            'stored_rows': stored.get(table, 0),
+            'seconds': table_seconds,
+            'rows_per_sec': round(stats['rows'] / table_seconds) if table_seconds else None,
+            'mchars_per_sec': round(stats['sql_chars'] / 1e6 / table_seconds, 2) if table_seconds else None,
+        }
+    return {'ok': ok, 'seconds': seconds, 'tables': tables, 'failed_statements': metrics.get('failed_statements'),
+            'peak_rss_mb': SDFtoSQL.peak_rss_mb()}
+
+
+def check_load(result, written):
+    """Problems with a load phase: a failed load, or tables not holding the rows written"""
+    problems = []
+    if not result['ok']:
+        problems.append("sql_to_sqlite reported a failed load")
+    for table, rows in written.items():
+        stats = result['tables'].get(table, {})
+        if stats.get('rows') != rows or stats.get('stored_rows') != rows:
+            problems.append(f"{table}: wrote {rows} rows, loader inserted {stats.get('rows')}, "
+                            f"database holds {stats.get('stored_rows')}")
+    return problems
+
+
+def run_phase(function, *args, **kwargs):
+    """Run a phase in a fresh process so its peak RSS is its own"""
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                                initializer=_quiet_logging) as executor:
+        return executor.submit(function, *args, **kwargs).result()
+
+
+def _quiet_logging():
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def add_rates(result, dump_bytes, rows):
+    seconds = result['seconds']
+    result['seconds'] = round(seconds, 3)
+    result['mb_per_sec'] = round(dump_bytes / 1e6 / seconds, 2) if seconds else None
+    result['rows_per_sec'] = round(rows / seconds) if seconds else None
+    return result
+
+
+def compare(current, previous_path):
+    """Print each phase's time against an earlier results file"""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"Compared with {previous_path} ({previous.get('timestamp')}):")
+    for phase, result in current['phases'].items():
+        before = previous.get('phases', {}).get(phase)
+        if not before or not before.get('seconds'):
+            print(f"  {phase}: no previous result")
+            continue
+        change = (result['seconds'] - before['seconds']) / before['seconds'] * 100
+        print(f"  {phase}: {before['seconds']}s -> {result['seconds']}s ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark SDFtoSQL on synthetic SQL CE dumps")
+    parser.add_argument('--rows', type=int, default=5000, help="Rows generated per table (default: 5000)")
+    parser.add_argument('--tables', help="Comma-separated csv/ fixtures to use (default: all with data)")
+    parser.add_argument('--encoding', default='utf-16', help="Dump encoding (default: utf-16, as exported)")
+    parser.add_argument('--nastiness', type=int, choices=sorted(NASTY_STRINGS), default=1,
+                        help="How hostile text values are: 0 plain, 1 quotes/semicolons, 2 everything")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Results file (default: bench_results/<timestamp>.json)")
+    parser.add_argument('--compare', metavar='RESULTS', help="Earlier results file to compare against")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated dump")
+    args = parser.parse_args(argv)
+
+    tables = args.tables.split(',') if args.tables else fixture_tables()
+    work_dir = tempfile.mkdtemp(prefix='sdfbench_')
+    sql_file = os.path.join(work_dir, 'output.sql')
+
+    print(f"Generating {args.rows} rows for each of {len(tables)} tables ({args.encoding}, nastiness {args.nastiness})...")
+    start = time.perf_counter()
+    written = write_dump(sql_file, tables, args.rows, args.encoding, args.nastiness, args.seed)
+    generate_seconds = time.perf_counter() - start
+    dump_bytes = os.path.getsize(sql_file)
+    total_rows = sum(written.values())
+    print(f"  {dump_bytes / 1e6:.1f} MB, {total_rows} rows in {generate_seconds:.1f}s")
+
+    phases = {}
+    problems = []
+    sqlite_path = os.path.join(work_dir, 'bench.db')
+    for name, function, kwargs in (
+        ('read', phase_read, {}),
+        ('parse', phase_parse, {}),
+        ('load', phase_load, {'sqlite_path': sqlite_path}),
+        ('load_bulk', phase_load, {'sqlite_path': sqlite_path, 'bulk': True}),
+    ):
+        print(f"Running {name}...")
+        phases[name] = add_rates(run_phase(function, sql_file, **kwargs), dump_bytes, total_rows)
+        print(f"  {phases[name]['seconds']}s, {phases[name]['mb_per_sec']} MB/s, "
+              f"{phases[name]['rows_per_sec']} rows/s, peak RSS {phases[name]['peak_rss_mb']} MB")
+        if function is phase_load:
+            for table, stats in phases[name]['tables'].items():
+                print(f"    {table}: {stats['rows_per_sec']} rows/s, {stats['mchars_per_sec']} Mchars/s")
+            for problem in check_load(phases[name], written):
+                problems.append(f"{name}: {problem}")
+
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'settings': {
+            'rows': args.rows, 'tables': tables, 'encoding': args.encoding,
+            'nastiness': args.nastiness, 'seed': args.seed,
+        },
+        'dump': {'bytes': dump_bytes, 'rows': total_rows, 'generate_seconds': round(generate_seconds, 3)},
+        'phases': phases,
+        'problems': problems,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+    if args.keep:
+        print(f"Dump kept at {sql_file}")
+    else:
+        os.remove(sql_file)
+        os.rmdir(work_dir)
+
+    # Timings of a load that lost rows mean nothing, however fast
+    if problems:
+        print("Loaded rows don't match the dump:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
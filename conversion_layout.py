@@ -0,0 +1,32 @@
+"""Where SDFtoSQL writes its databases and manifest, and which converter wrote them.
+
+SDFtoSQL builds the databases and the scrapers read them through
+workorder_db, so both import these from here rather than keeping copies that
+could drift apart. Importing it has no side effects.
+"""
+import os
+
+
+OUTPUT_DIR = r"D:\My Documents\TEST\SQLFiles"
+MANIFEST_NAME = "_manifest.json"  # In OUTPUT_DIR
+
+# Bump whenever the conversion output changes (schema translation, loading
+# rules...) so the manifest treats every existing database as stale, and the
+# scrapers stop reading them until they are converted again
+CONVERTER_VERSION = 2
+
+
+def work_order_key(sdf_path):
+    """Name a work order by the folder its SDF lives in"""
+    return os.path.basename(os.path.dirname(sdf_path))
+
+
+def sqlite_path_for(sdf_path, output_dir=None):
+    """Path of the SQLite database built from sdf_path"""
+    parent_dir = work_order_key(sdf_path)
+    return os.path.join(output_dir or OUTPUT_DIR, parent_dir, f"{parent_dir}.db")
+
+
+def manifest_key(sdf_path):
+    """Key of an SDF's entry in the manifest"""
+    return os.path.normcase(os.path.abspath(sdf_path))
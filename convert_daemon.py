@@ -0,0 +1,328 @@
+"""Keep converted work orders current by watching the Work Orders library.
+
+Rather than waiting for the next full SDFtoSQL run, this watches SEARCH_DIR
+and, once a MicrovellumWorkOrder.sdf has had no writes for SETTLE_SECONDS,
+queues that one work order. A few worker threads take work orders off the
+queue, convert them with convert_sdf_to_sql (recording them in the
+manifest like SDFtoSQL.main does) and then run the scrapers that want them:
+Part Scraper for ordinary work orders, WorkOrderScraper for purchasing ones.
+
+Saving a work order again while it is queued doesn't queue it twice, and one
+saved while it is being converted is converted again afterwards. The queue
+is kept in QUEUE_PATH, so work orders queued or still running when the
+daemon stops are picked up when it starts again.
+
+    python convert_daemon.py --jobs 2 --scrapers parts workorders --scan
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+import collections
+import importlib.util
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+import SDFtoSQL
+import parts_store
+from debouncer import Debouncer
+
+
+WORK_ORDER_SDF = "MicrovellumWorkOrder.sdf"
+QUEUE_PATH = os.path.join(SDFtoSQL.OUTPUT_DIR, "_convert_queue.json")
+SETTLE_SECONDS = 15.0  # Quiet time after the last write before a work order is queued
+WATCH_JOBS = 2  # Work orders converted and scraped at once
+REPORT_SECONDS = 60.0  # How often the queue depth is logged while anything is queued
+
+PART_SCRAPER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Part Scraper.py")
+
+
+def queue_key(sdf_path):
+    return os.path.normcase(os.path.abspath(sdf_path))
+
+
+def is_work_order_sdf(path):
+    return os.path.basename(path).lower() == WORK_ORDER_SDF.lower()
+
+
+class ConversionQueue:
+    """Work orders waiting to be processed, worked through by `jobs` threads and saved to path"""
+
+    def __init__(self, process, path=None, jobs=WATCH_JOBS):
+        self.process = process
+        self.path = path or QUEUE_PATH
+        self.condition = threading.Condition()
+        self.waiting = collections.OrderedDict()  # key -> sdf path
+        self.running = {}  # key -> sdf path
+        self.coalesced = 0
+        self.done = 0
+        self.failed = 0
+        self.closing = False
+
+        # Whatever was queued or running when the last run stopped goes first
+        for sdf_path in self._load():
+            self.waiting.setdefault(queue_key(sdf_path), sdf_path)
+        if self.waiting:
+            logging.info(f"Resuming {len(self.waiting)} queued work orders from {self.path}")
+
+        self.threads = [threading.Thread(target=self._work, name=f"convert-{i}", daemon=True)
+                        for i in range(max(1, jobs))]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, sdf_path):
+        """Queue a work order; returns False if it was already waiting.
+
+        After close() work orders are still saved, to be processed on the next start.
+        """
+        key = queue_key(sdf_path)
+        with self.condition:
+            if key in self.waiting:
+                self.coalesced += 1
+                return False
+            # If it's running it waits here until that run finishes
+            self.waiting[key] = sdf_path
+            self._save()
+            self.condition.notify()
+        logging.info(f"Queued {sdf_path} ({self.depth()[0]} waiting)")
+        return True
+
+    def depth(self):
+        """(waiting, running)"""
+        with self.condition:
+            return len(self.waiting), len(self.running)
+
+    def close(self):
+        """Let the running work orders finish; waiting ones stay saved for the next start"""
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def _next(self):
+        for key, sdf_path in self.waiting.items():
+            if key not in self.running:
+                return key, sdf_path
+        return None
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.closing and self._next() is None:
+                    self.condition.wait()
+                if self.closing:
+                    return
+                key, sdf_path = self._next()
+                del self.waiting[key]
+                self.running[key] = sdf_path
+                self._save()
+
+            try:
+                ok = self.process(sdf_path)
+            except Exception as e:
+                logging.error(f"Error processing {sdf_path}: {e}")
+                ok = False
+
+            with self.condition:
+                del self.running[key]
+                if ok:
+                    self.done += 1
+                else:
+                    self.failed += 1
+                self._save()
+                self.condition.notify_all()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('queue', [])
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable queue {self.path}: {e}")
+            return []
+
+    def _save(self):
+        # Running work orders are saved too, so an interrupted one is redone
+        queue = list(self.running.values()) + [p for k, p in self.waiting.items() if k not in self.running]
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'queue': queue}, f, indent=1)
+        os.replace(temp_path, self.path)
+
+
+class WorkOrderHandler(FileSystemEventHandler):
+    """Queues a work order's SDF once it has gone settle seconds without an event"""
+
+    def __init__(self, queue, settle=SETTLE_SECONDS):
+        super().__init__()
+        self.queue = queue
+        self.debouncer = Debouncer(settle, name="settle")
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        # Saves may land as a rename onto the SDF
+        for path in (event.src_path, getattr(event, 'dest_path', None)):
+            if path and is_work_order_sdf(path):
+                self.debouncer.call(queue_key(path), self.settled, path)
+
+    def settled(self, sdf_path):
+        if os.path.exists(sdf_path):
+            self.queue.put(sdf_path)
+
+
+def part_scraper():
+    """A function scraping one ordinary work order to Part Scraper's output (JSON files or parts store)"""
+    spec = importlib.util.spec_from_file_location("part_scraper", PART_SCRAPER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    lock = threading.Lock()
+
+    def scrape(sdf_path):
+        if not module.is_work_order_sdf(os.path.dirname(sdf_path), os.path.basename(sdf_path)):
+            return
+        wo = module.WorkOrder(sdf_path)
+        if module.output != 'store':
+            module.write_json(sdf_path, wo.data)
+            return
+        # One writer at a time; the store's connection is opened per work order
+        # as SQLite connections can't be shared between the worker threads
+        with lock, parts_store.PartsStore(module.store_path) as store:
+            store.add(sdf_path, wo.data)
+    return scrape
+
+
+def work_order_scraper():
+    """A function scraping one purchasing work order to Google Sheets, and the queue to close on exit"""
+    import gspread
+    import sheets_publisher
+    import WorkOrderScraper
+
+    client = gspread.service_account_from_dict(WorkOrderScraper.GOOGLE_SHEETS_CREDENTIALS,
+                                               client_factory=gspread.BackoffClient)
+    sheets = sheets_publisher.PublishQueue(WorkOrderScraper.publisher(client))
+
+    def scrape(sdf_path):
+        if not WorkOrderScraper.is_purchasing_sdf(os.path.dirname(sdf_path), os.path.basename(sdf_path)):
+            return
+        wo = WorkOrderScraper.WorkOrder(sdf_path, client, lookup=False)
+        WorkOrderScraper.queue_work_orders(sheets, [wo])
+    return scrape, sheets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert and scrape Microvellum work orders as they are saved")
+    parser.add_argument('--jobs', type=int, default=WATCH_JOBS,
+                        help=f"Work orders processed at once (default: {WATCH_JOBS})")
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help=f"Seconds without writes before a saved work order is queued (default: {SETTLE_SECONDS})")
+    parser.add_argument('--scrapers', nargs='*', choices=('parts', 'workorders'), default=['parts', 'workorders'],
+                        help="Scrapers to run on each converted work order (default: both; none with no names)")
+    parser.add_argument('--scan', action='store_true',
+                        help="On start, also queue work orders the manifest says are out of date")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Load each database with an in-memory journal and fsync off, then ANALYZE it")
+    parser.add_argument('--warehouse', nargs='?', const=SDFtoSQL.WAREHOUSE_PATH, metavar='PATH',
+                        help="Also load every converted work order into one shared database "
+                             f"(default: {SDFtoSQL.WAREHOUSE_PATH})")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(SDFtoSQL.SEARCH_DIR):
+        logging.error(f"Search directory not found: {SDFtoSQL.SEARCH_DIR}")
+        return
+    SDFtoSQL.ensure_dir(SDFtoSQL.OUTPUT_DIR)
+
+    # Only for --scan; every save re-reads the manifest, as a full SDFtoSQL
+    # run may be saving to it too
+    files = SDFtoSQL.load_manifest()['files']
+    # The manifest and warehouse are shared by the workers
+    manifest_lock = threading.Lock()
+
+    scrapers = []
+    closers = []
+    if 'parts' in args.scrapers:
+        scrapers.append(('Part Scraper', part_scraper()))
+    if 'workorders' in args.scrapers:
+        scrape, sheets = work_order_scraper()
+        scrapers.append(('WorkOrderScraper', scrape))
+        closers.append(sheets.close)
+
+    def process(sdf_path):
+        try:
+            # Captured before converting, so a save that lands mid-conversion
+            # still leaves the manifest out of date
+            entry = SDFtoSQL.manifest_entry(sdf_path)
+        except OSError as e:
+            logging.warning(f"Could not stat {sdf_path}: {e}")
+            return False
+
+        ok, metrics = SDFtoSQL.convert_with_metrics(sdf_path, SDFtoSQL.OUTPUT_DIR, bulk=args.bulk,
+                                                    schema_cache_dir=SDFtoSQL.SCHEMA_CACHE_DIR)
+        if not ok:
+            return False
+
+        with manifest_lock:
+            SDFtoSQL.update_manifest({SDFtoSQL.manifest_key(sdf_path): entry})
+            if args.warehouse:
+                SDFtoSQL.load_into_warehouse(SDFtoSQL.sqlite_path_for(sdf_path, SDFtoSQL.OUTPUT_DIR),
+                                             SDFtoSQL.work_order_key(sdf_path), args.warehouse,
+                                             source_path=sdf_path)
+
+        for name, scrape in scrapers:
+            try:
+                scrape(sdf_path)
+            except Exception as e:
+                logging.error(f"{name} failed on {sdf_path}: {e}")
+                ok = False
+        logging.info(f"Processed {sdf_path} in {metrics['seconds']['total']}s")
+        return ok
+
+    queue = ConversionQueue(process, QUEUE_PATH, args.jobs)
+
+    if args.scan:
+        for sdf_path in SDFtoSQL.find_sdf_files(SDFtoSQL.SEARCH_DIR):
+            try:
+                if is_work_order_sdf(sdf_path) and not SDFtoSQL.is_up_to_date(
+                        files.get(SDFtoSQL.manifest_key(sdf_path)), sdf_path, SDFtoSQL.OUTPUT_DIR):
+                    queue.put(sdf_path)
+            except OSError as e:
+                logging.warning(f"Could not stat {sdf_path}: {e}")
+
+    handler = WorkOrderHandler(queue, args.settle)
+    observer = Observer()
+    observer.schedule(handler, SDFtoSQL.SEARCH_DIR, recursive=True)
+    observer.start()
+    logging.info(f"Watching {SDFtoSQL.SEARCH_DIR} with {args.jobs} job(s)")
+
+    last_report = None
+    reported = time.monotonic()
+    try:
+        while True:
+            time.sleep(1)
+            if time.monotonic() - reported < REPORT_SECONDS:
+                continue
+            reported = time.monotonic()
+            report = queue.depth() + (len(handler.debouncer),)
+            if any(report) or report != last_report:
+                logging.info(f"Queue: {report[0]} waiting, {report[1]} running, {report[2]} settling; "
+                             f"{queue.done} done, {queue.failed} failed, {queue.coalesced} repeat saves merged")
+            last_report = report
+    except KeyboardInterrupt:
+        observer.stop()
+
+    observer.join()
+    logging.info("Waiting for running work orders to finish...")
+    queue.close()
+    # Work orders still settling are saved in the queue for the next start
+    handler.debouncer.flush()
+    for close in closers:
+        close()
+
+
+if __name__ == "__main__":
+    main()
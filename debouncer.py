@@ -0,0 +1,111 @@
+"""Debounce calls per key on a single scheduler thread.
+
+A call made through a Debouncer is held until nothing else has been called
+with the same key for wait seconds, and then only the latest call for that
+key runs. With max_wait it runs at the latest max_wait seconds after the
+first held call, however busy the key is. Every Debouncer keeps one thread
+and a heap of due times, however many keys or calls it sees.
+
+    @debounce(0.5, max_wait=5, key=lambda path: path)
+    def changed(path):
+        ...
+"""
+import functools
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+
+class Debouncer:
+    def __init__(self, wait, max_wait=None, name="Debouncer"):
+        self.wait = wait
+        self.max_wait = max_wait
+        self.pending = {}  # key -> (seq, due, first call time, fn, args, kwargs)
+        self.heap = []  # (due, seq, key); entries whose seq isn't pending any more are skipped
+        self.seq = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def call(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once key has been quiet for wait seconds, unless called again"""
+        now = time.monotonic()
+        with self.condition:
+            held = self.pending.get(key)
+            first = held[2] if held else now
+            due = now + self.wait
+            if self.max_wait is not None:
+                due = min(due, first + self.max_wait)
+            seq = next(self.seq)
+            self.pending[key] = (seq, due, first, fn, args, kwargs)
+            heapq.heappush(self.heap, (due, seq, key))
+            if len(self.heap) > 2 * len(self.pending) + 64:
+                # Drop the entries of superseded calls before they pile up
+                self.heap = [(entry[1], entry[0], k) for k, entry in self.pending.items()]
+                heapq.heapify(self.heap)
+            self.condition.notify()
+
+    def cancel(self, key):
+        with self.condition:
+            return self.pending.pop(key, None) is not None
+
+    def flush(self):
+        """Run every held call now, in the calling thread"""
+        with self.condition:
+            held = list(self.pending.values())
+            self.pending.clear()
+            self.heap = []
+        for _, _, _, fn, args, kwargs in sorted(held, key=lambda entry: entry[1]):
+            self._run(fn, args, kwargs)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    due, seq, key = self.heap[0]
+                    held = self.pending.get(key)
+                    if held is None or held[0] != seq:
+                        heapq.heappop(self.heap)
+                        continue
+                    now = time.monotonic()
+                    if due > now:
+                        self.condition.wait(due - now)
+                        continue
+                    heapq.heappop(self.heap)
+                    del self.pending[key]
+                    break
+            self._run(*held[3:])
+
+    @staticmethod
+    def _run(fn, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            # One failing call mustn't stop the thread for every other key
+            traceback.print_exc()
+
+
+def debounce(wait, max_wait=None, key=None):
+    """Decorator that holds calls until wait seconds after the last one with the same key.
+
+    key(*args, **kwargs) gives a call's key; without it every call shares
+    one. The decorated function gets the Debouncer as .debouncer, so pending
+    calls can be flushed before exiting.
+    """
+    def decorator(fn):
+        debouncer = Debouncer(wait, max_wait, name=f"debounce {fn.__name__}")
+
+        @functools.wraps(fn)
+        def debounced(*args, **kwargs):
+            debouncer.call(key(*args, **kwargs) if key else None, fn, *args, **kwargs)
+        debounced.debouncer = debouncer
+        return debounced
+    return decorator
@@ -0,0 +1,171 @@
+"""In-process stand-in for a gspread client, for running the Sheets code offline.
+
+FakeClient keeps every spreadsheet in memory and applies the batch_update
+requests SheetsPublisher sends (addSheet, updateCells, appendDimension,
+appendCells, deleteDimension and repeatCell). Every API method counts its calls in
+client.calls, so the number of requests a flush costs can be checked:
+
+    client = fake_gspread.FakeClient()
+    publisher = SheetsPublisher(client, 'MicrovellumData')
+    ...
+    print(client.calls)
+"""
+import re
+import collections
+
+
+def cell_value(cell):
+    value = cell.get('userEnteredValue', {})
+    for kind in ('stringValue', 'numberValue', 'boolValue'):
+        if kind in value:
+            return value[kind]
+    return ''
+
+
+class FakeSheet:
+    def __init__(self, properties):
+        self.properties = properties
+        self.rows = []
+        self.formats = {}  # column index -> number format
+
+    @property
+    def title(self):
+        return self.properties['title']
+
+    def values(self):
+        """Rows as lists, with trailing empty cells and rows trimmed like the API does"""
+        rows = [list(row) for row in self.rows]
+        for row in rows:
+            while row and row[-1] in ('', None):
+                row.pop()
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, title):
+        self.client = client
+        self.title = title
+        self.sheets = []
+        self._next_id = 0
+
+    def _count(self, name):
+        self.client.calls[name] += 1
+
+    def sheet(self, title):
+        for sheet in self.sheets:
+            if sheet.title == title:
+                return sheet
+        raise KeyError(title)
+
+    def _sheet_by_id(self, sheet_id):
+        for sheet in self.sheets:
+            if sheet.properties['sheetId'] == sheet_id:
+                return sheet
+        raise KeyError(sheet_id)
+
+    def add_sheet(self, title, rows=100, cols=20, index=None):
+        properties = {'sheetId': self._next_id, 'title': title,
+                      'gridProperties': {'rowCount': rows, 'columnCount': cols}}
+        self._next_id += 1
+        sheet = FakeSheet(properties)
+        self.sheets.insert(len(self.sheets) if index is None else index, sheet)
+        for i, s in enumerate(self.sheets):
+            s.properties['index'] = i
+        return sheet
+
+    def fetch_sheet_metadata(self, params=None):
+        self._count('fetch_sheet_metadata')
+        return {'sheets': [{'properties': dict(sheet.properties, gridProperties=dict(sheet.properties['gridProperties']))}
+                           for sheet in self.sheets]}
+
+    def values_batch_get(self, ranges, params=None):
+        self._count('values_batch_get')
+        value_ranges = []
+        for a1 in ranges:
+            match = re.match(r"^'((?:[^']|'')*)'(?:!(\d+):(\d+))?$", a1)
+            title = match.group(1).replace("''", "'")
+            rows = self.sheet(title).values()
+            if match.group(2):
+                rows = rows[int(match.group(2)) - 1:int(match.group(3))]
+            value_range = {'range': a1}
+            if rows:
+                value_range['values'] = rows
+            value_ranges.append(value_range)
+        return {'valueRanges': value_ranges}
+
+    def batch_update(self, body):
+        self._count('batch_update')
+        replies = []
+        for request in body['requests']:
+            (kind, args), = request.items()
+            self.client.requests[kind] += 1
+            reply = {}
+            if kind == 'addSheet':
+                properties = args['properties']
+                grid = properties.get('gridProperties', {})
+                sheet = self.add_sheet(properties['title'], grid.get('rowCount', 1000),
+                                       grid.get('columnCount', 26), properties.get('index'))
+                reply = {'addSheet': {'properties': dict(sheet.properties)}}
+            elif kind == 'updateCells':
+                sheet = self._sheet_by_id(args['range']['sheetId'])
+                grid = sheet.properties['gridProperties']
+                if args['fields'] != 'userEnteredValue':
+                    raise NotImplementedError(request)
+                if len(args['range']) == 1:
+                    sheet.rows = []
+                else:
+                    start, end = args['range']['startRowIndex'], args['range']['endRowIndex']
+                    first, last = args['range']['startColumnIndex'], args['range']['endColumnIndex']
+                    if end > grid['rowCount'] or last > grid['columnCount']:
+                        raise ValueError(f"Range exceeds grid limits of {sheet.title}")
+                    while len(sheet.rows) < end:
+                        sheet.rows.append([])
+                    for row_index, row in zip(range(start, end), args['rows']):
+                        values = sheet.rows[row_index]
+                        values.extend([''] * (last - len(values)))
+                        for column, cell in zip(range(first, last), row['values']):
+                            values[column] = cell_value(cell)
+            elif kind == 'deleteDimension':
+                sheet = self._sheet_by_id(args['range']['sheetId'])
+                if args['range']['dimension'] != 'ROWS':
+                    raise NotImplementedError(request)
+                del sheet.rows[args['range']['startIndex']:args['range']['endIndex']]
+                sheet.properties['gridProperties']['rowCount'] -= args['range']['endIndex'] - args['range']['startIndex']
+            elif kind == 'appendDimension':
+                sheet = self._sheet_by_id(args['sheetId'])
+                key = 'columnCount' if args['dimension'] == 'COLUMNS' else 'rowCount'
+                sheet.properties['gridProperties'][key] += args['length']
+            elif kind == 'appendCells':
+                sheet = self._sheet_by_id(args['sheetId'])
+                grid = sheet.properties['gridProperties']
+                while sheet.rows and not any(v not in ('', None) for v in sheet.rows[-1]):
+                    sheet.rows.pop()
+                for row in args['rows']:
+                    values = [cell_value(cell) for cell in row.get('values', [])]
+                    if len(values) > grid['columnCount']:
+                        raise ValueError(f"Row of {len(values)} cells exceeds grid limits of {sheet.title}")
+                    sheet.rows.append(values)
+                grid['rowCount'] = max(grid['rowCount'], len(sheet.rows))
+            elif kind == 'repeatCell':
+                sheet = self._sheet_by_id(args['range']['sheetId'])
+                for index in range(args['range']['startColumnIndex'], args['range']['endColumnIndex']):
+                    sheet.formats[index] = args['cell']['userEnteredFormat']['numberFormat']
+            else:
+                raise NotImplementedError(kind)
+            replies.append(reply)
+        return {'spreadsheetId': self.title, 'replies': replies}
+
+
+class FakeClient:
+    def __init__(self):
+        self.spreadsheets = {}
+        self.calls = collections.Counter()     # API method -> calls
+        self.requests = collections.Counter()  # batch_update request kind -> count
+
+    def open(self, title):
+        self.calls['open'] += 1
+        if title not in self.spreadsheets:
+            self.spreadsheets[title] = FakeSpreadsheet(self, title)
+        return self.spreadsheets[title]
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Stand-in for SqlCeCmd40.exe that answers queries from a SQLite database.
+
+Accepts the arguments the scrapers pass (-d "Data Source=...", -q or -i,
+-W, -s) and prints results in SqlCeCmd40's format, so the SDF code paths
+can run off Windows. The data source must be a SQLite file, e.g. a
+database built by SDFtoSQL:
+
+    SQLCECMD_PATH=./fake_sqlcecmd.py python WorkOrderScraper.py
+"""
+import re
+import sys
+import sqlite3
+import argparse
+
+from sqlcecmd import format_value
+
+
+def print_result(cursor, separator):
+    out = sys.stdout
+    headers = [column[0] for column in cursor.description] if cursor.description else []
+    rows = cursor.fetchall()
+    out.write(separator.join(headers) + '\r\n')
+    out.write(separator.join('-' * len(header) for header in headers) + '\r\n')
+    for row in rows:
+        out.write(separator.join(format_value(value) for value in row) + '\r\n')
+    out.write('\r\n')
+    out.write(f"({len(rows)} rows affected)\r\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SqlCeCmd40.exe stand-in backed by SQLite")
+    parser.add_argument('-d', dest='connection', required=True)
+    parser.add_argument('-q', dest='query')
+    parser.add_argument('-i', dest='input_file')
+    parser.add_argument('-s', dest='separator', default=' ')
+    parser.add_argument('-W', dest='trim', action='store_true')
+    args = parser.parse_args(argv)
+    sys.stdout.reconfigure(newline='')  # Keep the \r\n line endings as written
+
+    match = re.search(r'Data Source\s*=\s*([^;]+)', args.connection, re.IGNORECASE)
+    if not match:
+        sys.exit(f"Bad connection string: {args.connection}")
+
+    if args.input_file:
+        with open(args.input_file, 'r', encoding='utf-8') as f:
+            script = f.read()
+        queries = [q.strip() for q in re.split(r'^\s*GO\s*$', script, flags=re.MULTILINE | re.IGNORECASE)]
+    else:
+        queries = [args.query or '']
+
+    conn = sqlite3.connect(match.group(1).strip())
+    try:
+        for query in queries:
+            if query:
+                print_result(conn.execute(query), args.separator)
+    except sqlite3.Error as e:
+        sys.stderr.write(f"{e}\n")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""One local SQLite store for everything Part Scraper collects.
+
+Each work order is kept under its SDF path with its BidID; every row of its
+parts, subassemblies, sheets, hardware and edgebanding is stored as compact
+JSON, indexed by table, BidID and path. PartsStore.rows streams rows back
+filtered on any of those, or on column values:
+
+    store = PartsStore('part_scraper.db')
+    for part in store.rows('parts', filters={'MaterialName': '3/4 Maple'}):
+        ...
+
+or from the command line:
+
+    python parts_store.py part_scraper.db parts --bid 16710 > parts.jsonl
+"""
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import datetime
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_orders (
+    path TEXT PRIMARY KEY,
+    bid_id INTEGER,
+    bid_name TEXT,
+    processed TEXT,
+    info TEXT,
+    tables TEXT
+);
+CREATE INDEX IF NOT EXISTS work_orders_bid ON work_orders (bid_id);
+CREATE TABLE IF NOT EXISTS rows (
+    path TEXT NOT NULL,
+    bid_id INTEGER,
+    table_name TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rows_table_bid ON rows (table_name, bid_id);
+CREATE INDEX IF NOT EXISTS rows_path ON rows (path);
+"""
+
+
+def store_key(path):
+    return os.path.normpath(str(path))
+
+
+def _json(value):
+    return json.dumps(value, separators=(',', ':'), default=str)
+
+
+class PartsStore:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def paths(self):
+        """SDF paths of every work order in the store"""
+        return {path for (path,) in self.conn.execute("SELECT path FROM work_orders")}
+
+    def __contains__(self, path):
+        return self.conn.execute("SELECT 1 FROM work_orders WHERE path = ?", (store_key(path),)).fetchone() is not None
+
+    def add(self, path, data):
+        """Store a work order's data (WorkOrder.data), replacing what was kept for path"""
+        key = store_key(path)
+        info = {k: v for k, v in data.items() if not isinstance(v, list)}
+        tables = [k for k, v in data.items() if isinstance(v, list)]
+        with self.conn:
+            self.conn.execute("DELETE FROM rows WHERE path = ?", (key,))
+            self.conn.execute("INSERT OR REPLACE INTO work_orders VALUES (?, ?, ?, ?, ?, ?)",
+                              (key, info.get('BidID'), info.get('BidName'),
+                               datetime.datetime.now().isoformat(timespec='seconds'), _json(info), _json(tables)))
+            self.conn.executemany(
+                "INSERT INTO rows VALUES (?, ?, ?, ?)",
+                ((key, info.get('BidID'), table_name, _json(row))
+                 for table_name in tables for row in data[table_name]))
+
+    def rows(self, table_name=None, bid_id=None, path=None, filters=None):
+        """Yield stored rows as dicts, optionally only those of one table, BidID or SDF path.
+
+        filters maps column names to the value they must have.
+        """
+        where = []
+        params = []
+        for column, value in (('table_name', table_name), ('bid_id', bid_id), ('path', path and store_key(path))):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        for column, value in (filters or {}).items():
+            where.append("json_extract(data, ?) = ?")
+            params += ['$."' + column.replace('"', '\\"') + '"', value]
+        query = "SELECT data FROM rows"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        for (data,) in self.conn.execute(query, params):
+            yield json.loads(data)
+
+    def work_order(self, path):
+        """A work order's data as Part Scraper collected it, or None"""
+        key = store_key(path)
+        row = self.conn.execute("SELECT info, tables FROM work_orders WHERE path = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        for table_name in json.loads(row[1]):
+            data[table_name] = []
+        for table_name, rowdata in self.conn.execute("SELECT table_name, data FROM rows WHERE path = ? ORDER BY rowid", (key,)):
+            data[table_name].append(json.loads(rowdata))
+        return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print rows from a Part Scraper store as JSON Lines")
+    parser.add_argument('store')
+    parser.add_argument('table', nargs='?', help="parts, subassemblies, sheets, hardware or edgebanding")
+    parser.add_argument('--bid', type=int, help="Only this BidID")
+    parser.add_argument('--path', help="Only the work order of this SDF")
+    parser.add_argument('--where', action='append', default=[], metavar='COLUMN=VALUE',
+                        help="Only rows where COLUMN is VALUE (repeatable)")
+    args = parser.parse_args(argv)
+
+    filters = dict(condition.split('=', 1) for condition in args.where)
+    with PartsStore(args.store) as store:
+        for row in store.rows(args.table, bid_id=args.bid, path=args.path, filters=filters):
+            sys.stdout.write(_json(row) + '\n')
+
+
+if __name__ == "__main__":
+    main()
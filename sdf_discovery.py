@@ -0,0 +1,117 @@
+"""Find files under a large directory tree, such as the Work Orders share.
+
+find_files walks the tree with os.scandir, giving each top-level
+subdirectory to its own thread, and skips directories that prune rejects
+without listing them. With a snapshot path it also saves every directory's
+mtime with the subdirectories and matching files found in it. A directory's
+mtime only changes when entries are added, removed or renamed in it, so on
+the next run an unchanged directory isn't listed again: its subdirectories
+are just checked with a stat each and its files come from the snapshot.
+
+Every caller should keep its own snapshot, as only the files its match
+accepted are saved.
+"""
+import os
+import json
+import concurrent.futures
+
+
+SNAPSHOT_VERSION = 1
+
+# Threads listing top-level subtrees at once
+DISCOVERY_JOBS = 8
+
+
+def load_snapshot(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return {}
+    return snapshot
+
+
+def save_snapshot(snapshot, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+class _Walker:
+    def __init__(self, match, prune, cached):
+        self.match = match
+        self.prune = prune
+        self.cached = cached
+        self.dirs = {}  # path -> [mtime_ns, subdir names, matching file names]
+        self.listed = 0
+        self.reused = 0
+
+    def list_dir(self, path, mtime=None):
+        """Subdirectories (with their mtime if known) and matching files of path"""
+        if mtime is None:
+            mtime = os.stat(path).st_mtime_ns
+        entry = self.cached.get(path)
+        if entry and entry[0] == mtime:
+            self.reused += 1
+            self.dirs[path] = entry
+            return [(name, None) for name in entry[1]], entry[2]
+
+        self.listed += 1
+        subdirs = []
+        files = []
+        with os.scandir(path) as it:
+            for item in it:
+                try:
+                    if item.is_dir(follow_symlinks=False):
+                        if not (self.prune and self.prune(item.name, item.path)):
+                            # On Windows the listing already carries the stat
+                            subdirs.append((item.name, item.stat(follow_symlinks=False).st_mtime_ns))
+                    elif self.match(path, item.name):
+                        files.append(item.name)
+                except OSError:
+                    continue
+        subdirs.sort()
+        files.sort()
+        self.dirs[path] = [mtime, [name for name, _ in subdirs], files]
+        return subdirs, files
+
+    def walk(self, path, mtime=None):
+        """Matching file paths under path, in sorted order"""
+        try:
+            subdirs, files = self.list_dir(path, mtime)
+        except OSError:
+            return []  # Gone, or not readable
+        found = [os.path.join(path, name) for name in files]
+        for name, sub_mtime in subdirs:
+            found += self.walk(os.path.join(path, name), sub_mtime)
+        return found
+
+
+def find_files(root, match, prune=None, snapshot_path=None, jobs=None, stats=None):
+    """Return the paths of files under root for which match(directory, name) is true.
+
+    prune(name, path), if given, is called for every subdirectory; return
+    True to skip it and everything below it. With snapshot_path, directories
+    that haven't changed since the saved snapshot aren't listed again. stats,
+    if given, is filled with how many directories were listed and reused.
+    """
+    root = os.path.abspath(root)
+    snapshot = load_snapshot(snapshot_path) if snapshot_path else {}
+    cached = snapshot.get('dirs', {}) if snapshot.get('root') == root else {}
+    walker = _Walker(match, prune, cached)
+
+    subdirs, files = walker.list_dir(root)
+    found = [os.path.join(root, name) for name in files]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs or DISCOVERY_JOBS)) as executor:
+        subtrees = [executor.submit(walker.walk, os.path.join(root, name), mtime) for name, mtime in subdirs]
+        for subtree in subtrees:
+            found += subtree.result()
+
+    if snapshot_path:
+        save_snapshot({'version': SNAPSHOT_VERSION, 'root': root, 'dirs': walker.dirs}, snapshot_path)
+    if stats is not None:
+        stats.update(listed=walker.listed, reused=walker.reused, found=len(found))
+    return found
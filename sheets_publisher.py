@@ -0,0 +1,657 @@
+"""Write scraped rows to Google Sheets with as few API calls as possible.
+
+SheetsPublisher opens the spreadsheet once and keeps each tab's sheet id and
+size from a single metadata fetch. write() only queues rows; flush() then
+checks every queued tab's header row with one values_batch_get and sends
+the clears, row appends and column formats for all of them in one
+batch_update (a second one first if tabs have to be created).
+
+sync() instead keeps tabs up to date in place: it indexes each tab's rows by
+key columns and a hash of their cells (read back once per publisher) and
+sends only the rows that were inserted or changed, so a tab never sits empty
+mid-run. delete_unseen() then removes the rows no sync() mentioned, and
+sync(replace=...) the rows a re-synced work order no longer has.
+
+It only needs the gspread client's open(), and the spreadsheet's
+fetch_sheet_metadata(), values_batch_get() and batch_update(), so
+fake_gspread.FakeClient can stand in for it.
+"""
+import json
+import time
+import queue
+import bisect
+import threading
+import hashlib
+import datetime
+import decimal
+import collections
+
+
+# Number formats applied by the <kind>_cols arguments of write()
+COLUMN_FORMATS = {
+    'currency_cols': {'type': 'CURRENCY', 'pattern': '"$"#,##0.00'},
+    'number_cols': {'type': 'NUMBER', 'pattern': '###0.00'},
+    'date_cols': {'type': 'DATE', 'pattern': 'yyyy-mm-dd'},
+    'percentage_cols': {'type': 'PERCENT', 'pattern': '0%'},
+}
+
+# Cells per batch_update; bigger flushes are split over several requests
+MAX_CELLS_PER_REQUEST = 100000
+
+# Sheets allows 60 requests per minute per user; stay at it rather than
+# running into quota errors and BackoffClient's sleeps
+REQUESTS_PER_MINUTE = 60
+
+# Size of a newly created tab
+NEW_SHEET_ROWS = 100
+NEW_SHEET_COLS = 20
+
+
+def column_index(letters):
+    """Zero-based index of a column letter such as 'C' or 'AB'"""
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def cell_data(value):
+    """Sheets CellData holding value as it would be written RAW"""
+    if value is None:
+        return {}
+    if isinstance(value, bool):
+        return {'userEnteredValue': {'boolValue': value}}
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return {'userEnteredValue': {'numberValue': float(value)}}
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+
+def row_dicts(data, tab_data, include_nested=False, exclude_keys=(), key_tab_map=None):
+    """The cells of each row of data as a dict, with datetimes formatted.
+
+    Lists under key_tab_map keys are moved to tab_data[<their tab>] instead.
+    """
+    key_tab_map = key_tab_map or {}
+    for d in data:
+        _d = {}
+        for k, v in d.items():
+            if k in exclude_keys:
+                continue
+            if k in key_tab_map:
+                if type(v) is list:
+                    tab_data.setdefault(key_tab_map[k], []).extend(v)
+            elif include_nested:
+                if type(v) is dict:
+                    for k2, v2 in v.items():
+                        _d[f'{k}_{k2}'] = v2
+            elif type(v) is datetime.datetime:
+                _d[k] = v.strftime('%Y-%m-%d %H:%M:%S')
+            elif type(v) is not dict and type(v) is not list:
+                _d[k] = v
+        yield _d
+
+
+def normal_value(value):
+    """A cell value as it reads back from Sheets unformatted"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return float(value)
+    return str(value)
+
+
+def row_hash(values):
+    values = [normal_value(value) for value in values]
+    while values and values[-1] == '':
+        values.pop()
+    return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+
+def a1_tab(tab):
+    return "'" + tab.replace("'", "''") + "'"
+
+
+class TabWrite:
+    """Everything queued for one tab until the next flush"""
+
+    def __init__(self, tab, index=None):
+        self.tab = tab
+        self.index = index
+        self.clear = False
+        self.headers = None
+        self.rows = []
+        self.formats = {}
+
+
+class TabIndex:
+    """Where each keyed row of a tab is and a hash of what it holds"""
+
+    def __init__(self, values, keys):
+        self.headers = list(values[0]) if values else []
+        self.keys = keys
+        self.rows = {}  # key -> [row index, hash]
+        self.count = len(values)  # Rows in use, header included
+        self.seen = set()
+        self.formatted = False
+        self.owners = {}  # key column -> {value: keys of the rows holding it}, built on first use
+
+        existing = collections.Counter()
+        for row_index, row in enumerate(values[1:], start=1):
+            base = self.base_key(dict(zip(self.headers, row)))
+            self.rows[base + (existing[base],)] = [row_index, row_hash(row)]
+            existing[base] += 1
+
+    def base_key(self, d):
+        return tuple(normal_value(d.get(k)) for k in self.keys)
+
+    def next_key(self, d, occurrences):
+        """Key for d; rows sharing key values are told apart by the order they come in.
+
+        occurrences counts the rows given each key so far, within one sync()
+        call, so syncing the same rows again gives them the same keys.
+        """
+        base = self.base_key(d)
+        key = base + (occurrences[base],)
+        occurrences[base] += 1
+        return key
+
+    def add(self, key, row_index, digest):
+        self.rows[key] = [row_index, digest]
+        for column, owned in self.owners.items():
+            owned.setdefault(key[self.keys.index(column)], set()).add(key)
+
+    def owned(self, column, value):
+        """Keys of the rows whose key column holds value"""
+        if column not in self.owners:
+            position = self.keys.index(column)
+            owned = self.owners[column] = {}
+            for key in self.rows:
+                owned.setdefault(key[position], set()).add(key)
+        return self.owners[column].get(normal_value(value), set())
+
+    def remove(self, keys):
+        """Drop the rows under keys, moving the rows below them up; returns their row indexes, sorted"""
+        doomed = sorted(self.rows.pop(key)[0] for key in keys)
+        for entry in self.rows.values():
+            entry[0] -= bisect.bisect_left(doomed, entry[0])
+        self.count -= len(doomed)
+        self.seen.difference_update(keys)
+        for column, owned in self.owners.items():
+            position = self.keys.index(column)
+            for key in keys:
+                owned.get(key[position], set()).discard(key)
+        return doomed
+
+
+class TokenBucket:
+    """Allows rate calls per period seconds, in bursts of up to capacity"""
+
+    def __init__(self, rate, period=60.0, capacity=None):
+        self.rate = rate / period
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is free; returns the seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class SheetsPublisher:
+    def __init__(self, client, spreadsheet_name, requests_per_minute=REQUESTS_PER_MINUTE):
+        self.limiter = TokenBucket(requests_per_minute) if requests_per_minute else None
+        if self.limiter:
+            self.limiter.acquire()
+        self.spreadsheet = client.open(spreadsheet_name)
+        self.sheets = None  # title -> sheet properties, fetched on first flush
+        self.pending = {}
+        self.indexes = {}  # title -> TabIndex, for tabs kept up to date with sync()
+
+    def _api(self, method, *args, **kwargs):
+        """Call a spreadsheet API method once the rate limit allows"""
+        if self.limiter:
+            self.limiter.acquire()
+        return getattr(self.spreadsheet, method)(*args, **kwargs)
+
+    def write(self, data, tab, **kwargs):
+        """Queue data (a dict or list of dicts) for tab; takes write_data's arguments"""
+        append = kwargs.get('append', False)
+        index = kwargs.get('index', None)
+        include_nested = kwargs.get('include_nested', False)
+        exclude_keys = kwargs.get('exclude_keys', [])
+        key_tab_map = kwargs.get('key_tab_map', {})
+        tab_data = {}
+
+        # Create and clear out tabs
+        for child_tab in key_tab_map.values():
+            self._pending(child_tab).clear |= not append
+
+        pending = self._pending(tab, index)
+        pending.clear |= not append
+
+        # If dictionary is passed in, convert to list
+        if isinstance(data, dict):
+            data = [data]
+        if not data:
+            return pending
+
+        if pending.headers is None:
+            headers = []
+            first = data[0]
+            for key in first.keys():
+                if key not in exclude_keys:
+                    if include_nested:
+                        if type(first[key]) is dict:
+                            for k in first[key].keys():
+                                headers.append(f'{key}_{k}')
+                    else:
+                        headers.append(key)
+            pending.headers = headers
+
+        for _d in row_dicts(data, tab_data, include_nested, exclude_keys, key_tab_map):
+            pending.rows.append(list(_d.values()))
+
+        for child_tab, rows in tab_data.items():
+            self.write(rows, child_tab, append=append)
+
+        if not append:
+            for kind in COLUMN_FORMATS:
+                for col in kwargs.get(kind, []):
+                    pending.formats[col] = COLUMN_FORMATS[kind]
+        return pending
+
+    def _pending(self, tab, index=None):
+        pending = self.pending.get(tab)
+        if pending is None:
+            pending = self.pending[tab] = TabWrite(tab, index)
+        return pending
+
+    def _load_sheets(self):
+        metadata = self._api('fetch_sheet_metadata')
+        self.sheets = {sheet['properties']['title']: sheet['properties'] for sheet in metadata.get('sheets', [])}
+
+    def _create_sheets(self, writes):
+        """Add the tabs that don't exist yet; returns the titles created"""
+        missing = [w for w in writes if w.tab not in self.sheets]
+        if not missing:
+            return set()
+        requests = []
+        for w in missing:
+            properties = {'title': w.tab, 'gridProperties': {'rowCount': NEW_SHEET_ROWS, 'columnCount': NEW_SHEET_COLS}}
+            if w.index is not None:
+                properties['index'] = w.index
+            requests.append({'addSheet': {'properties': properties}})
+        response = self._api('batch_update', {'requests': requests})
+        for reply in response.get('replies', []):
+            properties = reply['addSheet']['properties']
+            self.sheets[properties['title']] = properties
+        return {w.tab for w in missing}
+
+    def _has_header(self, writes):
+        """Tabs whose first row already has something in it"""
+        if not writes:
+            return set()
+        response = self._api('values_batch_get', [f"{a1_tab(w.tab)}!1:1" for w in writes])
+        found = set()
+        for w, value_range in zip(writes, response.get('valueRanges', [])):
+            if any(any(row) for row in value_range.get('values', [])):
+                found.add(w.tab)
+        return found
+
+    def flush(self):
+        """Send everything queued since the last flush"""
+        writes = list(self.pending.values())
+        self.pending = {}
+        if not writes:
+            return
+        if self.sheets is None:
+            self._load_sheets()
+
+        created = self._create_sheets(writes)
+        has_header = self._has_header([w for w in writes if not w.clear and w.tab not in created and w.rows])
+
+        requests = []
+        cells = 0
+        for w in writes:
+            properties = self.sheets[w.tab]
+            sheet_id = properties['sheetId']
+            grid = properties.setdefault('gridProperties', {})
+
+            if w.clear:
+                requests.append({'updateCells': {'range': {'sheetId': sheet_id}, 'fields': 'userEnteredValue'}})
+
+            rows = w.rows
+            if rows and w.tab not in has_header:
+                rows = [w.headers] + rows
+            width = max((len(row) for row in rows), default=0)
+            if width > grid.get('columnCount', 0):
+                requests.append({'appendDimension': {
+                    'sheetId': sheet_id, 'dimension': 'COLUMNS', 'length': width - grid.get('columnCount', 0)}})
+                grid['columnCount'] = width
+
+            step = max(1, MAX_CELLS_PER_REQUEST // max(width, 1))
+            for start in range(0, len(rows), step):
+                chunk = rows[start:start + step]
+                requests.append({'appendCells': {
+                    'sheetId': sheet_id,
+                    'rows': [{'values': [cell_data(value) for value in row]} for row in chunk],
+                    'fields': 'userEnteredValue',
+                }})
+                cells += len(chunk) * width
+                if cells >= MAX_CELLS_PER_REQUEST:
+                    self._api('batch_update', {'requests': requests})
+                    requests = []
+                    cells = 0
+
+            for col, number_format in w.formats.items():
+                index = column_index(col)
+                requests.append({'repeatCell': {
+                    'range': {'sheetId': sheet_id, 'startColumnIndex': index, 'endColumnIndex': index + 1},
+                    'cell': {'userEnteredFormat': {'numberFormat': number_format}},
+                    'fields': 'userEnteredFormat.numberFormat',
+                }})
+
+        if requests:
+            self._api('batch_update', {'requests': requests})
+
+    def sync(self, data, tab, keys, **kwargs):
+        """Bring tab's rows for data up to date, sending only inserted and changed rows.
+
+        Rows are matched on the keys columns; tab_keys gives the key columns of
+        each key_tab_map tab. Cells are written under the tab's existing
+        headers, and columns the tab doesn't have yet are added to it. Rows
+        that no sync() call has mentioned since the publisher was created are
+        only removed by delete_unseen().
+
+        With replace set to a column every tab is keyed on (e.g. 'BidID'), the
+        rows sharing a value of it with data that this call didn't write are
+        deleted, so a re-synced work order loses the rows it no longer has.
+        """
+        include_nested = kwargs.get('include_nested', False)
+        exclude_keys = kwargs.get('exclude_keys', [])
+        key_tab_map = kwargs.get('key_tab_map', {})
+        tab_keys = kwargs.get('tab_keys', {})
+        index = kwargs.get('index', None)
+        replace = kwargs.get('replace', None)
+
+        if isinstance(data, dict):
+            data = [data]
+        tab_data = {child_tab: [] for child_tab in key_tab_map.values()}
+        groups = {tab: (keys, list(row_dicts(data, tab_data, include_nested, exclude_keys, key_tab_map)))}
+        for child_tab, rows in tab_data.items():
+            groups[child_tab] = (tab_keys.get(child_tab, []), list(row_dicts(rows, {})))
+
+        self._prepare([TabWrite(t, index if t == tab else None) for t in groups], groups)
+
+        owners = {d.get(replace) for d in groups[tab][1]} if replace else ()
+        requests = []
+        for t, (t_keys, rows) in groups.items():
+            synced_requests, synced = self._sync_requests(t, rows)
+            requests += synced_requests
+            if replace in t_keys:
+                # After the updates, which are addressed by the row indexes before deleting
+                stale = set()
+                for owner in owners:
+                    stale |= self.indexes[t].owned(replace, owner)
+                requests += self._delete_requests(t, stale - synced)
+        formats = {col: COLUMN_FORMATS[kind] for kind in COLUMN_FORMATS for col in kwargs.get(kind, [])}
+        if formats and not self.indexes[tab].formatted:
+            requests += self._format_requests(tab, formats)
+            self.indexes[tab].formatted = True
+        self._send(requests)
+
+    def _prepare(self, writes, groups):
+        """Make sure the tabs exist and have an index, reading the ones not indexed yet in one call"""
+        if self.sheets is None:
+            self._load_sheets()
+        self._create_sheets(writes)
+        unindexed = [w.tab for w in writes if w.tab not in self.indexes]
+        if not unindexed:
+            return
+        response = self._api('values_batch_get', [a1_tab(t) for t in unindexed],
+                             params={'valueRenderOption': 'UNFORMATTED_VALUE'})
+        for t, value_range in zip(unindexed, response.get('valueRanges', [])):
+            self.indexes[t] = TabIndex(value_range.get('values', []), groups[t][0])
+
+    def _sync_requests(self, tab, rows):
+        index = self.indexes[tab]
+        properties = self.sheets[tab]
+        sheet_id = properties['sheetId']
+        grid = properties.setdefault('gridProperties', {})
+        requests = []
+
+        headers_before = len(index.headers)
+        for d in rows:
+            for k in d:
+                if k not in index.headers:
+                    index.headers.append(k)
+        changed = {}
+        if len(index.headers) != headers_before or (index.headers and index.count == 0):
+            changed[0] = index.headers
+            index.count = max(index.count, 1)
+
+        occurrences = collections.Counter()
+        synced = set()
+        for d in rows:
+            values = [d.get(h) for h in index.headers]
+            key = index.next_key(d, occurrences)
+            index.seen.add(key)
+            synced.add(key)
+            digest = row_hash(values)
+            if key in index.rows:
+                row_index, old = index.rows[key]
+                if old == digest:
+                    continue
+                index.rows[key][1] = digest
+            else:
+                row_index = index.count
+                index.count += 1
+                index.add(key, row_index, digest)
+            changed[row_index] = values
+
+        width = len(index.headers)
+        if width > grid.get('columnCount', 0):
+            requests.append({'appendDimension': {
+                'sheetId': sheet_id, 'dimension': 'COLUMNS', 'length': width - grid.get('columnCount', 0)}})
+            grid['columnCount'] = width
+        if index.count > grid.get('rowCount', 0):
+            requests.append({'appendDimension': {
+                'sheetId': sheet_id, 'dimension': 'ROWS', 'length': index.count - grid.get('rowCount', 0)}})
+            grid['rowCount'] = index.count
+
+        # One updateCells per run of consecutive rows, padded to the full
+        # width so cells a row no longer has are cleared
+        step = max(1, MAX_CELLS_PER_REQUEST // max(width, 1))
+        for run_start, run in _runs(sorted(changed.items())):
+            for offset in range(0, len(run), step):
+                start = run_start + offset
+                block = run[offset:offset + step]
+                requests.append({'updateCells': {
+                    'range': {'sheetId': sheet_id, 'startRowIndex': start, 'endRowIndex': start + len(block),
+                              'startColumnIndex': 0, 'endColumnIndex': width},
+                    'rows': [{'values': [cell_data(v) for v in values] + [{}] * (width - len(values))}
+                             for values in block],
+                    'fields': 'userEnteredValue',
+                }})
+        return requests, synced
+
+    def _send(self, requests):
+        """batch_update requests, split so no call carries much more than MAX_CELLS_PER_REQUEST cells"""
+        batch = []
+        cells = 0
+        for request in requests:
+            rows = request.get('updateCells', {}).get('rows', [])
+            size = sum(len(row['values']) for row in rows)
+            if batch and cells + size > MAX_CELLS_PER_REQUEST:
+                self._api('batch_update', {'requests': batch})
+                batch = []
+                cells = 0
+            batch.append(request)
+            cells += size
+        if batch:
+            self._api('batch_update', {'requests': batch})
+
+    def _format_requests(self, tab, formats):
+        sheet_id = self.sheets[tab]['sheetId']
+        requests = []
+        for col, number_format in formats.items():
+            index = column_index(col)
+            requests.append({'repeatCell': {
+                'range': {'sheetId': sheet_id, 'startColumnIndex': index, 'endColumnIndex': index + 1},
+                'cell': {'userEnteredFormat': {'numberFormat': number_format}},
+                'fields': 'userEnteredFormat.numberFormat',
+            }})
+        return requests
+
+    def _delete_requests(self, tab, keys):
+        """deleteDimension requests for the rows of tab under keys, which leave the index"""
+        doomed = self.indexes[tab].remove(keys)
+        if not doomed:
+            return []
+        sheet_id = self.sheets[tab]['sheetId']
+        requests = []
+        # Bottom up, so earlier deletions don't move the later ones
+        for start, block in reversed(list(_runs([(row_index, None) for row_index in doomed]))):
+            requests.append({'deleteDimension': {'range': {
+                'sheetId': sheet_id, 'dimension': 'ROWS', 'startIndex': start, 'endIndex': start + len(block)}}})
+        grid = self.sheets[tab].setdefault('gridProperties', {})
+        grid['rowCount'] = max(grid.get('rowCount', 0) - len(doomed), 1)
+        return requests
+
+    def delete_unseen(self, tabs=None):
+        """Delete the rows of synced tabs that no sync() call mentioned; returns rows deleted per tab"""
+        requests = []
+        deleted = {}
+        for tab in tabs or list(self.indexes):
+            index = self.indexes.get(tab)
+            if index is None:
+                continue
+            unseen = [key for key in index.rows if key not in index.seen]
+            if unseen:
+                requests += self._delete_requests(tab, unseen)
+                deleted[tab] = len(unseen)
+
+        self._send(requests)
+        return deleted
+
+
+def _runs(items):
+    """Group (row index, value) pairs into (first row index, [values]) runs of consecutive rows"""
+    start = None
+    block = []
+    for row_index, value in items:
+        if block and row_index != start + len(block):
+            yield start, block
+            block = []
+        if not block:
+            start = row_index
+        block.append(value)
+    if block:
+        yield start, block
+
+
+class PublishQueue:
+    """Run a SheetsPublisher's syncs on a background thread.
+
+    sync() queues its rows and returns at once. Consecutive syncs of the same
+    tab with the same arguments are merged into one, a row queued again under
+    the same keys (such as a re-saved work order) replacing the one waiting.
+    The merged sync is sent once
+    max_rows rows are waiting, the oldest has waited max_wait seconds, before
+    a delete_unseen(), or on close(). Use it as a context manager, or call
+    close(), to flush everything before exiting.
+    """
+
+    def __init__(self, publisher, max_rows=15, max_wait=60.0, max_queued=1000):
+        self.publisher = publisher
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.errors = []
+        self.queue = queue.Queue(max_queued)
+        self.thread = threading.Thread(target=self._run, name='PublishQueue', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def sync(self, data, tab, keys, **kwargs):
+        if isinstance(data, dict):
+            data = [data]
+        self.queue.put(('sync', (tab, tuple(keys), repr(sorted(kwargs.items()))), (tab, keys, kwargs), list(data)))
+
+    def delete_unseen(self, tabs=None):
+        """Queue a delete_unseen(); skipped if any sync failed, since the index may not match the sheet"""
+        self.queue.put(('delete_unseen', None, tabs, None))
+
+    def close(self):
+        """Send everything queued and stop the thread"""
+        if self.thread.is_alive():
+            self.queue.put(('stop', None, None, None))
+            self.thread.join()
+
+    def _run(self):
+        pending = {}  # group -> [(tab, keys, kwargs), {row key: row}]
+        rows = 0
+        oldest = None
+        while True:
+            timeout = None if oldest is None else max(0.0, oldest + self.max_wait - time.monotonic())
+            try:
+                kind, group, args, data = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                kind = 'timeout'
+
+            if kind == 'sync':
+                queued = pending.setdefault(group, [args, {}])[1]
+                keys = args[1]
+                for d in data:
+                    key = tuple(normal_value(d.get(k)) for k in keys) if keys else len(queued)
+                    if key not in queued:
+                        rows += 1
+                    queued[key] = d
+                if oldest is None:
+                    oldest = time.monotonic()
+                if rows < self.max_rows:
+                    continue
+
+            self._flush(pending)
+            pending = {}
+            rows = 0
+            oldest = None
+
+            if kind == 'delete_unseen':
+                if self.errors:
+                    print(f"Not deleting unseen rows after {len(self.errors)} failed Sheets syncs")
+                else:
+                    deleted = self._call(self.publisher.delete_unseen, args)
+                    if deleted:
+                        print(f"Removed rows no longer published: {deleted}")
+            elif kind == 'stop':
+                return
+
+    def _flush(self, pending):
+        for (tab, keys, kwargs), queued in pending.values():
+            self._call(self.publisher.sync, list(queued.values()), tab, keys, **kwargs)
+
+    def _call(self, function, *args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            print(f"Google Sheets update failed: {e}")
+            self.errors.append(e)
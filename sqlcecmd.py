@@ -0,0 +1,201 @@
+"""Run queries against SDF files with SqlCeCmd40.exe.
+
+Output is read from the tool a line at a time and parsed as it arrives:
+read_result turns one result set into a header tuple and a generator of row
+tuples, so large tables never have to sit in memory as one blob. stream_batch
+sends any number of queries through a single SqlCeCmd40 launch; call
+read_result once per query on the lines it yields.
+"""
+import os
+import re
+import logging
+import subprocess
+import tempfile
+
+
+# Set SQLCECMD_PATH to point at another build of the tool, or at a stand-in
+# such as fake_sqlcecmd.py when running off Windows
+SQLCECMD_PATH = os.environ.get('SQLCECMD_PATH', 'SqlCeCmd40.exe')
+
+# Column separator passed to the tool: the ASCII unit separator, which unlike
+# '~' never turns up in work order text
+SEPARATOR = '\x1f'
+
+# Last line of every result set, e.g. "(12 rows affected)"
+_ROWS_AFFECTED = re.compile(r'^\(\d+ rows? affected\)\s*$')
+
+
+def command(sdf_path, separator, *args):
+    return [SQLCECMD_PATH, '-d', f'Data Source={sdf_path}', *args, '-W', '-s', separator]
+
+
+def format_value(value):
+    """A value as SqlCeCmd40 prints it"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bytes):
+        return '0x' + value.hex().upper()
+    return str(value)
+
+
+def iter_lines(stream):
+    """Decode a binary stream line by line, without line endings"""
+    for raw in stream:
+        try:
+            line = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            line = raw.decode('latin-1')
+        yield line.rstrip('\r\n')
+
+
+def stream_output(args):
+    """Run the tool and yield its output lines as they are written"""
+    # stderr goes to a file so a chatty tool can't block on a full pipe
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=errors)
+        try:
+            yield from iter_lines(process.stdout)
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode:
+            errors.seek(0)
+            raise Exception(str(errors.read()))
+
+
+def stream_query(sdf_path, query, separator=SEPARATOR):
+    """Run one query and yield the tool's output lines"""
+    return stream_output(command(sdf_path, separator, '-q', query))
+
+
+def stream_batch(sdf_path, queries, separator=SEPARATOR):
+    """Run several queries with one tool launch and yield the output lines of all of them"""
+    fd, script_path = tempfile.mkstemp(suffix='.sqlce')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for query in queries:
+                f.write(f"{query.strip()}\nGO\n")
+        yield from stream_output(command(sdf_path, separator, '-i', script_path))
+    finally:
+        os.remove(script_path)
+
+
+def split_fields(text, separator, quote=None):
+    """Split a record on separator, optionally honouring quoted fields.
+
+    SqlCeCmd40 doesn't quote its output, and values often start with an inch
+    mark, so quote is off by default. With a quote character, a field is
+    quoted when it starts with it and the closing quote is followed by a
+    separator or the end of the record; doubled quotes inside it stand for
+    one. Returns (fields, complete), where complete is False if the text ends
+    inside a quoted field that may continue on the next line.
+    """
+    fields = []
+    pos = 0
+    while True:
+        if quote and text.startswith(quote, pos):
+            value = []
+            i = pos + 1
+            while True:
+                end = text.find(quote, i)
+                if end == -1:
+                    return fields, False
+                if not text.startswith(quote, end + 1):
+                    break
+                value.append(text[i:end + 1])
+                i = end + 2
+            after = end + 1
+            if after == len(text) or text.startswith(separator, after):
+                value.append(text[i:end])
+                fields.append(''.join(value))
+                if after == len(text):
+                    return fields, True
+                pos = after + len(separator)
+                continue
+            # Not a properly closed quoted field, so the quote is just data
+
+        end = text.find(separator, pos)
+        if end == -1:
+            fields.append(text[pos:])
+            return fields, True
+        fields.append(text[pos:end])
+        pos = end + len(separator)
+
+
+def _records(lines, separator, count, quote=None):
+    """Assemble output lines into lists of count fields, up to the result set's footer"""
+    pending = None
+    for line in lines:
+        if _ROWS_AFFECTED.match(line):
+            break
+        if pending is None:
+            if not line or (line.startswith('-') and not line.strip('-' + separator)):
+                continue  # The dashes under the header, or the blank line ahead of the footer
+            text = line
+        else:
+            text = pending + '\n' + line
+
+        fields, complete = split_fields(text, separator, quote)
+        if not complete or len(fields) < count:
+            pending = text
+            continue
+        pending = None
+        if len(fields) > count:
+            # A value held the separator, so there's no telling which
+            # column each field belongs to
+            logging.warning(f"Skipping a row with {len(fields)} fields instead of {count}: {text[:100]}")
+            continue
+        yield fields
+
+    if pending is None:
+        return
+    pending = pending.rstrip('\n')
+    fields, complete = split_fields(pending, separator, quote)
+    if not complete:
+        # A quote that never closed was data after all
+        yield from _records(pending.split('\n'), separator, count, quote=None)
+    elif pending:
+        fields += [''] * (count - len(fields))
+        yield fields
+
+
+def read_result(lines, separator=SEPARATOR, keys=None, filter_names=None, quote=None):
+    """Parse one result set from an iterator of output lines.
+
+    Returns (header, rows): the header is a tuple of column names and rows a
+    generator of value tuples in the same order, holding only the columns in
+    keys (all of them if keys is empty) and only rows whose Name is in
+    filter_names, if given. rows has to be consumed before the next result set
+    is read from the same lines.
+
+    Values with an embedded newline are reassembled by column count. As the
+    tool doesn't quote values, a row with a value containing the separator
+    can't be split reliably, so it is logged and skipped; the default
+    SEPARATOR keeps that from happening. Pass quote only for output that
+    really quotes its fields (see split_fields).
+    """
+    lines = iter(lines)
+    for line in lines:
+        if line.strip():
+            break
+    else:
+        raise Exception("No result set in SqlCeCmd40 output")
+
+    columns = split_fields(line, separator, quote)[0]
+    wanted = [i for i, column in enumerate(columns) if not keys or column in keys]
+    header = tuple(columns[i] for i in wanted)
+    name_index = columns.index('Name') if 'Name' in columns else None
+
+    def rows():
+        for fields in _records(lines, separator, len(columns), quote):
+            if filter_names and (name_index is None or fields[name_index] not in filter_names):
+                continue
+            yield tuple(fields[i] for i in wanted)
+
+    return header, rows()
+
+
+def read_dicts(lines, separator=SEPARATOR, keys=None, filter_names=None, quote=None):
+    """read_result, with the rows turned into dicts keyed by column"""
+    header, rows = read_result(lines, separator, keys=keys, filter_names=filter_names, quote=quote)
+    return [dict(zip(header, row)) for row in rows]
@@ -0,0 +1,281 @@
+import os
+import time
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import SDFtoSQL
+
+
+SAMPLE_SQL = (
+    'CREATE TABLE "Parts" ("ID" int NOT NULL, "Name" nvarchar(50));\n'
+    'INSERT INTO "Parts" ("ID", "Name") VALUES (1, N\'Door\');\n'
+    'INSERT INTO "Parts" ("ID", "Name") VALUES (2, N\'Shelf\');\n'
+)
+
+
+class InsertEngineBatchFailureTest(unittest.TestCase):
+    """A batch that fails partway is retried row by row without loading its first rows twice"""
+
+    def load(self, create_table):
+        conn = sqlite3.connect(':memory:')
+        cursor = conn.cursor()
+        cursor.execute(create_table)
+        engine = SDFtoSQL.InsertEngine(cursor, batch_size=100)
+        engine.add_table('Parts')
+        conn.execute("BEGIN TRANSACTION")
+        for i in range(5):
+            self.assertTrue(engine.add(f"INSERT INTO Parts (ID, Name) VALUES ({i}, 'Part {i}')"))
+        self.assertTrue(engine.add("INSERT INTO Parts (ID, Name) VALUES (5, NULL)"))
+        engine.flush()
+        conn.commit()
+        return conn, engine
+
+    def check(self, conn, engine):
+        rows = conn.execute('SELECT ID, Name FROM Parts ORDER BY ID').fetchall()
+        self.assertEqual(rows, [(i, f'Part {i}') for i in range(5)])
+        self.assertEqual(engine.rows_inserted, 5)
+        self.assertEqual(engine.table_rows, {'Parts': 5})
+        self.assertEqual(engine.failed, 1)
+
+    def test_table_without_key(self):
+        self.check(*self.load('CREATE TABLE Parts (ID INTEGER, Name TEXT NOT NULL)'))
+
+    def test_table_with_primary_key(self):
+        self.check(*self.load('CREATE TABLE Parts (ID INTEGER PRIMARY KEY, Name TEXT NOT NULL)'))
+
+    def test_bulk_load_pragmas(self):
+        # The savepoint rollback needs a journal, even in bulk mode
+        conn = sqlite3.connect(':memory:')
+        for pragma in SDFtoSQL.BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
+        conn.execute('CREATE TABLE Parts (ID INTEGER PRIMARY KEY, Name TEXT NOT NULL)')
+        engine = SDFtoSQL.InsertEngine(conn.cursor(), batch_size=100)
+        engine.add_table('Parts')
+        conn.execute("BEGIN TRANSACTION")
+        for i in range(5):
+            engine.add(f"INSERT INTO Parts (ID, Name) VALUES ({i}, 'Part {i}')")
+        engine.add("INSERT INTO Parts (ID, Name) VALUES (5, NULL)")
+        engine.flush()
+        conn.commit()
+        self.check(conn, engine)
+
+
+class LoadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.sql_file = os.path.join(self.dir.name, 'output.sql')
+        with open(self.sql_file, 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_SQL)
+        self.sqlite_path = os.path.join(self.dir.name, 'work_order.db')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def count(self):
+        conn = sqlite3.connect(self.sqlite_path)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM Parts').fetchone()[0]
+        finally:
+            conn.close()
+
+
+class BulkLoadTest(LoadTestCase):
+    """A bulk build only replaces the existing database once it has finished"""
+
+    def check_failed_rebuild(self, vacuum):
+        SDFtoSQL.sql_to_sqlite([self.sql_file], self.sqlite_path, bulk=True, vacuum=vacuum)
+        self.assertEqual(self.count(), 2)
+        with mock.patch.object(SDFtoSQL, 'finish_bulk_load', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                SDFtoSQL.sql_to_sqlite([self.sql_file], self.sqlite_path, bulk=True, vacuum=vacuum)
+        self.assertEqual(self.count(), 2)
+        SDFtoSQL.sql_to_sqlite([self.sql_file], self.sqlite_path, bulk=True, vacuum=vacuum)
+        self.assertEqual(self.count(), 2)
+
+    def test_failed_rebuild_keeps_database(self):
+        self.check_failed_rebuild(vacuum=False)
+
+    def test_failed_vacuum_rebuild_keeps_database(self):
+        self.check_failed_rebuild(vacuum=True)
+
+    def test_failed_vacuum_keeps_database(self):
+        SDFtoSQL.sql_to_sqlite([self.sql_file], self.sqlite_path, bulk=True, vacuum=True)
+        finish = SDFtoSQL.finish_bulk_load
+
+        def finish_busy(conn, *args, **kwargs):
+            # A statement still stepping through its rows makes the VACUUM fail
+            cursor = conn.execute('SELECT * FROM Parts')
+            cursor.fetchone()
+            finish(conn, *args, **kwargs)
+
+        with mock.patch.object(SDFtoSQL, 'finish_bulk_load', finish_busy):
+            with self.assertRaises(sqlite3.OperationalError):
+                SDFtoSQL.sql_to_sqlite([self.sql_file], self.sqlite_path, bulk=True, vacuum=True)
+        self.assertEqual(self.count(), 2)
+        # Neither the build nor the vacuum target is left behind
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ['output.sql', 'work_order.db'])
+
+
+class BuildPathTest(LoadTestCase):
+    """Every build goes to a temp path, and one that fails leaves the old database"""
+
+    def test_build_moves_into_place(self):
+        flush = SDFtoSQL.InsertEngine.flush
+
+        def check_and_flush(engine):
+            # Nothing is at the final path while the rows are loading
+            self.assertFalse(os.path.exists(self.sqlite_path))
+            flush(engine)
+
+        with mock.patch.object(SDFtoSQL.InsertEngine, 'flush', check_and_flush):
+            self.assertTrue(SDFtoSQL.sql_to_sqlite([self.sql_file], self.sqlite_path))
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ['output.sql', 'work_order.db'])
+
+    def test_failed_file_keeps_database(self):
+        SDFtoSQL.sql_to_sqlite([self.sql_file], self.sqlite_path)
+        broken = os.path.join(self.dir.name, 'output_2.sql')
+        with open(broken, 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_SQL.replace("N'Shelf'", "N'Top'"))
+        for bulk in (False, True):
+            with mock.patch.object(SDFtoSQL, 'iter_sql_statements', side_effect=OSError('unreadable')):
+                self.assertFalse(SDFtoSQL.sql_to_sqlite([self.sql_file, broken], self.sqlite_path, bulk=bulk))
+            self.assertEqual(self.count(), 2)
+            self.assertEqual(sorted(os.listdir(self.dir.name)), ['output.sql', 'output_2.sql', 'work_order.db'])
+
+    def test_build_files_are_unique(self):
+        paths = []
+        connect = sqlite3.connect
+
+        def record_connect(path, *args, **kwargs):
+            paths.append(path)
+            return connect(path, *args, **kwargs)
+
+        with mock.patch.object(SDFtoSQL.sqlite3, 'connect', record_connect):
+            SDFtoSQL.sql_to_sqlite([self.sql_file], self.sqlite_path)
+            SDFtoSQL.sql_to_sqlite([self.sql_file], self.sqlite_path)
+        builds = [path for path in paths if path.endswith('.building')]
+        self.assertEqual(len(set(builds)), 2)
+
+
+class SchemaCacheTest(unittest.TestCase):
+    def test_template_in_use_is_kept(self):
+        # Windows refuses to replace a template another worker has open
+        with tempfile.TemporaryDirectory() as cache_dir:
+            template = os.path.join(cache_dir, 'template.db')
+            built = os.path.join(cache_dir, 'built.db')
+            for path in (template, built):
+                with open(path, 'w') as f:
+                    f.write(path)
+            with mock.patch('os.replace', side_effect=PermissionError('in use')):
+                SDFtoSQL._publish_cache_file(built, template)
+            self.assertEqual(os.listdir(cache_dir), ['template.db'])
+            with mock.patch('os.replace', side_effect=PermissionError('in use')):
+                with self.assertRaises(PermissionError):
+                    SDFtoSQL._publish_cache_file(template, os.path.join(cache_dir, 'missing.db'))
+
+
+class ColumnarTest(unittest.TestCase):
+    @unittest.skipIf(SDFtoSQL.numpy is None, "numpy is not installed")
+    def test_npz_round_trip(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            sqlite_path = os.path.join(work_dir, 'work_order.db')
+            conn = sqlite3.connect(sqlite_path)
+            conn.execute('CREATE TABLE Parts (ID INTEGER, Qty INTEGER, Width REAL, Name TEXT, Image BLOB)')
+            conn.executemany('INSERT INTO Parts VALUES (?, ?, ?, ?, ?)', [
+                (1, 2, 12.5, 'Door', b'\x01\x02'),
+                (2, 2.5, None, None, None),
+                (3, None, 30.0, 'Shelf', b''),
+            ])
+            conn.commit()
+            conn.close()
+
+            out_dir = os.path.join(work_dir, 'columnar')
+            with mock.patch.object(SDFtoSQL, 'pyarrow', None):
+                self.assertEqual(SDFtoSQL.export_columnar(sqlite_path, out_dir), [os.path.join(out_dir, 'Parts.npz')])
+            columns = SDFtoSQL.load_columnar(out_dir, 'Parts')
+            only_name = SDFtoSQL.load_columnar(out_dir, 'Parts', columns=['Name'])
+
+        self.assertEqual(list(columns), ['ID', 'Qty', 'Width', 'Name', 'Image'])
+        self.assertEqual(columns['ID'].dtype, SDFtoSQL.numpy.int64)
+        self.assertEqual(columns['ID'].tolist(), [1, 2, 3])
+        # 2.5 stays 2.5 rather than being truncated to fit an integer column
+        self.assertEqual(columns['Qty'].tolist(), [2.0, 2.5, None])
+        self.assertEqual(columns['Width'].tolist(), [12.5, None, 30.0])
+        self.assertEqual(columns['Name'].tolist(), ['Door', None, 'Shelf'])
+        self.assertEqual(columns['Image'].tolist(), ['0102', None, ''])
+        self.assertEqual(list(only_name), ['Name'])
+
+    def test_parquet_without_pyarrow(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            open(os.path.join(out_dir, 'Parts.parquet'), 'wb').close()
+            with mock.patch.object(SDFtoSQL, 'pyarrow', None):
+                with self.assertRaisesRegex(ImportError, 'pyarrow'):
+                    SDFtoSQL.load_columnar(out_dir, 'Parts')
+
+
+class ManifestTest(unittest.TestCase):
+    def test_missing_output_is_out_of_date(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            sdf_path = os.path.join(work_dir, '12345', 'MicrovellumWorkOrder.sdf')
+            output_dir = os.path.join(work_dir, 'SQLFiles')
+            sqlite_path = SDFtoSQL.sqlite_path_for(sdf_path, output_dir)
+            for path in (sdf_path, sqlite_path):
+                os.makedirs(os.path.dirname(path))
+                open(path, 'wb').close()
+
+            entry = SDFtoSQL.manifest_entry(sdf_path)
+            self.assertTrue(SDFtoSQL.is_up_to_date(entry, sdf_path, output_dir))
+            # Converted without --columnar, so a --columnar run converts it again
+            self.assertFalse(SDFtoSQL.is_up_to_date(entry, sdf_path, output_dir, outputs=('columnar',)))
+
+            entry = SDFtoSQL.manifest_entry(sdf_path, outputs=('columnar',))
+            self.assertFalse(SDFtoSQL.is_up_to_date(entry, sdf_path, output_dir, outputs=('columnar',)))
+            os.mkdir(os.path.join(os.path.dirname(sqlite_path), SDFtoSQL.COLUMNAR_DIR_NAME))
+            self.assertTrue(SDFtoSQL.is_up_to_date(entry, sdf_path, output_dir, outputs=('columnar',)))
+            self.assertTrue(SDFtoSQL.is_up_to_date(entry, sdf_path, output_dir))
+
+    def test_update_keeps_other_entries(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            path = os.path.join(work_dir, '_manifest.json')
+            stale = SDFtoSQL.load_manifest(path)
+            SDFtoSQL.update_manifest({'a': {'size': 1}}, path)
+            # Another process's temp name mustn't matter either
+            os.mkdir(path + '.tmp')
+            SDFtoSQL.update_manifest({'b': {'size': 2}}, path)
+            self.assertEqual(stale, {'files': {}})
+            self.assertEqual(SDFtoSQL.load_manifest(path)['files'], {'a': {'size': 1}, 'b': {'size': 2}})
+            self.assertEqual(sorted(os.listdir(work_dir)), ['_manifest.json', '_manifest.json.tmp'])
+
+
+def fake_convert(sdf_path, output_dir, **kwargs):
+    """Stands in for convert_with_metrics, logging when each conversion ran"""
+    started = time.time()
+    time.sleep(0.2)
+    with open(os.path.join(output_dir, 'runs.log'), 'a', encoding='utf-8') as f:
+        f.write(f"{sdf_path}\t{started}\t{time.time()}\n")
+    return True, {'work_order': SDFtoSQL.work_order_key(sdf_path)}
+
+
+class ConvertAllTest(unittest.TestCase):
+    def test_same_database_not_converted_at_once(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            sdf_files = [os.path.join(library, name, 'MicrovellumWorkOrder.sdf')
+                         for library in ('A', 'B') for name in ('12345', '67890')]
+            with mock.patch.object(SDFtoSQL, 'convert_with_metrics', fake_convert):
+                self.assertEqual(SDFtoSQL.convert_all(sdf_files, output_dir, jobs=4), [])
+            with open(os.path.join(output_dir, 'runs.log'), encoding='utf-8') as f:
+                runs = [line.split('\t') for line in f.read().splitlines()]
+
+        self.assertEqual(sorted(run[0] for run in runs), sorted(sdf_files))
+        by_key = {}
+        for sdf_path, started, finished in runs:
+            by_key.setdefault(SDFtoSQL.work_order_key(sdf_path), []).append((float(started), float(finished)))
+        for (first, second) in (sorted(times) for times in by_key.values()):
+            self.assertLessEqual(first[1], second[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+import fake_gspread
+import sheets_publisher
+
+
+KEY_TAB_MAP = {'hardware': 'WO_Hardware', 'products': 'WO_Products'}
+TAB_KEYS = {'WO_Hardware': ['BidID'], 'WO_Products': ['BidID', 'LinkID']}
+
+
+def work_order(bid_id, count=3, name=None):
+    return {
+        'BidID': bid_id,
+        'Name': name or f'WO {bid_id}',
+        'hardware': [{'BidID': bid_id, 'Name': f'Hinge {i}'} for i in range(count)],
+        'products': [{'BidID': bid_id, 'LinkID': f'L{i}', 'Qty': i} for i in range(count)],
+    }
+
+
+class WriteTest(unittest.TestCase):
+    def test_api_calls_per_flush(self):
+        client = fake_gspread.FakeClient()
+        publisher = sheets_publisher.SheetsPublisher(client, 'MicrovellumData')
+
+        # One batch_update adds the three tabs, and one more fills and formats them
+        publisher.write([work_order(1), work_order(2)], 'WorkOrders', key_tab_map=KEY_TAB_MAP, number_cols=['A'])
+        publisher.flush()
+        self.assertEqual(client.calls, {'open': 1, 'fetch_sheet_metadata': 1, 'batch_update': 2})
+
+        # An append checks the three tabs' headers in one read and writes in one batch_update
+        client.calls.clear()
+        publisher.write([work_order(3)], 'WorkOrders', append=True, key_tab_map=KEY_TAB_MAP)
+        publisher.flush()
+        self.assertEqual(client.calls, {'values_batch_get': 1, 'batch_update': 1})
+
+        spreadsheet = client.spreadsheets['MicrovellumData']
+        self.assertEqual(len(spreadsheet.sheet('WorkOrders').values()), 4)
+        self.assertEqual(len(spreadsheet.sheet('WO_Hardware').values()), 10)
+
+
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        self.client = fake_gspread.FakeClient()
+        self.publisher = sheets_publisher.SheetsPublisher(self.client, 'MicrovellumData')
+
+    def sync(self, data, **kwargs):
+        self.publisher.sync(data, 'WorkOrders', ['BidID'], key_tab_map=KEY_TAB_MAP, tab_keys=TAB_KEYS, **kwargs)
+
+    def rows(self, tab):
+        return self.client.spreadsheets['MicrovellumData'].sheet(tab).values()[1:]
+
+    def test_resync_updates_in_place(self):
+        self.sync([work_order(1), work_order(2)])
+        self.sync([work_order(1, name='Renamed')])
+        self.assertEqual(len(self.rows('WorkOrders')), 2)
+        self.assertEqual(self.rows('WorkOrders')[0][1], 'Renamed')
+        self.assertEqual(len(self.rows('WO_Hardware')), 6)
+        self.assertEqual(len(self.rows('WO_Products')), 6)
+
+    def test_replace_removes_rows_a_work_order_lost(self):
+        self.sync([work_order(1), work_order(2), work_order(3)], replace='BidID')
+        changed = work_order(2, count=2)
+        changed['products'].append({'BidID': 2, 'LinkID': 'L9', 'Qty': 9})
+        self.sync([changed], replace='BidID')
+
+        fresh_client = fake_gspread.FakeClient()
+        fresh = sheets_publisher.SheetsPublisher(fresh_client, 'MicrovellumData')
+        fresh.sync([work_order(1), changed, work_order(3)], 'WorkOrders', ['BidID'],
+                   key_tab_map=KEY_TAB_MAP, tab_keys=TAB_KEYS)
+        for tab in ('WorkOrders', 'WO_Hardware', 'WO_Products'):
+            expected = fresh_client.spreadsheets['MicrovellumData'].sheet(tab).values()[1:]
+            self.assertEqual(sorted(self.rows(tab), key=repr), sorted(expected, key=repr), tab)
+        self.assertEqual(len(self.rows('WO_Hardware')), 8)
+
+        # The index still matches the sheet, so syncing again changes nothing
+        self.client.requests.clear()
+        self.sync([changed], replace='BidID')
+        self.assertEqual(self.client.requests, {})
+
+
+class PublishQueueTest(unittest.TestCase):
+    def test_requeued_work_order_replaces_queued_one(self):
+        client = fake_gspread.FakeClient()
+        publisher = sheets_publisher.SheetsPublisher(client, 'MicrovellumData')
+        with sheets_publisher.PublishQueue(publisher, max_rows=100) as sheets:
+            for data in (work_order(1), work_order(2), work_order(1, name='Saved again')):
+                sheets.sync(data, 'WorkOrders', ['BidID'], key_tab_map=KEY_TAB_MAP, tab_keys=TAB_KEYS,
+                            replace='BidID')
+        spreadsheet = client.spreadsheets['MicrovellumData']
+        self.assertEqual([row[1] for row in spreadsheet.sheet('WorkOrders').values()[1:]], ['Saved again', 'WO 2'])
+        self.assertEqual(len(spreadsheet.sheet('WO_Hardware').values()), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
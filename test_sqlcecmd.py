@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import sqlcecmd
+
+
+FAKE_SQLCECMD = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_sqlcecmd.py')
+
+
+def output(*rows):
+    return ['Name~Comments~Qty', '----~--------~---', *rows, '', f'({len(rows)} rows affected)']
+
+
+class ReadResultTest(unittest.TestCase):
+    def test_inch_marks_are_data(self):
+        header, rows = sqlcecmd.read_result(output('Door~"Tall~1', 'Shelf~plain~2', 'Panel~12"~3', 'Trim~"quoted"~4'), '~')
+        self.assertEqual(header, ('Name', 'Comments', 'Qty'))
+        self.assertEqual(list(rows), [('Door', '"Tall', '1'), ('Shelf', 'plain', '2'),
+                                      ('Panel', '12"', '3'), ('Trim', '"quoted"', '4')])
+
+    def test_embedded_newline(self):
+        _, rows = sqlcecmd.read_result(output('Multi~line one', 'line two~5', 'Shelf~plain~2'), '~')
+        self.assertEqual(list(rows), [('Multi', 'line one\nline two', '5'), ('Shelf', 'plain', '2')])
+
+    def test_quoting_is_opt_in(self):
+        _, rows = sqlcecmd.read_result(output('Door~"a~b"~1'), '~', quote='"')
+        self.assertEqual(list(rows), [('Door', 'a~b', '1')])
+
+    def test_separator_in_value_skips_row(self):
+        with self.assertLogs(level='WARNING'):
+            _, rows = sqlcecmd.read_result(output('Door~a~b~1', 'Shelf~plain~2'), '~')
+            self.assertEqual(list(rows), [('Shelf', 'plain', '2')])
+
+    def test_default_separator(self):
+        # A '~' is just data when the tool separates columns with SEPARATOR
+        lines = [line.replace('~', sqlcecmd.SEPARATOR) for line in output('Door~a|b~1', 'Shelf~plain~2')]
+        _, rows = sqlcecmd.read_result(line.replace('|', '~') for line in lines)
+        self.assertEqual(list(rows), [('Door', 'a~b', '1'), ('Shelf', 'plain', '2')])
+
+
+@unittest.skipIf(os.name == 'nt', "runs fake_sqlcecmd.py as a program")
+class StreamBatchTest(unittest.TestCase):
+    """Batches run through the SqlCeCmd40 stand-in, reading an SQLite file as the SDF"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.sdf_path = os.path.join(self.dir.name, 'MicrovellumWorkOrder.sdf')
+        conn = sqlite3.connect(self.sdf_path)
+        conn.execute('CREATE TABLE Parts (Name TEXT, Comments TEXT, Qty INTEGER)')
+        conn.executemany('INSERT INTO Parts VALUES (?, ?, ?)',
+                         [('Door', 'a~b', 1), ('Shelf', 'two\nlines', 2), ('Panel', None, 3)])
+        conn.execute('CREATE TABLE Hardware (Name TEXT)')
+        conn.commit()
+        conn.close()
+        patcher = mock.patch.object(sqlcecmd, 'SQLCECMD_PATH', FAKE_SQLCECMD)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_several_results(self):
+        lines = sqlcecmd.stream_batch(self.sdf_path, ['SELECT Name, Qty FROM Parts', 'SELECT * FROM Parts WHERE Qty > 1'])
+        first = sqlcecmd.read_dicts(lines)
+        second = sqlcecmd.read_dicts(lines)
+        self.assertEqual(list(lines), [])
+        self.assertEqual(first, [{'Name': 'Door', 'Qty': '1'}, {'Name': 'Shelf', 'Qty': '2'},
+                                 {'Name': 'Panel', 'Qty': '3'}])
+        self.assertEqual(second, [{'Name': 'Shelf', 'Comments': 'two\nlines', 'Qty': '2'},
+                                  {'Name': 'Panel', 'Comments': 'NULL', 'Qty': '3'}])
+
+    def test_empty_result(self):
+        lines = sqlcecmd.stream_batch(self.sdf_path, ['SELECT * FROM Hardware', 'SELECT Qty FROM Parts'])
+        self.assertEqual(sqlcecmd.read_dicts(lines), [])
+        self.assertEqual(sqlcecmd.read_dicts(lines), [{'Qty': '1'}, {'Qty': '2'}, {'Qty': '3'}])
+
+    def test_failing_query(self):
+        lines = sqlcecmd.stream_batch(self.sdf_path, ['SELECT Name FROM Parts', 'SELECT * FROM Missing'])
+        self.assertEqual(len(sqlcecmd.read_dicts(lines)), 3)
+        with self.assertRaisesRegex(Exception, 'Missing'):
+            list(lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
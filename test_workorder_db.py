@@ -0,0 +1,154 @@
+import os
+import json
+import sqlite3
+import tempfile
+import unittest
+import importlib.util
+from unittest import mock
+
+import sqlcecmd
+import workorder_db
+
+
+def load_part_scraper():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Part Scraper.py')
+    spec = importlib.util.spec_from_file_location('part_scraper', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+part_scraper = load_part_scraper()
+
+
+class WorkOrderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        work_order = os.path.join(self.dir.name, 'Work Orders', '(01-02) 12345 - Keller')
+        os.makedirs(work_order)
+        self.sdf_path = os.path.join(work_order, 'MicrovellumWorkOrder.sdf')
+        with open(self.sdf_path, 'wb') as f:
+            f.write(b'sdf')
+        self.sqlite_dir = os.path.join(self.dir.name, 'SQLFiles')
+        self.db_path = workorder_db.sqlite_path_for(self.sdf_path, self.sqlite_dir)
+        os.makedirs(os.path.dirname(self.db_path))
+        sqlite3.connect(self.db_path).close()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def record(self, **changes):
+        stat = os.stat(self.sdf_path)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'version': workorder_db.CONVERTER_VERSION}
+        entry.update(changes)
+        key = os.path.normcase(os.path.abspath(self.sdf_path))
+        path = os.path.join(self.sqlite_dir, workorder_db.MANIFEST_NAME)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'files': {key: entry}}, f)
+        # Make sure the cached manifest is seen to change
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 1000))
+
+
+
+class FreshSqlitePathTest(WorkOrderTestCase):
+    def fresh(self):
+        return workorder_db.fresh_sqlite_path(self.sdf_path, self.sqlite_dir)
+
+    def test_needs_manifest_entry(self):
+        # A newer database alone might still be loading, or have failed to
+        self.assertIsNone(self.fresh())
+        self.record()
+        self.assertEqual(self.fresh(), self.db_path)
+
+    def test_entry_must_match_sdf(self):
+        self.record(size=999)
+        self.assertIsNone(self.fresh())
+        self.record(mtime=1.0)
+        self.assertIsNone(self.fresh())
+        self.record(version=workorder_db.CONVERTER_VERSION - 1)
+        self.assertIsNone(self.fresh())
+
+    def test_database_must_exist(self):
+        self.record()
+        os.remove(self.db_path)
+        self.assertIsNone(self.fresh())
+
+
+class WorkOrderReaderTest(WorkOrderTestCase):
+    def test_database_closed_when_a_query_fails(self):
+        # The converted database has none of the tables the scraper reads
+        self.record()
+        opened = []
+
+        def connect(path):
+            opened.append(sqlite3.connect(path))
+            return opened[-1]
+
+        with mock.patch.object(workorder_db, 'SQLITE_DIR', self.sqlite_dir), \
+                mock.patch.object(workorder_db, 'connect', connect):
+            with self.assertRaises(sqlite3.OperationalError):
+                part_scraper.WorkOrder(self.sdf_path)
+        self.assertEqual(len(opened), 1)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            opened[0].execute('SELECT 1')
+
+    @unittest.skipIf(os.name == 'nt', "runs fake_sqlcecmd.py as a program")
+    def test_same_rows_from_either_source(self):
+        conn = sqlite3.connect(self.db_path)
+        tables = {
+            'WorkOrderBatches': ['Name', 'LinkID', 'WorkOrderID'],
+            'Parts': part_scraper.part_keys,
+            'Subassemblies': ['Name', 'Width'],
+            'PlacedSheets': part_scraper.sheet_keys,
+            'Hardware': part_scraper.hardware_keys,
+            'Edgebanding': part_scraper.edgebanding_keys,
+        }
+        numbers = {'Length', 'Width', 'Thickness', 'Quantity', 'LinFt', 'TotalQuantity', 'Depth', 'Height'}
+        for table, columns in tables.items():
+            conn.execute(f'CREATE TABLE {table} (%s)' % ', '.join(
+                f'{column} {"REAL" if column in numbers else "TEXT"}' for column in columns))
+            for i in range(3):
+                conn.execute(f'INSERT INTO {table} VALUES (%s)' % ', '.join('?' * len(columns)), [
+                    None if i == 2 and column != 'Name' else 12.5 * i if column in numbers else f'{column} {i}'
+                    for column in columns
+                ])
+        conn.execute("UPDATE Subassemblies SET Name = 'Drawer ' || Name")
+        conn.execute("UPDATE PlacedSheets SET LinkIDWorkOrderBatch = 'LinkID 0'")
+        conn.commit()
+        conn.close()
+
+        # The stand-in reads the "SDF" as the SQLite file it is
+        with open(self.db_path, 'rb') as source, open(self.sdf_path, 'wb') as sdf:
+            sdf.write(source.read())
+        self.record()
+
+        fake = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_sqlcecmd.py')
+        with mock.patch.object(workorder_db, 'SQLITE_DIR', self.sqlite_dir):
+            from_db = part_scraper.WorkOrder(self.sdf_path)
+        with mock.patch.object(workorder_db, 'SQLITE_DIR', os.path.join(self.dir.name, 'Nothing')), \
+                mock.patch.object(sqlcecmd, 'SQLCECMD_PATH', fake):
+            from_sdf = part_scraper.WorkOrder(self.sdf_path)
+
+        self.assertEqual(from_db.data['parts'][0]['Length'], '0.0')
+        self.assertEqual(from_db.data['parts'][2]['Length'], 'NULL')
+        self.assertEqual(len(from_db.data['sheets']), 3)
+        self.assertEqual(from_db.data, from_sdf.data)
+
+    def test_failed_batch_runs_queries_alone(self):
+        reader = workorder_db.WorkOrderReader()
+        reader.open(self.sdf_path, sqlite_dir=os.path.join(self.dir.name, 'Nothing'))
+        lines = {'SELECT 1': ['A', '-', '1', '', '(1 row affected)'], 'SELECT 2': ['B', '-', '2', '', '(1 row affected)']}
+
+        def fail(*args):
+            raise Exception("batch failed")
+            yield
+
+        with mock.patch.object(sqlcecmd, 'stream_batch', fail), \
+                mock.patch.object(sqlcecmd, 'stream_query', lambda sdf_path, query, separator: iter(lines[query])):
+            with self.assertLogs(level='WARNING'):
+                results = reader.query_many({'a': 'SELECT 1', 'b': 'SELECT 2'})
+        self.assertEqual(results, {'a': [{'A': '1'}], 'b': [{'B': '2'}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import sqlite3
+import unittest
+
+try:
+    import WorkOrderScraper
+except ImportError:  # gspread and pyodbc
+    WorkOrderScraper = None
+
+
+# A SQLite stand-in for the MicrovellumData tables PurchaseOrders reads. The
+# LinkIDs compare ignoring case, like SQL Server uniqueidentifiers.
+SCHEMA = """
+    CREATE TABLE PurchaseOrders (
+        Comments TEXT, Name TEXT, Type INTEGER, LinkID TEXT COLLATE NOCASE, DateCreated TEXT,
+        LinkIDProject TEXT COLLATE NOCASE, LinkIDUpdatingEmployee TEXT, LinkIDVendor TEXT,
+        ExpectedArrivalDate TEXT, PurchaseOrderNumber TEXT
+    );
+    CREATE TABLE PurchasedMaterial (
+        Cost REAL, DateCreated TEXT, LinkID TEXT COLLATE NOCASE, LinkIDMaterial TEXT, LinkIDPart TEXT,
+        LinkIDProduct TEXT, LinkIDProject TEXT COLLATE NOCASE, LinkIDPurchaseOrder TEXT COLLATE NOCASE,
+        LinkIDSheet TEXT, LinkIDWorkOrder TEXT, Name TEXT, QuantityOrdered REAL, QuantityReceived REAL,
+        Type INTEGER, UnitType INTEGER
+    );
+    CREATE TABLE Projects (LinkID TEXT COLLATE NOCASE, Name TEXT, DateCreated TEXT);
+"""
+
+
+def purchase_order(link_id, number):
+    return (None, f"PO {number}", 1, link_id, '2026-01-01', None, None, None, None, number)
+
+
+def material(link_id, po_link_id, project_link_id=None):
+    return (1.5, '2026-01-02', link_id, None, None, None, project_link_id, po_link_id,
+            None, None, f"Material {link_id}", 2, 0, 1, 1)
+
+
+@unittest.skipIf(WorkOrderScraper is None, "WorkOrderScraper needs gspread and pyodbc")
+class PurchaseOrdersTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.executescript(SCHEMA)
+        self.conn.executemany("INSERT INTO PurchaseOrders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            purchase_order('AAAA-1', 'PO-1'),
+            purchase_order('BBBB-2', 'PO-2'),
+            purchase_order('CCCC-3', 'PO-3'),
+        ])
+        self.conn.executemany("INSERT INTO PurchasedMaterial VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            # Listed ahead of PO-1's first project, so it keeps no BidID
+            material('m1', 'aaaa-1'),
+            material('m2', 'aaaa-1', 'PROJ-1'),
+            material('m3', 'aaaa-1', 'proj-2'),
+            material('m4', 'bbbb-2', 'proj-dup'),
+            material('m5', None, 'proj-1'),
+        ])
+        self.conn.executemany("INSERT INTO Projects VALUES (?, ?, ?)", [
+            ('proj-1', '12345 Keller', '2026-01-01'),
+            ('proj-2', '67890 Other', '2026-01-01'),
+            # A LinkID shared by two projects doesn't identify either
+            ('proj-dup', '11111 First', '2026-01-01'),
+            ('PROJ-DUP', '22222 Second', '2026-01-01'),
+        ])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_everything(self):
+        data = WorkOrderScraper.PurchaseOrders(conn=self.conn).data
+        self.assertEqual(list(data), ['AAAA-1', 'BBBB-2', 'CCCC-3'])
+
+        po = data['AAAA-1']
+        self.assertEqual((po['ProjectID'], po['ProjectName']), (12345, '12345 Keller'))
+        self.assertEqual([(m['LinkID'], m['BidID'], m['BidName']) for m in po['Materials']], [
+            ('m1', None, None),
+            ('m2', 12345, '12345 Keller'),
+            ('m3', 12345, '12345 Keller'),
+        ])
+
+        self.assertIsNone(data['BBBB-2']['ProjectID'])
+        self.assertEqual([m['LinkID'] for m in data['BBBB-2']['Materials']], ['m4'])
+        self.assertEqual(data['CCCC-3']['Materials'], [])
+
+    def test_where(self):
+        data = WorkOrderScraper.PurchaseOrders(conn=self.conn, where="PurchaseOrderNumber In (?, ?)",
+                                               params=('PO-2', 'PO-3')).data
+        self.assertEqual(list(data), ['BBBB-2', 'CCCC-3'])
+        self.assertEqual([m['LinkID'] for m in data['BBBB-2']['Materials']], ['m4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
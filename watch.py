@@ -5,54 +5,117 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from datetime import datetime
 import csv
+import queue
 import threading
 from copy import copy
 
+from debouncer import debounce
+
 
 t1 = time.perf_counter()
 file_path = "processed_files.csv"
-last_row = []
-count = 0
+
+# Events waiting for the writer thread; the observer waits when it's full
+queue_size = 10000
+# Rows are written once this many are waiting, or flush_interval seconds after the first
+flush_rows = 500
+flush_interval = 1.0
+# Repeats of an event on the same path within this many seconds are dropped
+coalesce_window = 1.0
+# 0: nothing, 1: a line per flush, 2: every row written
+verbosity = 1
+# An event is logged once its path has had no event of the same type for
+# debounce_wait seconds, or debounce_max_wait seconds after the first one
+debounce_wait = 0.5
+debounce_max_wait = 5.0
 
 # Delete file_path if it exists
 if os.path.exists(file_path):
     os.remove(file_path)
 
 
-# Python debounce decorator...
-# stolen from: https://gist.github.com/walkermatt/2871026
-def debounce(wait):
-    """ Decorator that will postpone a functions
-        execution until after wait seconds
-        have elapsed since the last time it was invoked. """
-    def decorator(fn):
-        def debounced(*args, **kwargs):
-            def call_it():
-                fn(*args, **kwargs)
-            try:
-                debounced.t.cancel()
-            except AttributeError:
-                pass
-            debounced.t = threading.Timer(wait, call_it)
-            debounced.t.start()
-        return debounced
-    return decorator
+class EventWriter:
+    """Writes events to the CSV log from a background thread, in batches"""
+    _stop = object()
 
+    def __init__(self, path, **kwargs):
+        self.flush_rows = kwargs.get('flush_rows', flush_rows)
+        self.flush_interval = kwargs.get('flush_interval', flush_interval)
+        self.coalesce_window = kwargs.get('coalesce_window', coalesce_window)
+        self.verbosity = kwargs.get('verbosity', verbosity)
+        self.queue = queue.Queue(maxsize=kwargs.get('queue_size', queue_size))
+        self.count = 0
+        self.coalesced = 0
+        self.last_seen = {}  # (dirname, filename) -> (event type, time) of the last row logged
+        self.file = open(path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        self.thread = threading.Thread(target=self.run, name="EventWriter", daemon=True)
+        self.thread.start()
 
-def write_to_file(data):
-    global last_row, count
+    def write(self, data):
+        """Queue a row of [dirname, filename, event type, time elapsed]"""
+        self.queue.put((time.monotonic(), data))
 
-    with open(file_path, "a", newline="") as file:
-        if last_row == data:
+    def close(self):
+        """Write everything still queued, then close the file"""
+        self.queue.put(self._stop)
+        self.thread.join()
+        self.file.close()
+
+    def is_repeat(self, received, data):
+        key = (data[0], data[1])
+        last = self.last_seen.get(key)
+        if last is not None and last[0] == data[2] and received - last[1] < self.coalesce_window:
+            return True
+        self.last_seen[key] = (data[2], received)
+        return False
+
+    def run(self):
+        rows = []
+        deadline = None
+        while True:
+            try:
+                item = self.queue.get(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is self._stop:
+                self.flush(rows)
+                return
+            if item is not None:
+                received, data = item
+                if self.is_repeat(received, data):
+                    self.coalesced += 1
+                else:
+                    self.count += 1
+                    rows.append([str(self.count)] + data)
+                    if deadline is None:
+                        deadline = received + self.flush_interval
+            if rows and (len(rows) >= self.flush_rows or time.monotonic() >= deadline):
+                self.flush(rows)
+                rows = []
+                deadline = None
+
+    def flush(self, rows):
+        if not rows:
             return
-        count += 1
-        print(', '.join([str(count)] + data))
-        writer = csv.writer(file)
-        writer.writerow([str(count)] + data)
-        last_row = data
+        self.writer.writerows(rows)
+        self.file.flush()
+        if self.verbosity >= 2:
+            for row in rows:
+                print(', '.join(row))
+        elif self.verbosity == 1:
+            print(f"Logged {len(rows)} events ({self.count} total, {self.coalesced} repeats dropped)")
+
+        # Paths not seen within the window can't be coalesced any more
+        cutoff = time.monotonic() - self.coalesce_window
+        self.last_seen = {key: last for key, last in self.last_seen.items() if last[1] >= cutoff}
 
 
 class MyHandler(FileSystemEventHandler):
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+
     def on_any_event(self, event):
         if not event.is_directory and file_path not in event.src_path:
             dirname = os.path.dirname(event.src_path)
@@ -60,12 +123,17 @@ class MyHandler(FileSystemEventHandler):
             filename = os.path.basename(event.src_path)
             time_elapsed = f"{math.trunc(time.perf_counter() - t1)}"
             out = [dirname, filename, event.event_type, time_elapsed]
-            write_to_file(out)
+            self.log(event.src_path, out)
+
+    @debounce(debounce_wait, max_wait=debounce_max_wait, key=lambda self, path, out: (path, out[2]))
+    def log(self, path, out):
+        self.writer.write(out)
 
 
 if __name__ == "__main__":
     path = os.getcwd()
-    event_handler = MyHandler()
+    event_writer = EventWriter(file_path)
+    event_handler = MyHandler(event_writer)
     observer = Observer()
     observer.schedule(event_handler, path, recursive=True)
     observer.start()
@@ -78,3 +146,6 @@ if __name__ == "__main__":
         observer.stop()
 
     observer.join()
+    # Nothing more can arrive, so write out whatever is still held or queued
+    MyHandler.log.debouncer.flush()
+    event_writer.close()
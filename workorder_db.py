@@ -0,0 +1,164 @@
+"""Read work-order data from the SQLite databases that SDFtoSQL builds.
+
+The scrapers use these instead of starting SqlCeCmd40.exe for every query
+whenever SDFtoSQL's manifest says a work order's database was converted from
+its SDF as it is now. WorkOrderReader holds the querying the scrapers'
+WorkOrder classes share, whichever of the two a work order is read from.
+"""
+import os
+import json
+import logging
+import sqlite3
+import threading
+import urllib.request
+
+import sqlcecmd
+
+# Shared with SDFtoSQL, so the scrapers always look for what it writes
+from conversion_layout import OUTPUT_DIR as SQLITE_DIR, MANIFEST_NAME, CONVERTER_VERSION, sqlite_path_for, manifest_key
+
+_manifests = {}  # manifest path -> (mtime, files)
+_manifests_lock = threading.Lock()
+
+
+def manifest_files(sqlite_dir=None):
+    """The converted SDFs listed in SDFtoSQL's manifest, read again only when it changes"""
+    path = os.path.join(sqlite_dir or SQLITE_DIR, MANIFEST_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    with _manifests_lock:
+        cached = _manifests.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                files = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            files = {}
+        _manifests[path] = (mtime, files)
+        return files
+
+
+def fresh_sqlite_path(sdf_path, sqlite_dir=None):
+    """Return the converted database for sdf_path if it is complete and current.
+
+    SDFtoSQL only records a work order in its manifest once its database has
+    loaded and been moved into place, so one still loading or whose load
+    failed is never used. The entry has to match the SDF's size and mtime and
+    the current converter version.
+    """
+    sqlite_dir = sqlite_dir or SQLITE_DIR
+    path = sqlite_path_for(sdf_path, sqlite_dir)
+    entry = manifest_files(sqlite_dir).get(manifest_key(sdf_path))
+    if not entry or entry.get('version') != CONVERTER_VERSION:
+        return None
+    try:
+        stat = os.stat(sdf_path)
+        if stat.st_size == entry.get('size') and stat.st_mtime == entry.get('mtime') and os.path.exists(path):
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def connect(path):
+    """Open a converted database read-only"""
+    uri = 'file:' + urllib.request.pathname2url(os.path.abspath(path)) + '?mode=ro'
+    return sqlite3.connect(uri, uri=True)
+
+
+def query_rows(conn, query, keys=None, filter_names=None):
+    """Run a query and return its rows as dicts, like sqlcecmd.read_dicts.
+
+    Values are formatted as SqlCeCmd40 prints them (NULL, 0x... for BLOBs),
+    so a work order's rows come out the same whichever source was read and
+    their Sheets row hashes don't change with it.
+    """
+    cursor = conn.execute(query)
+    headers = [column[0] for column in cursor.description]
+    if keys:
+        wanted = [i for i, header in enumerate(headers) if header in keys]
+    else:
+        wanted = range(len(headers))
+
+    rows = []
+    for values in cursor:
+        d = {}
+        for i in wanted:
+            d[headers[i]] = sqlcecmd.format_value(values[i])
+
+        if filter_names and d.get('Name') not in filter_names:
+            continue
+        rows.append(d)
+    return rows
+
+
+class WorkOrderReader:
+    """Querying shared by the scrapers' WorkOrder classes.
+
+    open() reads the work order from its converted database when that is
+    fresh, otherwise from the SDF through SqlCeCmd40; close() it however the
+    queries end. Subclasses keep their scraped tables in self.data and give
+    the values tag_rows adds to every row from row_tags().
+    """
+    db = None
+
+    def open(self, sdf_path, separator=sqlcecmd.SEPARATOR, sqlite_dir=None):
+        self.full_path = sdf_path
+        self.separator = separator
+        db_path = fresh_sqlite_path(sdf_path, sqlite_dir)
+        self.db = connect(db_path) if db_path else None
+
+    def close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    def query(self, query, keys=None, filter_names=None):
+        if self.db:
+            return query_rows(self.db, query, keys=keys, filter_names=filter_names)
+        return sqlcecmd.read_dicts(self.exec(query), self.separator, keys=keys, filter_names=filter_names)
+
+    def query_many(self, queries):
+        """Run a {name: query} dict and return {name: rows}.
+
+        From an SDF the queries go through one SqlCeCmd40 launch. If that
+        fails they are run again one launch each, so a single bad query fails
+        on its own rather than taking the batch with it.
+        """
+        if self.db:
+            return {name: self.query(query) for name, query in queries.items()}
+        try:
+            lines = sqlcecmd.stream_batch(self.full_path, list(queries.values()), self.separator)
+            results = {name: sqlcecmd.read_dicts(lines, self.separator) for name in queries}
+            for _ in lines:
+                pass  # Let the tool finish so a failure is still reported
+            return results
+        except Exception as e:
+            if len(queries) == 1:
+                raise
+            logging.warning(f"Batch of {len(queries)} queries failed on {self.full_path}, "
+                            f"running them one at a time: {e}")
+        return {name: self.query(query) for name, query in queries.items()}
+
+    def exec(self, query):
+        return sqlcecmd.stream_query(self.full_path, query, self.separator)
+
+    def runQuery(self, table_name, query, keys=None, filter_names=None):
+        rows = self.query(query, keys=keys, filter_names=filter_names)
+        return self.tag_rows(table_name, rows)
+
+    def row_tags(self):
+        return {}
+
+    def tag_rows(self, table_name, rows):
+        tags = self.row_tags()
+        for row in rows:
+            row.update(tags)
+
+        if table_name:
+            self.data[table_name] = rows
+
+        return rows